@@ -86,7 +86,36 @@ AUTH_USER_MODEL = 'core.User'
 # Домен сайта
 SITE_DOMAIN = os.getenv('DJANGO_SITE_DOMAIN', 'anonim-m.online')
 
-# reCAPTCHA настройки (уже настроены выше в зависимости от окружения)
+# reCAPTCHA настройки (ключи уже настроены выше в зависимости от окружения)
+# Политика при недоступности Google: deny - отклонять отправку, allow - пропускать
+RECAPTCHA_FAILURE_POLICY = os.getenv('RECAPTCHA_FAILURE_POLICY', 'deny')
+# Минимальная оценка reCAPTCHA v3 (0.0 - бот, 1.0 - человек)
+RECAPTCHA_SCORE_THRESHOLD = float(os.getenv('RECAPTCHA_SCORE_THRESHOLD', '0.5'))
+# Отложенная проверка: токен проверяет run_notifier перед рассылкой уведомлений
+RECAPTCHA_DEFERRED = os.getenv('RECAPTCHA_DEFERRED', 'False') == 'True'
+
+# Ограничение частоты отправки сообщений в формате "количество/секунды" (пусто - без ограничения)
+SUBMIT_RATE_LIMIT_IP = os.getenv('SUBMIT_RATE_LIMIT_IP', '20/600')
+SUBMIT_RATE_LIMIT_SCHOOL = os.getenv('SUBMIT_RATE_LIMIT_SCHOOL', '60/60')
+# Брать IP клиента из X-Forwarded-For (только за Caddy, который перезаписывает заголовок)
+SUBMIT_TRUST_X_FORWARDED_FOR = os.getenv(
+    'SUBMIT_TRUST_X_FORWARDED_FOR', 'True' if DJANGO_ENV == 'prod' else 'False'
+) == 'True'
+
+# Поиск почти одинаковых сообщений: окно в днях и порог сходства текста (0..1)
+DUPLICATE_WINDOW_DAYS = int(os.getenv('DUPLICATE_WINDOW_DAYS', '14'))
+DUPLICATE_SIMILARITY = float(os.getenv('DUPLICATE_SIMILARITY', '0.8'))
+
+# Конфигурация полнотекстового поиска PostgreSQL (после смены - rebuild_search_index)
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', 'simple')
+# Поиск рассматривает не больше N самых новых совпадений
+SEARCH_MAX_MATCHES = int(os.getenv('SEARCH_MAX_MATCHES', '5000'))
+
+# Архив (команда archive_messages): решенные и спам без изменений дольше N дней
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '500'))
+# Пауза между пачками в секундах: перенос не мешает работе сайта и бота
+ARCHIVE_BATCH_PAUSE = float(os.getenv('ARCHIVE_BATCH_PAUSE', '0.5'))
 
 # Telegram Bot настройки (уже настроены выше в зависимости от окружения)
 
@@ -113,6 +142,7 @@ LOCALE_PATHS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # WhiteNoise middleware
+    'core.db_router.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -157,6 +187,118 @@ DATABASES = {
     }
 }
 
+# SQLite: веб и бот пишут в один файл /data/db.sqlite3. WAL позволяет читать во время
+# записи, busy_timeout ждет снятия блокировки вместо ошибки "database is locked",
+# а IMMEDIATE берет блокировку записи в начале транзакции (в WAL повышение
+# блокировки чтения до записи не ждет busy_timeout и сразу падает)
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '20'))  # секунды
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024)))  # байты
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', '-32000'))  # < 0 - размер в КиБ
+SQLITE_TRANSACTION_MODE = os.getenv('SQLITE_TRANSACTION_MODE', 'IMMEDIATE') or None
+
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['OPTIONS'] = {
+        'timeout': SQLITE_BUSY_TIMEOUT,
+        'transaction_mode': SQLITE_TRANSACTION_MODE,
+        # Выполняется для каждого нового соединения
+        'init_command': ';'.join([
+            f'PRAGMA journal_mode={SQLITE_JOURNAL_MODE}',
+            f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}',
+            f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000}',
+            f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}',
+            f'PRAGMA cache_size={SQLITE_CACHE_SIZE}',
+        ]),
+    }
+
+# Постоянные соединения: не открывать соединение (и не выполнять init_command) на
+# каждый запрос. Перед повторным использованием соединение проверяется, поэтому
+# перезапуск сервера БД не приводит к ошибкам на первом запросе
+DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DJANGO_DB_CONN_MAX_AGE', '60'))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = os.getenv('DJANGO_DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+# Пул соединений для PostgreSQL (требует psycopg 3: pip install "psycopg[binary,pool]").
+# С пулом постоянные соединения отключаются - соединения хранит пул
+DJANGO_DB_POOL = os.getenv('DJANGO_DB_POOL', 'False') == 'True'
+if DJANGO_DB_POOL and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        from django.core.exceptions import ImproperlyConfigured
+        raise ImproperlyConfigured(
+            'DJANGO_DB_POOL=True требует psycopg 3 с пулом: pip install "psycopg[binary,pool]" '
+            '(psycopg2 пул не поддерживает)'
+        )
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DJANGO_DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DJANGO_DB_POOL_MAX_SIZE', '10')),
+            'timeout': int(os.getenv('DJANGO_DB_POOL_TIMEOUT', '10')),
+        },
+    }
+
+# Реплика для чтения (панели сотрудников, статистика, бот, экспорт), см. core.db_router.
+# Включается, если задано DJANGO_DB_REPLICA_NAME или DJANGO_DB_REPLICA_HOST; остальные
+# параметры берутся из основной БД. Локально можно указать копию файла SQLite
+if os.getenv('DJANGO_DB_REPLICA_NAME') or os.getenv('DJANGO_DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DJANGO_DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'USER': os.getenv('DJANGO_DB_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.getenv('DJANGO_DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        'HOST': os.getenv('DJANGO_DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT': os.getenv('DJANGO_DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        # В тестах реплика - зеркало основной БД
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+# Сколько секунд после записи запросы пользователя читают из основной БД (задержка репликации)
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '5'))
+
+
+# Кэш
+# В продакшене используется файловый кэш на общем томе /data, чтобы все воркеры
+# gunicorn и процессы бота видели одни и те же записи и инвалидации.
+# MAX_ENTRIES рассчитан на все ключи: школы (в том числе неизвестные коды),
+# публичные страницы по языкам, статистику. При превышении Django удаляет
+# треть записей случайно, поэтому значение по умолчанию (300) слишком мало.
+CACHE_BACKEND = os.getenv(
+    'DJANGO_CACHE_BACKEND',
+    'django.core.cache.backends.filebased.FileBasedCache' if DJANGO_ENV == 'prod'
+    else 'django.core.cache.backends.locmem.LocMemCache'
+)
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('DJANGO_CACHE_LOCATION', '/data/cache' if DJANGO_ENV == 'prod' else 'anonim-mektep'),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('DJANGO_CACHE_MAX_ENTRIES', '10000'))},
+    },
+    # Счетчики ограничения частоты отправки (core.throttling): по два ключа на
+    # IP и школу. Отдельный каталог, чтобы очистка основного кэша не сбрасывала
+    # лимиты, а поток новых IP не вытеснял кэш школ и страниц.
+    # Файловый кэш перечисляет каталог при каждой записи, поэтому каталог
+    # небольшой: ключи живут два окна (20 минут для IP), а при переполнении
+    # удаляется половина записей (CULL_FREQUENCY=2). Лимиты на файловом кэше
+    # приблизительные (add/incr не атомарны), см. core.throttling
+    'throttle': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'DJANGO_THROTTLE_CACHE_LOCATION', '/data/throttle' if DJANGO_ENV == 'prod' else 'anonim-mektep-throttle'
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('DJANGO_THROTTLE_CACHE_MAX_ENTRIES', '5000')),
+            'CULL_FREQUENCY': int(os.getenv('DJANGO_THROTTLE_CACHE_CULL_FREQUENCY', '2')),
+        },
+    },
+}
+
+# Время жизни кэша статистики сообщений (секунды)
+STATS_CACHE_TIMEOUT = int(os.getenv('STATS_CACHE_TIMEOUT', '30'))
+# Время жизни кэша публичных страниц для анонимных посетителей (секунды)
+PAGE_CACHE_TIMEOUT = int(os.getenv('PAGE_CACHE_TIMEOUT', '300'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -199,6 +341,11 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Экспорт публичных страниц в статические файлы для Caddy (команда export_static_site)
+STATIC_SITE_ROOT = os.getenv('STATIC_SITE_ROOT', '/data/static-site' if DJANGO_ENV == 'prod' else str(BASE_DIR / 'static_site'))
+# Переэкспортировать страницу при сохранении EditablePage
+STATIC_SITE_EXPORT_ON_SAVE = os.getenv('STATIC_SITE_EXPORT_ON_SAVE', 'False') == 'True'
+
 # WhiteNoise настройки для статических файлов
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
@@ -5,7 +5,7 @@ from django.urls import reverse  # добавлено для построени
 import qrcode
 import io
 import base64
-from .models import User, School, EditablePage
+from .models import User, School, EditablePage, NotificationOutbox
 
 @admin.register(EditablePage)
 class EditablePageAdmin(admin.ModelAdmin):
@@ -19,6 +19,14 @@ class EditablePageAdmin(admin.ModelAdmin):
 		return qs.order_by('page', 'language')
 
 
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+	list_display = ('id', 'message', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+	list_filter = ('status',)
+	readonly_fields = ('message', 'delivered_chat_ids', 'last_error', 'created_at', 'sent_at')
+	ordering = ('-created_at',)
+
+
 def get_site_domain():
 	return getattr(settings, 'SITE_DOMAIN', '127.0.0.1:8000')
 
@@ -2,11 +2,23 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_POST
+from django.db.models import F, Sum
+from django.db.models.functions import TruncWeek, TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import timedelta
 from django.contrib.auth import get_user_model
 from .models import School, EditablePage
-from dashboard.models import Message, InternalComment
+from dashboard.models import Message, InternalComment, MessageDailyStat, ArchivedMessage
+from dashboard.search import search_messages
+from dashboard.archive import search_archive
+from dashboard.bulk import apply_bulk_action, parse_message_ids
+from .stats import get_message_stats, count_messages, SCOPE_ALL, SCOPE_GENERAL
+from .pagination import paginate_keyset
+from .db_router import replica_view
 from .admin_forms import SchoolForm, UserForm
 
 User = get_user_model()
@@ -33,21 +45,18 @@ def admin_logout(request):
     logout(request)
     return redirect('admin_login')
 
-def _get_messages_queryset(user):
+def _get_messages_queryset(user, model=Message):
     """Универсальная функция для получения queryset сообщений по роли пользователя"""
     if user.role == 'teacher':
-        return Message.objects.filter(school=user.school)
+        return model.objects.filter(school=user.school)
     else:
-        return Message.objects.all()
+        return model.objects.all()
 
-def _get_message_statistics(messages_queryset):
-    """Универсальная функция для получения статистики сообщений"""
-    return {
-        'new_messages': messages_queryset.filter(status='new').count(),
-        'in_progress': messages_queryset.filter(status='in_progress').count(),
-        'resolved': messages_queryset.filter(status='resolved').count(),
-        'total_messages': messages_queryset.count(),
-    }
+def _get_stats_scope(user):
+    """Область статистики по роли пользователя (см. _get_messages_queryset)"""
+    if user.role == 'teacher':
+        return user.school_id
+    return SCOPE_ALL
 
 def _get_general_school():
     """Получение школы для общих сообщений"""
@@ -62,12 +71,13 @@ def _check_admin_access(user, allowed_roles=None):
     return (user.role in allowed_roles or user.is_superuser)
 
 @login_required
+@replica_view
 def admin_dashboard(request):
     # Получаем queryset сообщений по роли
     messages_queryset = _get_messages_queryset(request.user)
     
     # Основная статистика
-    stats = _get_message_statistics(messages_queryset)
+    stats = get_message_stats(_get_stats_scope(request.user))
     
     # Для районного отдела - отдельная статистика по общим сообщениям
     rayon_stats = None
@@ -76,7 +86,7 @@ def admin_dashboard(request):
         general_school = _get_general_school()
         if general_school:
             general_messages = Message.objects.filter(school=general_school)
-            rayon_stats = _get_message_statistics(general_messages)
+            rayon_stats = get_message_stats(SCOPE_GENERAL)
             recent_general_messages = general_messages.order_by('-created_at')[:5]
     
     # Последние сообщения
@@ -91,49 +101,159 @@ def admin_dashboard(request):
     
     return render(request, 'core/admin_dashboard.html', context)
 
+STATS_PERIODS = {
+    'day': None,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+STATS_BREAKDOWNS = ('school', 'problem_type', 'status')
+
 @login_required
+@replica_view
+def admin_stats_timeseries(request):
+    """Динамика сообщений из дневной статистики (rollup_stats) в формате JSON.
+
+    Параметры: from, to (YYYY-MM-DD, по умолчанию последние 365 дней),
+    period (day, week, month), by (school, problem_type, status),
+    school, problem_type, status - фильтры.
+    """
+    today = timezone.localdate()
+    try:
+        date_to = parse_date(request.GET.get('to', '')) or today
+        date_from = parse_date(request.GET.get('from', '')) or date_to - timedelta(days=365)
+    except ValueError:
+        # Формат верный, но такой даты нет (2024-02-30)
+        return JsonResponse({'success': False, 'error': 'Неверная дата'}, status=400)
+    period = request.GET.get('period', 'day')
+    breakdown = request.GET.get('by', '')
+    if period not in STATS_PERIODS or (breakdown and breakdown not in STATS_BREAKDOWNS):
+        return JsonResponse({'success': False, 'error': 'Неверные параметры'}, status=400)
+    
+    stats = MessageDailyStat.objects.filter(date__gte=date_from, date__lte=date_to)
+    # Учитель видит только статистику своей школы
+    if request.user.role == 'teacher':
+        stats = stats.filter(school=request.user.school)
+    elif request.GET.get('school', '').isdigit():
+        stats = stats.filter(school_id=request.GET['school'])
+    for field in ('problem_type', 'status'):
+        if request.GET.get(field):
+            stats = stats.filter(**{field: request.GET[field]})
+    
+    trunc = STATS_PERIODS[period]
+    stats = stats.annotate(period=trunc('date') if trunc else F('date'))
+    group_by = ['period'] + ([f'{breakdown}_id' if breakdown == 'school' else breakdown] if breakdown else [])
+    rows = stats.values(*group_by).annotate(count=Sum('count')).order_by(*group_by)
+    
+    series = []
+    for row in rows:
+        item = {'period': row['period'].isoformat(), 'count': row['count']}
+        if breakdown:
+            item[breakdown] = row[group_by[1]]
+        series.append(item)
+    
+    return JsonResponse({
+        'success': True,
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'period': period,
+        'by': breakdown or None,
+        'series': series,
+    })
+
+@login_required
+@replica_view
 def admin_messages(request):
+    # Архив (старые решенные и спам) просматривается только по явному запросу
+    archive = request.GET.get('archive') == '1'
+    
     # Получаем queryset сообщений по роли
-    messages_queryset = _get_messages_queryset(request.user)
+    messages_queryset = _get_messages_queryset(request.user, ArchivedMessage if archive else Message)
     
     # Применяем фильтры
     school_filter = request.GET.get('school')
     problem_type = request.GET.get('problem_type')
     status = request.GET.get('status')
     general_only = request.GET.get('general_only')
+    search_query = request.GET.get('q', '').strip()
     
     if school_filter:
         messages_queryset = messages_queryset.filter(school__name__icontains=school_filter)
+    if search_query:
+        search = search_archive if archive else search_messages
+        # Школа учителя повторяется в подзапросе поиска (см. dashboard.search)
+        search_school = request.user.school_id if request.user.role == 'teacher' else None
+        messages_queryset = search(messages_queryset, search_query, school_id=search_school)
     if problem_type:
         messages_queryset = messages_queryset.filter(problem_type=problem_type)
     if status:
         messages_queryset = messages_queryset.filter(status=status)
     
     # Фильтр для сообщений в районный отдел
+    count_school = request.user.school_id if request.user.role == 'teacher' else None
     if general_only == 'true':
         general_school = _get_general_school()
         if general_school:
             messages_queryset = messages_queryset.filter(school=general_school)
+            count_school = general_school.id
     
-    # Сортировка
-    messages_queryset = messages_queryset.order_by('-created_at')
+    # Курсорная пагинация по (created_at, id): без COUNT и OFFSET
+    messages_page = paginate_keyset(request, messages_queryset.select_related('school'))
     
-    # Пагинация
-    paginator = Paginator(messages_queryset, 20)
-    page_number = request.GET.get('page')
-    messages_page = paginator.get_page(page_number)
+    # Приблизительный итог списка из счетчиков (без архива); поиск по тексту и названию школы ими не покрывается
+    total = None
+    if not archive and not school_filter and not search_query and not (request.user.role == 'teacher' and general_only == 'true'):
+        # Учитель без школы не видит сообщений, как и в scoped_messages
+        no_school = request.user.role == 'teacher' and not request.user.school_id
+        total = 0 if no_school else count_messages(count_school, status, problem_type)
     
     context = {
         'messages': messages_page,
+        # Имя messages занято страницей списка: уведомления (итоги массовых действий) отдельно
+        'notices': messages.get_messages(request),
+        'total': total,
+        'archive': archive,
         'problem_type_choices': Message.PROBLEM_TYPE_CHOICES,
         'status_choices': Message.STATUS_CHOICES,
     }
     
     return render(request, 'core/admin_messages.html', context)
 
+@login_required
+@require_POST
+def admin_messages_bulk(request):
+    """Массовые действия из списка: статус, спам и общий комментарий"""
+    next_url = request.POST.get('next', '')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}, require_https=request.is_secure()):
+        next_url = 'admin_messages'
+    
+    try:
+        message_ids = parse_message_ids(request.POST.getlist('message_ids'))
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect(next_url)
+    status = Message.STATUS_SPAM if request.POST.get('action') == 'spam' else request.POST.get('status')
+    comment = request.POST.get('comment', '')
+    if not message_ids or not (status or comment.strip()):
+        messages.error(request, 'Выберите сообщения и действие.')
+        return redirect(next_url)
+    
+    try:
+        updated, commented = apply_bulk_action(request.user, message_ids, status, comment)
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect(next_url)
+    
+    messages.success(request, f'Выбрано: {len(message_ids)}. Статус изменен: {updated}. Комментариев добавлено: {commented}.')
+    return redirect(next_url)
+
 @login_required
 def admin_message_detail(request, message_id):
-    message = get_object_or_404(Message, id=message_id)
+    message = Message.objects.filter(id=message_id).first()
+    if message is None:
+        # Ссылки из уведомлений и бота на сообщение, перенесенное в архив
+        if ArchivedMessage.objects.filter(id=message_id).exists():
+            return redirect('admin_archived_message_detail', message_id=message_id)
+        raise Http404
     
     # Проверка доступа для учителей
     if request.user.role == 'teacher' and message.school != request.user.school:
@@ -167,6 +287,22 @@ def admin_message_detail(request, message_id):
     
     return render(request, 'core/admin_message_detail.html', context)
 
+@login_required
+def admin_archived_message_detail(request, message_id):
+    """Архивное сообщение: только просмотр"""
+    message = get_object_or_404(ArchivedMessage.objects.select_related('school'), id=message_id)
+    
+    if request.user.role == 'teacher' and message.school_id != request.user.school_id:
+        messages.error(request, 'У вас нет доступа к этому сообщению.')
+        return redirect('admin_messages')
+    
+    context = {
+        'message': message,
+        'archived': True,
+    }
+    
+    return render(request, 'core/admin_message_detail.html', context)
+
 @login_required
 def admin_schools(request):
     if not _check_admin_access(request.user):
@@ -0,0 +1,99 @@
+"""Чтение EditablePage для публичных страниц без записи в БД.
+
+Страница ищется по (page, language) в общем кэше Django и только потом в БД.
+Кэша в памяти процесса нет: после правки другие воркеры сразу читают новую
+версию и не заполняют кэш страниц (core.page_cache) устаревшим HTML. Если
+страница не создана, используется текст по умолчанию из DEFAULT_PAGES - в БД
+он не записывается. Записи сбрасываются сигналом при сохранении и удалении
+EditablePage.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from .models import EditablePage
+from .content_render import render_content
+
+CONTENT_CACHE_TIMEOUT = getattr(settings, 'CONTENT_CACHE_TIMEOUT', 60 * 60)
+
+_MISSING = 'missing'
+
+# Тексты по умолчанию для страниц, которые еще не созданы в панели
+DEFAULT_PAGES = {
+    'about': (
+        'О проекте',
+        'Аноним Мектеп — это платформа, созданная для поддержки школьников, учителей и родителей. Здесь вы можете получить консультацию, поделиться проблемой или узнать полезную информацию, сохраняя анонимность.'
+    ),
+    'faq': (
+        'Часто задаваемые вопросы',
+        '<ul><li><strong>Как работает анонимность?</strong> Ваши сообщения не содержат личных данных и не отслеживаются.</li><li><strong>Кто может воспользоваться сервисом?</strong> Любой школьник, учитель или родитель.</li><li><strong>Как получить ответ?</strong> Ответ поступит на указанный вами способ связи или будет опубликован на сайте.</li></ul>'
+    ),
+    'contacts': (
+        'Полезные контакты',
+        '<ul><li>Телефон доверия: <a href="tel:150">150</a></li><li>Министерство образования: <a href="https://edu.gov.kg/">edu.gov.kg</a></li><li>Психологическая помощь: <a href="tel:142">142</a></li><li>Экстренная помощь: <a href="tel:112">112</a></li></ul>'
+    ),
+    'what_to_do': (
+        'Что делать, если...',
+        '<ul><li>...вы столкнулись с буллингом — обратитесь к школьному психологу или напишите нам анонимно.</li><li>...заметили нарушение — сообщите администрации или используйте форму на сайте.</li><li>...нужна срочная помощь — позвоните на горячую линию.</li><li>...вас вымогают деньги — немедленно сообщите родителям и в полицию.</li></ul>'
+    ),
+    'knowledge_base': (
+        _('База знаний'),
+        '<p>База знаний по вопросам безопасности в школах, профилактике буллинга и другим темам.</p>'
+    ),
+    'instructions': (
+        'Инструкции',
+        '<p>Пошаговые инструкции по использованию платформы "Аноним Мектеп".</p>'
+    ),
+    'service_contacts': (
+        'Контакты служб',
+        '<p>Контактная информация служб поддержки, психологов, правоохранительных органов.</p>'
+    ),
+}
+
+
+@dataclass(frozen=True)
+class PageContent:
+    """Содержимое страницы для шаблонов (page.title, page.rendered_html, page.toc)"""
+    page: str
+    language: str
+    title: str
+    rendered_html: str
+    toc: tuple = ()
+    is_default: bool = False
+
+
+def _cache_key(page_key, language):
+    return f'content:html:{page_key}:{language}'
+
+
+def _load(page_key, language):
+    key = _cache_key(page_key, language)
+    data = cache.get(key)
+    if data is None:
+        row = EditablePage.objects.filter(page=page_key, language=language).values('title', 'rendered_html', 'toc').first()
+        data = row or _MISSING
+        cache.set(key, data, CONTENT_CACHE_TIMEOUT)
+    if data == _MISSING:
+        return None
+    return PageContent(page=page_key, language=language, title=data['title'],
+                       rendered_html=data['rendered_html'], toc=tuple(data['toc']))
+
+
+@lru_cache(maxsize=None)
+def _default_page(page_key, language):
+    # Тексты по умолчанию не меняются во время работы: разбор HTML один раз на процесс
+    title, content = DEFAULT_PAGES[page_key]
+    rendered_html, toc = render_content(content)
+    return PageContent(page=page_key, language=language, title=title,
+                       rendered_html=rendered_html, toc=tuple(toc), is_default=True)
+
+
+def get_page(page_key, language):
+    """Страница из кэша, БД или текст по умолчанию (без создания записи)"""
+    return _load(page_key, language) or _default_page(page_key, language)
+
+
+def invalidate_page(page_key, language):
+    """Сброс записи в общем кэше"""
+    cache.delete(_cache_key(page_key, language))
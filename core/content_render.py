@@ -0,0 +1,95 @@
+"""Подготовка HTML страниц EditablePage при сохранении.
+
+Содержимое, введенное в панели, очищается по белому списку тегов и атрибутов
+(beautifulsoup4), ссылки приводятся к единому виду, а из заголовков строится
+оглавление. Результат хранится в EditablePage.rendered_html и EditablePage.toc,
+поэтому при просмотре страницы HTML не разбирается.
+"""
+from urllib.parse import urlsplit
+from bs4 import BeautifulSoup, Comment
+from django.conf import settings
+from django.utils.text import slugify
+
+ALLOWED_TAGS = {
+    'p', 'br', 'hr', 'div', 'span', 'strong', 'b', 'em', 'i', 'u', 's', 'small', 'mark',
+    'ul', 'ol', 'li', 'a', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'code', 'pre',
+    'table', 'thead', 'tbody', 'tr', 'th', 'td', 'img',
+}
+# Теги, которые удаляются вместе с содержимым
+REMOVED_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'form', 'input', 'button', 'textarea', 'select'}
+
+ALLOWED_ATTRIBUTES = {
+    '*': {'class', 'id'},
+    'a': {'href', 'title'},
+    'img': {'src', 'alt', 'title', 'width', 'height'},
+    'th': {'colspan', 'rowspan'},
+    'td': {'colspan', 'rowspan'},
+}
+ALLOWED_SCHEMES = {'', 'http', 'https', 'mailto', 'tel'}
+
+TOC_TAGS = ('h2', 'h3', 'h4')
+
+
+def _sanitize(soup):
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        comment.extract()
+    # Сначала удаляются теги с содержимым: их потомки не должны попасть во второй проход
+    for tag in soup.find_all(REMOVED_TAGS):
+        if not tag.decomposed:
+            tag.decompose()
+    for tag in soup.find_all(True):
+        if tag.name not in ALLOWED_TAGS:
+            tag.unwrap()
+        else:
+            allowed = ALLOWED_ATTRIBUTES['*'] | ALLOWED_ATTRIBUTES.get(tag.name, set())
+            tag.attrs = {name: value for name, value in tag.attrs.items() if name in allowed}
+
+
+def _is_safe_url(url):
+    return urlsplit(url.strip()).scheme.lower() in ALLOWED_SCHEMES
+
+
+def _rewrite_links(soup):
+    """Ссылки на свой домен - относительные, внешние - в новой вкладке"""
+    site_domain = getattr(settings, 'SITE_DOMAIN', '').lower()
+    for tag in soup.find_all(['a', 'img']):
+        attr = 'href' if tag.name == 'a' else 'src'
+        url = tag.get(attr)
+        if url is None:
+            continue
+        if not _is_safe_url(url):
+            del tag[attr]
+            continue
+        parts = urlsplit(url.strip())
+        if parts.scheme in ('http', 'https') and parts.hostname and parts.hostname.lower() in (site_domain, f'www.{site_domain}'):
+            tag[attr] = parts._replace(scheme='', netloc='').geturl() or '/'
+        elif tag.name == 'a' and parts.scheme in ('http', 'https'):
+            tag['target'] = '_blank'
+            tag['rel'] = 'noopener noreferrer'
+
+
+def _build_toc(soup):
+    toc = []
+    used_ids = set()
+    for heading in soup.find_all(TOC_TAGS):
+        title = heading.get_text(' ', strip=True)
+        if not title:
+            continue
+        anchor = heading.get('id') or slugify(title, allow_unicode=True) or 'section'
+        candidate, suffix = anchor, 2
+        while candidate in used_ids:
+            candidate = f'{anchor}-{suffix}'
+            suffix += 1
+        used_ids.add(candidate)
+        heading['id'] = candidate
+        toc.append({'id': candidate, 'title': title, 'level': int(heading.name[1])})
+    return toc
+
+
+def render_content(html):
+    """Очищенный HTML и оглавление [{'id', 'title', 'level'}]"""
+    soup = BeautifulSoup(html or '', 'html.parser')
+    _sanitize(soup)
+    _rewrite_links(soup)
+    toc = _build_toc(soup)
+    return str(soup).strip(), toc
@@ -0,0 +1,127 @@
+"""Чтение со реплики БД для панелей сотрудников, статистики и бота.
+
+Реплика (алиас 'replica' в DATABASES) включается переменными DJANGO_DB_REPLICA_*.
+Чтения идут на нее только внутри replica_reads(): остальной код, включая
+отправку сообщений учениками, работает с основной БД, как раньше.
+
+После первой записи в рамках запроса (обновления бота) все дальнейшие чтения
+идут в основную БД, чтобы сразу видеть свою запись. ReplicaPinMiddleware
+продлевает это на REPLICA_PIN_SECONDS следующих запросов через cookie: страница
+после redirect не покажет данные до изменения из-за задержки репликации.
+Бот так же закрепляет чат за основной БД на REPLICA_PIN_SECONDS (routing_scope(pinned=...)).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+REPLICA_PIN_COOKIE = 'db_primary'
+REPLICA_PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+class RoutingState:
+    """Состояние маршрутизации одного запроса или обновления бота"""
+
+    def __init__(self, pinned=False):
+        self.replica_reads = False
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+def replica_enabled():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def _current_state():
+    state = _state.get()
+    if state is None:
+        # Вне запроса (команды, shell): отдельное состояние на контекст
+        state = RoutingState()
+        _state.set(state)
+    return state
+
+
+@contextmanager
+def routing_scope(pinned=False):
+    """Новая область маршрутизации: запрос, обновление бота или команда"""
+    token = _state.set(RoutingState(pinned))
+    try:
+        yield _state.get()
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def replica_reads():
+    """Чтения внутри блока идут на реплику, пока в области не было записи"""
+    state = _current_state()
+    previous = state.replica_reads
+    state.replica_reads = True
+    try:
+        yield
+    finally:
+        state.replica_reads = previous
+
+
+def replica_view(view):
+    """Декоратор представления только для чтения (ставится под login_required)"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    """Запись всегда в основную БД, чтение - в реплику только внутри replica_reads()"""
+
+    def db_for_read(self, model, **hints):
+        state = _current_state()
+        if (
+            state.replica_reads
+            and not state.pinned
+            and replica_enabled()
+            # Чтение внутри транзакции основной БД относится к записи (update_status и т.п.)
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _current_state()
+        state.pinned = True
+        state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика содержит те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплики приходит репликацией с основной БД
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinMiddleware:
+    """Область маршрутизации на запрос и закрепление за основной БД после записи"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with routing_scope(pinned=request.COOKIES.get(REPLICA_PIN_COOKIE) == '1') as state:
+            response = self.get_response(request)
+        if state.wrote and replica_enabled():
+            response.set_cookie(
+                REPLICA_PIN_COOKIE, '1',
+                max_age=REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+                secure=request.is_secure(),
+            )
+        return response
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.archive import (
+    ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_BATCH_PAUSE, archive_candidates, archive_messages,
+)
+from dashboard.duplicates import DUPLICATE_WINDOW_DAYS, prune_signature_bands
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит решенные сообщения и спам, не менявшиеся N дней, в архив '
+        '(ArchivedMessage) короткими транзакциями с паузой между пачками '
+        'и удаляет полосы сигнатур дубликатов старше окна поиска'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=ARCHIVE_AFTER_DAYS,
+            help=f'Переносить сообщения без изменений дольше N дней (по умолчанию {ARCHIVE_AFTER_DAYS})'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=ARCHIVE_BATCH_SIZE,
+            help=f'Сообщений в одной транзакции (по умолчанию {ARCHIVE_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=ARCHIVE_BATCH_PAUSE,
+            help=f'Пауза между пачками в секундах (по умолчанию {ARCHIVE_BATCH_PAUSE})'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            help='Остановиться после N пачек (остальное перенесет следующий запуск)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, сколько сообщений будет перенесено'
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--days и --batch-size должны быть положительными')
+
+        if options['dry_run']:
+            count = archive_candidates(options['days']).count()
+            self.stdout.write(f'🔍 Будет перенесено в архив: {count} (без изменений дольше {options["days"]} дн.)')
+            return
+
+        def report(batch, moved, total):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'📦 Пачка {batch}: {moved} (всего {total})')
+
+        total = archive_messages(
+            days=options['days'],
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            max_batches=options['max_batches'],
+            on_batch=report,
+        )
+        if total:
+            self.stdout.write(self.style.SUCCESS(f'✅ Перенесено в архив: {total}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✅ Нет сообщений для переноса в архив'))
+
+        pruned = prune_signature_bands()
+        if pruned:
+            self.stdout.write(f'🧹 Удалено полос сигнатур старше {DUPLICATE_WINDOW_DAYS} дн.: {pruned}')
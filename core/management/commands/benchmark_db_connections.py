@@ -0,0 +1,141 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_started, request_finished
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+# Варианты подключения к БД, каждый проверяется в отдельном процессе
+PROFILES = {
+    'no-persist': {'DJANGO_DB_CONN_MAX_AGE': '0', 'DJANGO_DB_POOL': 'False'},
+    'persistent': {'DJANGO_DB_CONN_MAX_AGE': '60', 'DJANGO_DB_POOL': 'False'},
+    'pool': {'DJANGO_DB_POOL': 'True'},
+}
+
+
+def _pool_available():
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает число запросов в секунду без постоянных соединений, с CONN_MAX_AGE '
+        'и с пулом соединений PostgreSQL. Запрос повторяет цикл Django: request_started, '
+        'чтение списка сообщений и счетчиков, request_finished'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=5.0, help='Длительность каждого прогона в секундах (по умолчанию 5)')
+        parser.add_argument('--threads', type=int, default=4, help='Одновременных потоков-"воркеров" (по умолчанию 4)')
+        parser.add_argument(
+            '--profile',
+            choices=list(PROFILES) + ['all'],
+            default='all',
+            help='Какой вариант проверять (по умолчанию все доступные)'
+        )
+        # Служебный параметр дочернего процесса
+        parser.add_argument('--worker', action='store_true', help='(служебный) выполнить прогон в текущем процессе')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.stdout.write(json.dumps(self.run_load(options['duration'], options['threads'])))
+            return
+
+        profiles = list(PROFILES) if options['profile'] == 'all' else [options['profile']]
+        if 'pool' in profiles and (connection.vendor != 'postgresql' or not _pool_available()):
+            if options['profile'] == 'pool':
+                raise CommandError('Пул доступен только для PostgreSQL с установленным psycopg[pool]')
+            self.stdout.write(self.style.WARNING(
+                f'⚠️  Пул пропущен: БД {connection.vendor}, psycopg_pool {"есть" if _pool_available() else "не установлен"}'
+            ))
+            profiles.remove('pool')
+
+        self.stdout.write(f'🏁 БД {connection.vendor}, {options["threads"]} потоков, {options["duration"]:.0f} с на вариант\n')
+        self.stdout.write(f'{"вариант":<12}{"запросов":>10}{"в сек":>10}{"p50, мс":>10}{"p99, мс":>10}{"connect()":>12}')
+        for profile in profiles:
+            env = os.environ.copy()
+            env.update(PROFILES[profile])
+            result = subprocess.run(
+                [
+                    sys.executable, str(settings.BASE_DIR / 'manage.py'), 'benchmark_db_connections', '--worker',
+                    '--duration', str(options['duration']), '--threads', str(options['threads']),
+                ],
+                env=env, capture_output=True, text=True,
+            )
+            lines = [line for line in result.stdout.splitlines() if line.startswith('{')]
+            if result.returncode or not lines:
+                raise CommandError(f'Прогон {profile} завершился с ошибкой:\n{result.stderr[-2000:]}')
+            data = json.loads(lines[-1])
+            self.stdout.write(
+                f'{profile:<12}{data["requests"]:>10}{data["requests"] / options["duration"]:>10.1f}'
+                f'{data["p50"]:>10.2f}{data["p99"]:>10.2f}{data["connections"]:>12}'
+            )
+
+    def run_load(self, duration, threads):
+        from core.stats import count_messages
+        from dashboard.models import Message
+
+        latencies = []
+        opened = []
+        errors = []
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def count_connection(sender, **kwargs):
+            with lock:
+                opened.append(1)
+
+        # Вызовы connect(): без пула это новые соединения, с пулом - выдача соединения из пула
+        connection_created.connect(count_connection, weak=False)
+
+        def worker():
+            local = []
+            try:
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    request_started.send(sender=self.__class__)
+                    try:
+                        list(Message.objects.select_related('school').order_by('-created_at', '-id')[:20])
+                        count_messages()
+                    finally:
+                        request_finished.send(sender=self.__class__)
+                    local.append((time.perf_counter() - started) * 1000)
+            except Exception as exc:
+                # Исключение в потоке иначе теряется, а прогон выглядит как "0 запросов в секунду"
+                with lock:
+                    errors.append(exc)
+            finally:
+                connection.close()
+            with lock:
+                latencies.extend(local)
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+
+        if errors:
+            raise CommandError(
+                f'{len(errors)} из {threads} потоков завершились с ошибкой, результаты не засчитаны: '
+                f'{errors[0]!r}'
+            ) from errors[0]
+        if not latencies:
+            raise CommandError('Не выполнено ни одного запроса, увеличьте --duration')
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'p50': latencies[len(latencies) // 2] if latencies else 0,
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0,
+            'connections': len(opened),
+        }
@@ -0,0 +1,217 @@
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, transaction
+
+# Профиль "до": настройки SQLite по умолчанию (журнал отката, без ожидания блокировки
+# сверх стандартных 5 секунд модуля sqlite3, отложенные транзакции)
+PROFILES = {
+    'before': {
+        'SQLITE_JOURNAL_MODE': 'DELETE',
+        'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_BUSY_TIMEOUT': '5',
+        'SQLITE_MMAP_SIZE': '0',
+        'SQLITE_CACHE_SIZE': '-2000',
+        'SQLITE_TRANSACTION_MODE': '',
+    },
+    # Профиль "после": текущие настройки SQLITE_* из окружения
+    'after': {},
+}
+
+ROLES = ('web', 'bot', 'reader')
+
+
+def _is_lock_error(error):
+    text = str(error).lower()
+    return 'locked' in text or 'busy' in text
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест одновременной записи в SQLite: отправка сообщений (веб), '
+        'смена статусов и комментарии (бот), списки сотрудников. Сравнивает задержки '
+        'и ошибки "database is locked" до и после настроек SQLITE_*'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=10.0, help='Длительность каждого прогона в секундах (по умолчанию 10)')
+        parser.add_argument('--web', type=int, default=4, help='Процессов, отправляющих сообщения (по умолчанию 4)')
+        parser.add_argument('--bot', type=int, default=2, help='Процессов, меняющих статусы и комментирующих (по умолчанию 2)')
+        parser.add_argument('--readers', type=int, default=2, help='Процессов, читающих списки (по умолчанию 2)')
+        parser.add_argument('--seed', type=int, default=2000, help='Сообщений в базе перед прогоном (по умолчанию 2000)')
+        parser.add_argument('--pause', type=float, default=0.005, help='Пауза между операциями процесса в секундах')
+        parser.add_argument(
+            '--profile',
+            choices=['before', 'after', 'both'],
+            default='both',
+            help='Какие настройки проверять (по умолчанию обе для сравнения)'
+        )
+        # Служебные параметры дочерних процессов
+        parser.add_argument('--worker', choices=ROLES + ('seed',), help='(служебный) роль дочернего процесса')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.run_worker(options)
+            return
+
+        profiles = ['before', 'after'] if options['profile'] == 'both' else [options['profile']]
+        with tempfile.TemporaryDirectory(prefix='sqlite-bench-') as tmp:
+            for profile in profiles:
+                results = self.run_profile(profile, os.path.join(tmp, f'{profile}.sqlite3'), options)
+                self.report(profile, results, options['duration'])
+
+    # Родительский процесс
+
+    def _env(self, profile, db_path):
+        env = os.environ.copy()
+        env.update(PROFILES[profile])
+        # Временная база и кэш в памяти процесса: рабочие данные не затрагиваются
+        env.update({
+            'DJANGO_DB_ENGINE': 'django.db.backends.sqlite3',
+            'DJANGO_DB_NAME': db_path,
+            'DJANGO_CACHE_BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'STATIC_SITE_EXPORT_ON_SAVE': 'False',
+        })
+        return env
+
+    def _manage(self, *args):
+        return [sys.executable, str(settings.BASE_DIR / 'manage.py'), *args]
+
+    def run_profile(self, profile, db_path, options):
+        env = self._env(profile, db_path)
+        self.stdout.write(f'⚙️  Профиль {profile}: подготовка базы {db_path}...')
+        subprocess.run(self._manage('migrate', '-v0'), env=env, check=True, stdout=subprocess.DEVNULL)
+        subprocess.run(
+            self._manage('benchmark_sqlite_contention', '--worker', 'seed', '--seed', str(options['seed'])),
+            env=env, check=True, stdout=subprocess.DEVNULL,
+        )
+
+        self.stdout.write(f'🏁 Профиль {profile}: нагрузка {options["duration"]:.0f} с...')
+        processes = []
+        for role in ROLES:
+            for _ in range(options['readers' if role == 'reader' else role]):
+                processes.append((role, subprocess.Popen(
+                    self._manage(
+                        'benchmark_sqlite_contention', '--worker', role,
+                        '--duration', str(options['duration']), '--pause', str(options['pause']),
+                    ),
+                    env=env, stdout=subprocess.PIPE, text=True,
+                )))
+
+        results = {role: {'latencies': [], 'errors': 0} for role in ROLES}
+        for role, process in processes:
+            output, _ = process.communicate()
+            lines = [line for line in output.splitlines() if line.startswith('{')]
+            if process.returncode or not lines:
+                raise CommandError(f'Процесс {role} завершился с ошибкой (код {process.returncode})')
+            data = json.loads(lines[-1])
+            results[role]['latencies'].extend(data['latencies'])
+            results[role]['errors'] += data['errors']
+        return results
+
+    def report(self, profile, results, duration):
+        self.stdout.write(self.style.SUCCESS(f'\n📊 Профиль {profile}'))
+        self.stdout.write(f'{"роль":<8}{"операций":>10}{"в сек":>9}{"p50, мс":>10}{"p99, мс":>10}{"макс, мс":>10}{"locked":>8}')
+        for role, data in results.items():
+            latencies = sorted(data['latencies'])
+            if latencies:
+                p50 = statistics.median(latencies)
+                p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                worst = latencies[-1]
+            else:
+                p50 = p99 = worst = 0
+            line = (
+                f'{role:<8}{len(latencies):>10}{len(latencies) / duration:>9.1f}'
+                f'{p50:>10.1f}{p99:>10.1f}{worst:>10.1f}{data["errors"]:>8}'
+            )
+            self.stdout.write(self.style.ERROR(line) if data['errors'] else line)
+        self.stdout.write('')
+
+    # Дочерние процессы
+
+    def run_worker(self, options):
+        role = options['worker']
+        if role == 'seed':
+            self.seed(options['seed'])
+            return
+
+        from dashboard.models import Message
+        message_ids = list(Message.objects.values_list('id', flat=True))
+        operation = {'web': self.submit_message, 'bot': self.update_message, 'reader': self.read_lists}[role]
+
+        latencies = []
+        errors = 0
+        deadline = time.monotonic() + options['duration']
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                operation(message_ids)
+            except OperationalError as e:
+                if not _is_lock_error(e):
+                    raise
+                errors += 1
+            else:
+                latencies.append((time.perf_counter() - started) * 1000)
+            time.sleep(options['pause'] * random.random() * 2)
+        self.stdout.write(json.dumps({'latencies': latencies, 'errors': errors}))
+
+    def seed(self, count):
+        from core.models import School
+        from dashboard.counters import rebuild_counters
+        from dashboard.models import Message
+        from dashboard.search import rebuild_index
+        schools = School.objects.bulk_create([
+            School(name=f'Школа {i}', unique_code=f'bench{i}') for i in range(10)
+        ])
+        statuses = [status for status, _ in Message.STATUS_CHOICES]
+        problem_types = [problem_type for problem_type, _ in Message.PROBLEM_TYPE_CHOICES]
+        Message.objects.bulk_create([
+            Message(
+                problem=f'Тестовое сообщение номер {i} о проблеме в школе',
+                help='Нужна помощь',
+                school=random.choice(schools + [None]),
+                status=random.choice(statuses),
+                problem_type=random.choice(problem_types),
+            )
+            for i in range(count)
+        ], batch_size=1000)
+        rebuild_counters()
+        rebuild_index()
+
+    def submit_message(self, message_ids):
+        """Путь core.views.send_message: сообщение, дубликаты и очередь уведомлений в одной транзакции"""
+        from core.models import School
+        from core.telegram_utils import enqueue_message_notification
+        from dashboard.duplicates import register_message
+        from dashboard.models import Message
+        with transaction.atomic():
+            message = Message.objects.create(
+                problem=f'Новое сообщение {random.random()} о том, что происходит в классе',
+                help='Прошу разобраться',
+                school=School.objects.order_by('?').first(),
+                problem_type=random.choice(Message.PROBLEM_TYPE_CHOICES)[0],
+            )
+            register_message(message)
+            enqueue_message_notification(message)
+
+    def update_message(self, message_ids):
+        """Действия бота: смена статуса и комментарий"""
+        from dashboard.models import Message, InternalComment
+        message = Message.objects.get(id=random.choice(message_ids))
+        message.status = random.choice(Message.STATUS_CHOICES)[0]
+        message.save()
+        InternalComment.objects.create(message=message, text='Комментарий из бота')
+
+    def read_lists(self, message_ids):
+        """Список сотрудников и статистика"""
+        from core.stats import count_messages
+        from dashboard.models import Message
+        list(Message.objects.select_related('school').order_by('-created_at', '-id')[:20])
+        count_messages()
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from core.db_router import replica_reads
+from core.static_export import export_site, verify_site, STATIC_SITE_ROOT, brotli
+
+
+class Command(BaseCommand):
+    help = 'Экспортирует публичные страницы во все языки в статические файлы для Caddy'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default=str(STATIC_SITE_ROOT),
+            help=f'Каталог для файлов (по умолчанию {STATIC_SITE_ROOT})'
+        )
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Не записывать файлы, а сравнить экспорт со свежим рендером'
+        )
+
+    def handle(self, *args, **options):
+        root = options['output']
+
+        if options['verify']:
+            mismatches = verify_site(root)
+            if not mismatches:
+                self.stdout.write(self.style.SUCCESS('✅ Экспортированные страницы совпадают с рендером'))
+                return
+            for path, diff in mismatches.items():
+                self.stdout.write(self.style.WARNING(f'⚠️  Отличается: {path}'))
+                self.stdout.write(diff or '   (файл отсутствует)')
+            self.stdout.write(self.style.ERROR(f'❌ Устаревших страниц: {len(mismatches)}'))
+            raise SystemExit(1)
+
+        # Полный экспорт читает с реплики; экспорт после сохранения страницы (core.signals)
+        # идет из основной БД, где запись уже видна
+        with replica_reads():
+            written = export_site(root)
+        self.stdout.write(self.style.SUCCESS(f'✅ Экспортировано страниц: {len(written)} в {root}'))
+        if brotli is None:
+            self.stdout.write(self.style.WARNING('⚠️  Пакет brotli не установлен, созданы только .gz'))
@@ -0,0 +1,39 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from dashboard.duplicates import register_message, DUPLICATE_WINDOW_DAYS
+from dashboard.models import Message
+
+
+class Command(BaseCommand):
+    help = 'Строит сигнатуры для поиска дубликатов по уже существующим сообщениям'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=DUPLICATE_WINDOW_DAYS,
+            help=f'Обработать сообщения за последние N дней (по умолчанию {DUPLICATE_WINDOW_DAYS})'
+        )
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        # В порядке создания: более раннее сообщение становится исходным
+        messages = (
+            Message.objects.filter(created_at__gte=since, duplicate_of__isnull=True, signature_bands__isnull=True)
+            .only('id', 'problem', 'school_id', 'created_at')
+            .order_by('created_at', 'id')
+        )
+
+        indexed = duplicates = 0
+        for message in messages.iterator(chunk_size=500):
+            with transaction.atomic():
+                if register_message(message) is None:
+                    indexed += 1
+                else:
+                    duplicates += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Проиндексировано: {indexed}, найдено дубликатов: {duplicates}'
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from dashboard.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики сообщений (MessageCounter) по таблице Message'
+
+    def handle(self, *args, **options):
+        fixed = rebuild_counters()
+        if fixed:
+            self.stdout.write(self.style.WARNING(f'⚠️  Исправлено счетчиков: {fixed}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✅ Счетчики сообщений совпадают с данными'))
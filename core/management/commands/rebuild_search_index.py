@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from dashboard.search import is_supported, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс сообщений (после загрузки данных или смены SEARCH_CONFIG)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество сообщений, читаемых за один запрос (по умолчанию 1000)'
+        )
+
+    def handle(self, *args, **options):
+        if not is_supported():
+            self.stdout.write(self.style.WARNING(f'⚠️  Полнотекстовый индекс для {connection.vendor} не поддерживается, поиск работает через LIKE'))
+            return
+        total = rebuild_index(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Проиндексировано сообщений: {total}'))
@@ -0,0 +1,68 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from core.recaptcha_utils import RECAPTCHA_SCORE_THRESHOLD
+from dashboard.models import Message
+from dashboard.counters import update_status
+
+
+class Command(BaseCommand):
+    help = 'Переводит новые сообщения с низкой оценкой reCAPTCHA в статус "Спам" (один UPDATE на пакет)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=RECAPTCHA_SCORE_THRESHOLD,
+            help=f'Сообщения с оценкой ниже порога считаются спамом (по умолчанию {RECAPTCHA_SCORE_THRESHOLD})'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Диапазон ID, обрабатываемый одним UPDATE (по умолчанию 1000)'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Обрабатывать только сообщения за последние N дней'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, сколько сообщений будет переклассифицировано'
+        )
+
+    def handle(self, *args, **options):
+        threshold = options['threshold']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть положительным')
+
+        # Только необработанные сообщения с сохраненной оценкой: решения сотрудников не трогаем
+        candidates = Message.objects.filter(
+            status=Message.STATUS_NEW,
+            recaptcha_score__lt=threshold,
+        )
+        if options['days']:
+            candidates = candidates.filter(created_at__gte=timezone.now() - timedelta(days=options['days']))
+
+        if options['dry_run']:
+            self.stdout.write(f'🔍 Будет помечено как спам: {candidates.count()} (порог {threshold})')
+            return
+
+        bounds = candidates.aggregate(min_id=Min('id'), max_id=Max('id'))
+        if bounds['min_id'] is None:
+            self.stdout.write(self.style.SUCCESS(f'✅ Нет сообщений с оценкой ниже {threshold}'))
+            return
+
+        total = 0
+        for start in range(bounds['min_id'], bounds['max_id'] + 1, batch_size):
+            total += update_status(
+                candidates.filter(id__gte=start, id__lt=start + batch_size),
+                Message.STATUS_SPAM,
+                updated_at=timezone.now(),
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Помечено как спам: {total} (порог {threshold})'))
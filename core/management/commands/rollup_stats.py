@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from dashboard.rollup import run_rollup
+
+
+class Command(BaseCommand):
+    help = 'Обновляет дневную статистику сообщений (только дни, измененные с прошлого запуска)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать все дни'
+        )
+
+    def handle(self, *args, **options):
+        days = run_rollup(full=options['full'])
+        if days:
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ Пересчитано дней: {len(days)} ({days[0]} — {days[-1]})'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('✅ Изменений с прошлого запуска нет'))
@@ -0,0 +1,96 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import close_old_connections
+from core.telegram_utils import process_notification_outbox, OUTBOX_BATCH_SIZE
+from core.telegram_ratelimit import rate_limiter
+from core.telegram_client import get_telegram_client
+import time
+import signal
+
+
+class Command(BaseCommand):
+    help = 'Доставка уведомлений о новых сообщениях из очереди (NotificationOutbox) в Telegram'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.running = True
+
+        # Обработчик сигнала для корректного завершения
+        signal.signal(signal.SIGINT, self.signal_handler)
+        signal.signal(signal.SIGTERM, self.signal_handler)
+
+    def signal_handler(self, signum, frame):
+        """Обработчик сигналов для корректного завершения"""
+        self.stdout.write(self.style.WARNING('\n🛑 Получен сигнал завершения. Останавливаем рассылку...'))
+        self.running = False
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Пауза между проверками очереди, если она пуста (по умолчанию 2 секунды)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=OUTBOX_BATCH_SIZE,
+            help=f'Количество записей за один проход (по умолчанию {OUTBOX_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Обработать готовые записи один раз и завершиться'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        batch_size = options['batch_size']
+
+        if not settings.TELEGRAM_BOT_TOKEN:
+            self.stdout.write(
+                self.style.ERROR('❌ TELEGRAM_BOT_TOKEN не настроен в settings.py')
+            )
+            return
+
+        self.stdout.write(self.style.SUCCESS('📬 Запуск доставки уведомлений из очереди...'))
+
+        while self.running:
+            try:
+                stats = process_notification_outbox(batch_size)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'❌ Ошибка обработки очереди: {e}'))
+                stats = {'processed': 0}
+            finally:
+                # Долгоживущий процесс: не держим устаревшие соединения с БД
+                close_old_connections()
+
+            if stats['processed']:
+                self.stdout.write(
+                    f"📨 Обработано: {stats['processed']} "
+                    f"(отправлено: {stats['sent']}, повтор: {stats['retry']}, ошибок: {stats['failed']}, "
+                    f"отклонено reCAPTCHA: {stats['skipped']})"
+                )
+                latency = get_telegram_client().get_stats().get('sendMessage')
+                if latency:
+                    self.stdout.write(
+                        f"⏱️  sendMessage: {latency['calls']} вызовов, "
+                        f"среднее {latency['avg_ms']:.0f} мс, максимум {latency['max_ms']:.0f} мс"
+                    )
+                limiter = rate_limiter.get_stats()
+                if limiter['throttled'] or limiter['rate_limited'] or limiter['deferred']:
+                    self.stdout.write(
+                        f"🚦 Лимиты Telegram: ожиданий {limiter['throttled']} "
+                        f"({limiter['throttled_seconds']:.1f} с), очередь до {limiter['max_waiting']}, "
+                        f"ответов 429: {limiter['rate_limited']}, повторов: {limiter['retries']}, "
+                        f"отложено: {limiter['deferred']}"
+                    )
+
+            if options['once']:
+                break
+
+            # Если очередь разобрана не полностью, сразу берем следующую порцию
+            if stats['processed'] < batch_size:
+                time.sleep(interval)
+
+        self.stdout.write(self.style.SUCCESS('👋 Доставка уведомлений остановлена'))
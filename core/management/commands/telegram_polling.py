@@ -1,6 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db import close_old_connections
 from core.telegram_bot import bot_handler
+from core.telegram_client import get_telegram_client
 import requests
 import json
 import time
@@ -67,15 +69,22 @@ class Command(BaseCommand):
                             self.style.SUCCESS(f'📨 Получено {len(updates)} обновлений')
                         )
                         
-                        for update in updates:
-                            try:
-                                # Обрабатываем каждое обновление
-                                bot_handler.process_update(update)
-                                self.stdout.write(f'✅ Обработано обновление {update.get("update_id", "?")}')
-                            except Exception as e:
-                                self.stdout.write(
-                                    self.style.ERROR(f'❌ Ошибка обработки обновления: {e}')
-                                )
+                        try:
+                            for update in updates:
+                                # Как request_started в Django: соединение, устаревшее за время
+                                # long polling или разорванное перезапуском сервера БД, закрывается
+                                # и открывается заново при первом запросе обновления
+                                close_old_connections()
+                                try:
+                                    # Обрабатываем каждое обновление
+                                    bot_handler.process_update(update)
+                                    self.stdout.write(f'✅ Обработано обновление {update.get("update_id", "?")}')
+                                except Exception as e:
+                                    self.stdout.write(
+                                        self.style.ERROR(f'❌ Ошибка обработки обновления: {e}')
+                                    )
+                        finally:
+                            close_old_connections()
                     
                 except KeyboardInterrupt:
                     break
@@ -93,7 +102,6 @@ class Command(BaseCommand):
     def get_updates(self, timeout, limit):
         """Получение обновлений от Telegram"""
         try:
-            url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/getUpdates"
             params = {
                 'offset': self.last_update_id + 1,
                 'limit': limit,
@@ -101,7 +109,8 @@ class Command(BaseCommand):
                 'allowed_updates': ['message', 'callback_query']
             }
             
-            response = requests.get(url, params=params, timeout=timeout + 10)
+            # Long polling через общий пул соединений: соединение переиспользуется между запросами
+            response = get_telegram_client().get('getUpdates', params, read_timeout=timeout + 10)
             response.raise_for_status()
             
             result = response.json()
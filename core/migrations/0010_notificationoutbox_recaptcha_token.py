@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='recaptcha_token',
+            field=models.TextField(blank=True, verbose_name='Токен reCAPTCHA для отложенной проверки'),
+        ),
+        migrations.AlterField(
+            model_name='notificationoutbox',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Ожидает отправки'), ('sent', 'Отправлено'), ('failed', 'Ошибка'), ('skipped', 'Отменено')], default='pending', max_length=16, verbose_name='Статус'),
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:48
+
+from urllib.parse import urlsplit
+from bs4 import BeautifulSoup, Comment
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.text import slugify
+
+# Копия core.content_render на момент миграции: последующие изменения правил
+# очистки не должны менять результат уже примененной миграции. Страницы,
+# сохраненные позже, готовит актуальный render_content
+
+ALLOWED_TAGS = {
+    'p', 'br', 'hr', 'div', 'span', 'strong', 'b', 'em', 'i', 'u', 's', 'small', 'mark',
+    'ul', 'ol', 'li', 'a', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'code', 'pre',
+    'table', 'thead', 'tbody', 'tr', 'th', 'td', 'img',
+}
+REMOVED_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'form', 'input', 'button', 'textarea', 'select'}
+ALLOWED_ATTRIBUTES = {
+    '*': {'class', 'id'},
+    'a': {'href', 'title'},
+    'img': {'src', 'alt', 'title', 'width', 'height'},
+    'th': {'colspan', 'rowspan'},
+    'td': {'colspan', 'rowspan'},
+}
+ALLOWED_SCHEMES = {'', 'http', 'https', 'mailto', 'tel'}
+TOC_TAGS = ('h2', 'h3', 'h4')
+
+
+def render_content(html):
+    soup = BeautifulSoup(html or '', 'html.parser')
+
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        comment.extract()
+    for tag in soup.find_all(REMOVED_TAGS):
+        if not tag.decomposed:
+            tag.decompose()
+    for tag in soup.find_all(True):
+        if tag.name not in ALLOWED_TAGS:
+            tag.unwrap()
+        else:
+            allowed = ALLOWED_ATTRIBUTES['*'] | ALLOWED_ATTRIBUTES.get(tag.name, set())
+            tag.attrs = {name: value for name, value in tag.attrs.items() if name in allowed}
+
+    site_domain = getattr(settings, 'SITE_DOMAIN', '').lower()
+    for tag in soup.find_all(['a', 'img']):
+        attr = 'href' if tag.name == 'a' else 'src'
+        url = tag.get(attr)
+        if url is None:
+            continue
+        parts = urlsplit(url.strip())
+        if parts.scheme.lower() not in ALLOWED_SCHEMES:
+            del tag[attr]
+            continue
+        if parts.scheme in ('http', 'https') and parts.hostname and parts.hostname.lower() in (site_domain, f'www.{site_domain}'):
+            tag[attr] = parts._replace(scheme='', netloc='').geturl() or '/'
+        elif tag.name == 'a' and parts.scheme in ('http', 'https'):
+            tag['target'] = '_blank'
+            tag['rel'] = 'noopener noreferrer'
+
+    toc = []
+    used_ids = set()
+    for heading in soup.find_all(TOC_TAGS):
+        title = heading.get_text(' ', strip=True)
+        if not title:
+            continue
+        anchor = heading.get('id') or slugify(title, allow_unicode=True) or 'section'
+        candidate, suffix = anchor, 2
+        while candidate in used_ids:
+            candidate = f'{anchor}-{suffix}'
+            suffix += 1
+        used_ids.add(candidate)
+        heading['id'] = candidate
+        toc.append({'id': candidate, 'title': title, 'level': int(heading.name[1])})
+    return str(soup).strip(), toc
+
+
+def render_pages(apps, schema_editor):
+    EditablePage = apps.get_model('core', 'EditablePage')
+    for page in EditablePage.objects.all():
+        page.rendered_html, page.toc = render_content(page.content)
+        page.save(update_fields=['rendered_html', 'toc'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_notificationoutbox_recaptcha_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='editablepage',
+            name='rendered_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='Подготовленный HTML'),
+        ),
+        migrations.AddField(
+            model_name='editablepage',
+            name='toc',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Оглавление'),
+        ),
+        migrations.RunPython(render_pages, migrations.RunPython.noop),
+    ]
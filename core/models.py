@@ -1,7 +1,9 @@
 
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 import uuid
+from .content_render import render_content
 
 
 class EditablePage(models.Model):
@@ -24,6 +26,9 @@ class EditablePage(models.Model):
     language = models.CharField(max_length=2, choices=LANGUAGE_CHOICES, default='ru', verbose_name='Язык')
     title = models.CharField(max_length=255, verbose_name='Заголовок')
     content = models.TextField(verbose_name='Содержание')
+    # Очищенный HTML и оглавление, вычисляются при сохранении (см. core.content_render)
+    rendered_html = models.TextField(blank=True, editable=False, verbose_name='Подготовленный HTML')
+    toc = models.JSONField(default=list, blank=True, editable=False, verbose_name='Оглавление')
 
     class Meta:
         unique_together = ['page', 'language']
@@ -33,6 +38,13 @@ class EditablePage(models.Model):
     def __str__(self):
         return f"{self.get_page_display()} ({self.get_language_display()})"
 
+    def save(self, *args, **kwargs):
+        self.rendered_html, self.toc = render_content(self.content)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'rendered_html', 'toc'}
+        super().save(*args, **kwargs)
+
 def generate_unique_code():
     """Генерация уникального 12-символьного кода для школы"""
     return uuid.uuid4().hex[:12]
@@ -106,3 +118,46 @@ class User(AbstractUser):
 
     def __str__(self):
         return f"{self.username} ({self.get_role_display()})"
+
+class NotificationOutbox(models.Model):
+    """Очередь уведомлений о новых сообщениях (transactional outbox)
+
+    Запись создается в той же транзакции, что и сообщение, а доставку в Telegram
+    выполняет отдельный процесс ``run_notifier``.
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_SKIPPED = 'skipped'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ожидает отправки'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_FAILED, 'Ошибка'),
+        (STATUS_SKIPPED, 'Отменено'),
+    ]
+
+    message = models.ForeignKey(
+        'dashboard.Message',
+        on_delete=models.CASCADE,
+        related_name='notifications',
+        verbose_name='Сообщение'
+    )
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='Статус')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    recaptcha_token = models.TextField(blank=True, verbose_name='Токен reCAPTCHA для отложенной проверки')
+    delivered_chat_ids = models.JSONField(default=list, blank=True, verbose_name='Доставлено в чаты')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Отправлено')
+
+    class Meta:
+        verbose_name = 'Уведомление в очереди'
+        verbose_name_plural = 'Очередь уведомлений'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='core_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Уведомление #{self.id} о сообщении #{self.message_id} ({self.get_status_display()})"
@@ -0,0 +1,69 @@
+"""Кэш публичных страниц для анонимных посетителей.
+
+Страница хранится в общем кэше отдельно для каждого языка. CSRF-токен формы
+переключения языка заменяется в сохраненной копии заполнителем и при выдаче
+подставляется заново через get_token(), поэтому кэшированные формы остаются
+рабочими. Запросы с сессией (сотрудники) или flash-сообщениями кэш не
+используют. Записи сбрасываются сигналами при изменении Message и EditablePage.
+"""
+import re
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils import translation
+
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 5 * 60)
+
+# Кэшируемые страницы: главная и страницы EditablePage
+INDEX_PAGE = 'index'
+CONTENT_PAGES = ['about', 'faq', 'service_contacts', 'instructions', 'knowledge_base']
+
+CSRF_PLACEHOLDER = '__CSRF_TOKEN__'
+CSRF_INPUT_RE = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+MESSAGES_COOKIE = 'messages'
+
+
+def _cache_key(page_key, language):
+    return f'page:{page_key}:{language}'
+
+
+def _is_cacheable(request):
+    if request.method not in ('GET', 'HEAD') or request.GET:
+        return False
+    # Сессия есть у вошедших сотрудников, flash-сообщения индивидуальны
+    return settings.SESSION_COOKIE_NAME not in request.COOKIES and MESSAGES_COOKIE not in request.COOKIES
+
+
+def cache_public_page(page_key):
+    """Декоратор представления публичной страницы"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _is_cacheable(request):
+                return view(request, *args, **kwargs)
+
+            key = _cache_key(page_key, translation.get_language())
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content.replace(CSRF_PLACEHOLDER, get_token(request)), content_type=content_type)
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                # Маскированный токен уникален для каждого вывода, поэтому ищем само поле формы
+                content = CSRF_INPUT_RE.sub(rf'\g<1>{CSRF_PLACEHOLDER}\g<2>', response.content.decode(response.charset))
+                cache.set(key, (content, response['Content-Type']), PAGE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
+
+
+def invalidate_pages(page_keys):
+    """Сброс кэша страниц для всех языков"""
+    cache.delete_many([
+        _cache_key(page_key, language)
+        for page_key in page_keys
+        for language, _ in settings.LANGUAGES
+    ])
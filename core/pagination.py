@@ -0,0 +1,123 @@
+"""Курсорная (keyset) пагинация списков сообщений.
+
+Страница выбирается условием по (created_at, id) от последней показанной
+записи вместо COUNT и OFFSET, поэтому любая страница читается по составному
+индексу так же быстро, как первая. Курсор подписан SECRET_KEY и не
+раскрывает внутренние значения для подделки.
+"""
+from datetime import datetime
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+
+MESSAGES_PER_PAGE = getattr(settings, 'MESSAGES_PER_PAGE', 20)
+
+CURSOR_PARAM = 'cursor'
+CURSOR_SALT = 'core.pagination.cursor'
+
+FORWARD = 'n'
+BACKWARD = 'p'
+
+
+def encode_cursor(obj, direction):
+    return signing.dumps(
+        {'t': obj.created_at.isoformat(), 'i': obj.pk, 'd': direction},
+        salt=CURSOR_SALT,
+        compress=True,
+    )
+
+
+def decode_cursor(token):
+    """(created_at, id, направление) или None для пустого или поддельного курсора"""
+    if not token:
+        return None
+    try:
+        payload = signing.loads(token, salt=CURSOR_SALT)
+        cursor = (datetime.fromisoformat(payload['t']), int(payload['i']), payload['d'])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+    if cursor[2] not in (FORWARD, BACKWARD):
+        return None
+    return cursor
+
+
+class KeysetPage:
+    """Страница списка с курсорами соседних страниц"""
+
+    def __init__(self, object_list, next_cursor, prev_cursor, base_query):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.base_query = base_query
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def _url(self, cursor):
+        query = self.base_query.copy()
+        query[CURSOR_PARAM] = cursor
+        return f'?{query.urlencode()}'
+
+    @property
+    def next_url(self):
+        return self._url(self.next_cursor) if self.next_cursor else None
+
+    @property
+    def previous_url(self):
+        return self._url(self.prev_cursor) if self.prev_cursor else None
+
+    @property
+    def first_url(self):
+        query = self.base_query.urlencode()
+        return f'?{query}' if query else '?'
+
+
+def paginate_keyset(request, queryset, per_page=MESSAGES_PER_PAGE):
+    """Страница queryset от курсора из request.GET, новые записи первыми.
+
+    Остальные параметры запроса (фильтры) сохраняются в ссылках на соседние
+    страницы. Неверный курсор открывает первую страницу.
+    """
+    base_query = request.GET.copy()
+    base_query.pop(CURSOR_PARAM, None)
+    base_query.pop('page', None)
+
+    cursor = decode_cursor(request.GET.get(CURSOR_PARAM))
+    if cursor is None:
+        rows = list(queryset.order_by('-created_at', '-id')[:per_page + 1])
+        has_more, has_before = len(rows) > per_page, False
+        rows = rows[:per_page]
+    else:
+        created_at, pk, direction = cursor
+        if direction == FORWARD:
+            # Условие на created_at отдельно от OR, чтобы оно стало диапазоном по индексу
+            rows = list(
+                queryset.filter(created_at__lte=created_at)
+                .filter(Q(created_at__lt=created_at) | Q(id__lt=pk))
+                .order_by('-created_at', '-id')[:per_page + 1]
+            )
+            has_more, has_before = len(rows) > per_page, True
+            rows = rows[:per_page]
+        else:
+            rows = list(
+                queryset.filter(created_at__gte=created_at)
+                .filter(Q(created_at__gt=created_at) | Q(id__gt=pk))
+                .order_by('created_at', 'id')[:per_page + 1]
+            )
+            has_more, has_before = True, len(rows) > per_page
+            rows = rows[:per_page][::-1]
+
+    next_cursor = encode_cursor(rows[-1], FORWARD) if rows and has_more else None
+    prev_cursor = encode_cursor(rows[0], BACKWARD) if rows and has_before else None
+    return KeysetPage(rows, next_cursor, prev_cursor, base_query)
@@ -1,33 +1,150 @@
+import logging
+import threading
+import time
 import requests
 from django.conf import settings
 
-def verify_recaptcha(token, remote_ip=None):
-    """
-    Проверяет токен reCAPTCHA v3
-    """
+logger = logging.getLogger(__name__)
+
+RECAPTCHA_VERIFY_URL = 'https://www.google.com/recaptcha/api/siteverify'
+RECAPTCHA_SCORE_THRESHOLD = getattr(settings, 'RECAPTCHA_SCORE_THRESHOLD', 0.5)
+
+# Короткие таймауты: медленный Google не должен занимать воркеры gunicorn
+RECAPTCHA_CONNECT_TIMEOUT = getattr(settings, 'RECAPTCHA_CONNECT_TIMEOUT', 1)
+RECAPTCHA_READ_TIMEOUT = getattr(settings, 'RECAPTCHA_READ_TIMEOUT', 2)
+
+# Решение при недоступности Google (ошибка, таймаут, открытый предохранитель):
+# 'deny' - отклонить отправку, 'allow' - пропустить сообщение
+RECAPTCHA_FAILURE_POLICY = getattr(settings, 'RECAPTCHA_FAILURE_POLICY', 'deny')
+
+# Предохранитель: после N ошибок подряд не обращаемся к Google COOLDOWN секунд
+RECAPTCHA_BREAKER_THRESHOLD = getattr(settings, 'RECAPTCHA_BREAKER_THRESHOLD', 5)
+RECAPTCHA_BREAKER_COOLDOWN = getattr(settings, 'RECAPTCHA_BREAKER_COOLDOWN', 60)
+
+# Отложенная проверка: сообщение сохраняется без обращения к Google,
+# токен проверяет run_notifier до рассылки уведомлений
+RECAPTCHA_DEFERRED = getattr(settings, 'RECAPTCHA_DEFERRED', False)
+
+
+class CircuitBreaker:
+    """Простой предохранитель: closed -> open после серии ошибок -> half-open после паузы"""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            # half-open: после паузы пропускаем пробный запрос
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold and self.opened_at is None:
+                logger.warning(f"reCAPTCHA недоступна ({self.failures} ошибок подряд), проверки приостановлены на {self.cooldown} с")
+                self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+
+breaker = CircuitBreaker(RECAPTCHA_BREAKER_THRESHOLD, RECAPTCHA_BREAKER_COOLDOWN)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session():
+    """Общая для процесса сессия с keep-alive соединением к Google"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = requests.Session()
+    return _session
+
+
+def _is_verification_disabled():
     if not settings.RECAPTCHA_PRIVATE_KEY:
         # В режиме разработки без ключей пропускаем проверку
         return True
-    
     # Для тестовых ключей Google (начинающихся с 6LeIxAcTAAAA) пропускаем проверку
-    if settings.RECAPTCHA_PRIVATE_KEY.startswith('6LeIxAcTAAAA'):
-        return True
-    
+    return settings.RECAPTCHA_PRIVATE_KEY.startswith('6LeIxAcTAAAA')
+
+
+def check_recaptcha(token, remote_ip=None):
+    """
+    Проверяет токен reCAPTCHA v3 и возвращает подробный результат:
+    passed - итоговое решение, available - удалось ли получить ответ Google,
+    expired - токен истек или уже проверялся (timeout-or-duplicate),
+    score, action и latency_ms - данные ответа.
+    """
+    result = {'passed': True, 'available': True, 'expired': False, 'score': None, 'action': '', 'latency_ms': None}
+    if _is_verification_disabled():
+        return result
+
+    if not breaker.allow_request():
+        result.update(passed=RECAPTCHA_FAILURE_POLICY == 'allow', available=False)
+        return result
+
     data = {
         'secret': settings.RECAPTCHA_PRIVATE_KEY,
         'response': token,
     }
-    
+
     if remote_ip:
         data['remoteip'] = remote_ip
-    
+
+    started = time.monotonic()
     try:
-        response = requests.post(
-            'https://www.google.com/recaptcha/api/siteverify',
+        response = _get_session().post(
+            RECAPTCHA_VERIFY_URL,
             data=data,
-            timeout=10
+            timeout=(RECAPTCHA_CONNECT_TIMEOUT, RECAPTCHA_READ_TIMEOUT)
         )
-        result = response.json()
-        return result.get('success', False) and result.get('score', 0) >= 0.5
-    except Exception:
-        return False
+        response.raise_for_status()
+        payload = response.json()
+    except Exception as e:
+        breaker.record_failure()
+        logger.warning(f"Ошибка проверки reCAPTCHA: {e}")
+        result.update(passed=RECAPTCHA_FAILURE_POLICY == 'allow', available=False)
+        return result
+    finally:
+        result['latency_ms'] = int((time.monotonic() - started) * 1000)
+
+    breaker.record_success()
+    result.update(score=payload.get('score'), action=payload.get('action', ''))
+    result['expired'] = 'timeout-or-duplicate' in payload.get('error-codes', [])
+    result['passed'] = payload.get('success', False) and (result['score'] or 0) >= RECAPTCHA_SCORE_THRESHOLD
+    return result
+
+
+def recaptcha_fields(result):
+    """Поля Message для сохранения результата проверки"""
+    return {
+        'recaptcha_score': result['score'],
+        'recaptcha_action': (result['action'] or '')[:64],
+        'recaptcha_latency_ms': result['latency_ms'],
+    }
+
+
+def verify_recaptcha(token, remote_ip=None):
+    """
+    Проверяет токен reCAPTCHA v3
+    """
+    return check_recaptcha(token, remote_ip)['passed']
@@ -0,0 +1,47 @@
+"""Кэш школ по уникальному коду для публичной формы отправки сообщений.
+
+QR-кампании приводят тысячи учеников на несколько одинаковых ссылок за
+считанные минуты, поэтому школа ищется через общий кэш Django (read-through).
+Неизвестные коды тоже кэшируются, чтобы перебор ссылок не доходил до БД.
+Записи сбрасываются сигналами при сохранении и удалении School.
+"""
+import re
+from django.core.cache import cache
+from .models import School
+
+SCHOOL_CACHE_TIMEOUT = 60 * 60
+MISSING_SCHOOL_CACHE_TIMEOUT = 5 * 60
+
+# Уникальный код школы - до 32 символов (см. School.unique_code)
+UNIQUE_CODE_RE = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+_MISSING = 'missing'
+
+
+def _cache_key(unique_code):
+    return f'school:code:{unique_code}'
+
+
+def get_school_by_code(unique_code):
+    """Школа по уникальному коду или None, если такой школы нет"""
+    if not UNIQUE_CODE_RE.match(unique_code):
+        return None
+
+    key = _cache_key(unique_code)
+    school = cache.get(key)
+    if school == _MISSING:
+        return None
+    if school is not None:
+        return school
+
+    school = School.objects.filter(unique_code=unique_code).first()
+    if school is None:
+        cache.set(key, _MISSING, MISSING_SCHOOL_CACHE_TIMEOUT)
+    else:
+        cache.set(key, school, SCHOOL_CACHE_TIMEOUT)
+    return school
+
+
+def invalidate_school(unique_code):
+    """Сброс записи кэша (в том числе отрицательной) для кода"""
+    cache.delete(_cache_key(unique_code))
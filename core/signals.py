@@ -0,0 +1,48 @@
+from django.db.models.signals import post_save, post_delete
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import receiver
+from dashboard.archive import is_archiving
+from dashboard.counters import messages_bulk_updated
+from dashboard.models import Message
+from .models import School, EditablePage
+from .school_cache import invalidate_school
+from .page_cache import invalidate_pages, INDEX_PAGE, CONTENT_PAGES
+from .content import invalidate_page
+from .stats import invalidate_message_stats
+from .static_export import export_page
+
+
+@receiver(post_save, sender=School)
+@receiver(post_delete, sender=School)
+def invalidate_school_cache(sender, instance, **kwargs):
+    """Сброс кэша школы при изменении или удалении"""
+    invalidate_school(instance.unique_code)
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def invalidate_index_page(sender, instance, **kwargs):
+    """Статистика на главной странице должна учитывать новое сообщение"""
+    if is_archiving():
+        # Перенос в архив статистику не меняет
+        return
+    invalidate_message_stats(instance.school_id)
+    invalidate_pages([INDEX_PAGE])
+
+
+@receiver(post_save, sender=EditablePage)
+@receiver(post_delete, sender=EditablePage)
+def invalidate_content_page(sender, instance, **kwargs):
+    """Сохранение в edit_page_content/create_page_content, админке или командах"""
+    invalidate_page(instance.page, instance.language)
+    invalidate_pages([instance.page])
+    if getattr(settings, 'STATIC_SITE_EXPORT_ON_SAVE', False) and instance.page in CONTENT_PAGES:
+        transaction.on_commit(lambda: export_page(instance.page, [instance.language]))
+
+
+@receiver(messages_bulk_updated)
+def invalidate_index_page_bulk(sender, school_ids, **kwargs):
+    for school_id in school_ids:
+        invalidate_message_stats(school_id)
+    invalidate_pages([INDEX_PAGE])
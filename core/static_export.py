@@ -0,0 +1,105 @@
+"""Экспорт публичных страниц EditablePage в статические файлы.
+
+Каждая страница рендерится для всех языков из settings.LANGUAGES в
+STATIC_SITE_ROOT/<язык>/<путь>/index.html вместе со сжатыми копиями .gz и
+.br (если установлен пакет brotli). Caddy отдает эти файлы напрямую
+(см. reverse-proxy/caddy/sites/anonim.caddy.example), не обращаясь к Django.
+
+Главная страница не экспортируется: на ней живая статистика сообщений.
+В экспортированных страницах нет CSRF-токена, поэтому вместо формы
+set_language язык переключается ссылками на /<язык>/<путь>/: Caddy отдает
+по ним файл из каталога языка и запоминает выбор в cookie django_language.
+"""
+import difflib
+import gzip
+import os
+import re
+from pathlib import Path
+from django.conf import settings
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+from django.utils import translation
+from .page_cache import CONTENT_PAGES
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_SITE_ROOT = Path(getattr(settings, 'STATIC_SITE_ROOT', settings.BASE_DIR / 'static_site'))
+
+CSRF_INPUT_TAG_RE = re.compile(r'\s*<input type="hidden" name="csrfmiddlewaretoken" value="[^"]*">')
+
+
+def page_path(page_key):
+    return reverse(page_key)
+
+
+def render_page(page_key, language):
+    """HTML страницы так, как его видит анонимный посетитель без cookies"""
+    path = page_path(page_key)
+    request = RequestFactory().get(path, HTTP_HOST=settings.SITE_DOMAIN, secure=not settings.DEBUG)
+    # base.html выводит ссылки на языковые версии вместо формы с CSRF-токеном
+    request.static_export = True
+    with translation.override(language):
+        request.LANGUAGE_CODE = language
+        # Без декоратора кэша: экспорт не должен читать или заполнять кэш страниц
+        view = resolve(path).func
+        response = getattr(view, '__wrapped__', view)(request)
+    html = response.content.decode(response.charset)
+    return CSRF_INPUT_TAG_RE.sub('', html)
+
+
+def output_file(page_key, language, root=STATIC_SITE_ROOT):
+    return Path(root) / language / page_path(page_key).strip('/') / 'index.html'
+
+
+def _write(path, data):
+    """Атомарная запись: Caddy не должен отдать наполовину записанный файл"""
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def export_page(page_key, languages=None, root=STATIC_SITE_ROOT):
+    """Экспорт страницы для указанных (по умолчанию всех) языков. Возвращает список файлов"""
+    written = []
+    for language in languages or [code for code, _ in settings.LANGUAGES]:
+        data = render_page(page_key, language).encode('utf-8')
+        path = output_file(page_key, language, root)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _write(path, data)
+        # mtime=0: одинаковое содержимое дает одинаковый .gz
+        _write(path.with_name(path.name + '.gz'), gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _write(path.with_name(path.name + '.br'), brotli.compress(data))
+        written.append(path)
+    return written
+
+
+def export_site(root=STATIC_SITE_ROOT):
+    written = []
+    for page_key in CONTENT_PAGES:
+        written.extend(export_page(page_key, root=root))
+    return written
+
+
+def verify_site(root=STATIC_SITE_ROOT):
+    """Сравнение экспортированных файлов со свежим рендером.
+
+    Возвращает словарь {путь: unified diff}; отсутствующий файл - пустой diff.
+    """
+    mismatches = {}
+    for page_key in CONTENT_PAGES:
+        for language, _ in settings.LANGUAGES:
+            path = output_file(page_key, language, root)
+            live = render_page(page_key, language)
+            exported = path.read_text(encoding='utf-8') if path.exists() else None
+            if exported != live:
+                mismatches[path] = ''.join(difflib.unified_diff(
+                    (exported or '').splitlines(keepends=True),
+                    live.splitlines(keepends=True),
+                    fromfile=f'{path} (экспорт)',
+                    tofile=f'{page_path(page_key)} [{language}] (рендер)',
+                ))
+    return mismatches
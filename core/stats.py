@@ -0,0 +1,83 @@
+"""Общая статистика сообщений для сайта, панели сотрудников и Telegram-бота.
+
+Все счетчики области (все сообщения, школа или общие сообщения) считаются
+одним запросом с условной агрегацией по MessageCounter и кэшируются на
+короткое время: статистика допускает задержку в несколько секунд.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce
+from dashboard.models import Message, MessageCounter
+
+STATS_CACHE_TIMEOUT = getattr(settings, 'STATS_CACHE_TIMEOUT', 30)
+
+SCOPE_ALL = 'all'
+SCOPE_GENERAL = 'general'
+
+STATUSES = [status for status, _ in Message.STATUS_CHOICES]
+PROBLEM_TYPES = [problem_type for problem_type, _ in Message.PROBLEM_TYPE_CHOICES]
+
+
+def _scope_filter(scope):
+    if scope == SCOPE_ALL:
+        return Q()
+    if scope == SCOPE_GENERAL:
+        # Общие сообщения: без школы или в служебной школе с кодом general
+        return Q(school__isnull=True) | Q(school__unique_code='general')
+    return Q(school=scope)
+
+
+def _cache_key(scope):
+    if scope in (SCOPE_ALL, SCOPE_GENERAL):
+        return f'stats:messages:{scope}'
+    return f'stats:messages:school:{getattr(scope, "pk", scope)}'
+
+
+def _compute(scope):
+    aggregates = {'total': Coalesce(Sum('count'), 0)}
+    for status in STATUSES:
+        aggregates[status] = Coalesce(Sum('count', filter=Q(status=status)), 0)
+    for problem_type in PROBLEM_TYPES:
+        aggregates[problem_type] = Coalesce(Sum('count', filter=Q(problem_type=problem_type)), 0)
+    return MessageCounter.objects.filter(_scope_filter(scope)).aggregate(**aggregates)
+
+
+def get_message_stats(scope=SCOPE_ALL):
+    """Статистика сообщений области.
+
+    scope - SCOPE_ALL, SCOPE_GENERAL, школа или её ID. Возвращает словарь
+    с ключом total и ключами всех статусов и типов проблем Message.
+    """
+    key = _cache_key(scope)
+    stats = cache.get(key)
+    if stats is None:
+        stats = _compute(scope)
+        cache.set(key, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def count_messages(school=None, status=None, problem_type=None):
+    """Приблизительное число сообщений в списке (без архива) по фильтрам из MessageCounter.
+
+    school - школа, её ID или None (все школы). Не требует COUNT по таблице
+    сообщений; возможные расхождения исправляет rebuild_counters.
+    """
+    lookup = {}
+    if school is not None:
+        lookup['school'] = school
+    if status:
+        lookup['status'] = status
+    if problem_type:
+        lookup['problem_type'] = problem_type
+    return MessageCounter.objects.filter(**lookup).aggregate(
+        total=Coalesce(Sum(F('count') - F('archived')), 0)
+    )['total']
+
+
+def invalidate_message_stats(school_id=None):
+    """Сброс кэша статистики после изменения сообщений школы"""
+    keys = [_cache_key(SCOPE_ALL), _cache_key(SCOPE_GENERAL)]
+    if school_id is not None:
+        keys.append(_cache_key(school_id))
+    cache.delete_many(keys)
@@ -1,5 +1,7 @@
+import html
 import logging
 import json
+import time
 from typing import Dict, Any, Optional, List, Tuple
 from django.conf import settings
 from django.contrib.auth import authenticate
@@ -12,14 +14,19 @@ from django.views import View
 from django.db.models import Q, Count, QuerySet
 import requests
 from .models import School
+from .telegram_client import get_telegram_client
+from .telegram_ratelimit import rate_limiter, backoff_delay, RateLimitDeferred, RATE_LIMITED_METHODS, MAX_RETRY_AFTER
 from dashboard.models import Message
+from dashboard.search import search_messages
+from dashboard.bulk import apply_bulk_action, parse_message_ids
+from .stats import get_message_stats
+from .db_router import routing_scope, replica_reads, REPLICA_PIN_SECONDS
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
 # Константы
 PAGINATION_SIZE = 5
-REQUEST_TIMEOUT = 10
 MAX_RETRIES = 3
 
 # Роли пользователей
@@ -49,28 +56,69 @@ class TelegramBot:
     def __init__(self):
         self.token = settings.TELEGRAM_BOT_TOKEN
         self.username = settings.TELEGRAM_BOT_USERNAME
-        self.base_url = f"https://api.telegram.org/bot{self.token}"
-        self.session = requests.Session()
-        self.session.headers.update({
-            'Content-Type': 'application/json',
-            'User-Agent': 'AnonimMektepBot/1.0'
-        })
+        # Общий для процесса клиент с пулом keep-alive соединений
+        self.client = get_telegram_client()
         
     def _make_request(self, method: str, data: Dict[str, Any]) -> Optional[Dict]:
-        """Универсальный метод для выполнения запросов к Telegram API"""
-        url = f"{self.base_url}/{method}"
+        """Универсальный метод для выполнения запросов к Telegram API.
+
+        Соблюдает глобальный лимит и лимит на чат, при ответе 429 ждет
+        parameters.retry_after, а при сетевых ошибках и ответах 5xx повторяет
+        запрос с экспоненциальной задержкой. Блокировки дольше MAX_RETRY_AFTER
+        не ожидаются: запрос завершается неудачей сразу.
+        """
+        chat_id = data.get('chat_id') if method in RATE_LIMITED_METHODS else None
         
         for attempt in range(MAX_RETRIES):
+            if attempt:
+                rate_limiter.record_retry()
+            if method in RATE_LIMITED_METHODS:
+                try:
+                    rate_limiter.acquire(chat_id)
+                except RateLimitDeferred as e:
+                    # Чат заблокирован надолго: повтор выполнит очередь уведомлений
+                    logger.warning(f"Отправка {method} (chat_id={chat_id}) отложена: {e}")
+                    return None
+            
             try:
-                response = self.session.post(url, json=data, timeout=REQUEST_TIMEOUT)
-                response.raise_for_status()
-                return response.json()
+                response = self.client.post(method, data)
             except requests.exceptions.RequestException as e:
-                logger.warning(f"Попытка {attempt + 1} не удалась: {e}")
-                if attempt == MAX_RETRIES - 1:
-                    logger.error(f"Все попытки исчерпаны для {method}: {e}")
+                logger.warning(f"Попытка {attempt + 1} для {method} не удалась: {e}")
+                if attempt < MAX_RETRIES - 1:
+                    time.sleep(backoff_delay(attempt))
+                continue
+            
+            if response.status_code == 429:
+                try:
+                    retry_after = response.json().get('parameters', {}).get('retry_after', 1)
+                except ValueError:
+                    retry_after = 1
+                logger.warning(f"Telegram ограничил частоту {method} (chat_id={chat_id}), повтор через {retry_after} с")
+                rate_limiter.penalize(chat_id, retry_after)
+                if retry_after > MAX_RETRY_AFTER:
                     return None
-                    
+                if chat_id is None and attempt < MAX_RETRIES - 1:
+                    time.sleep(retry_after)
+                continue
+            
+            if response.status_code >= 500:
+                logger.warning(f"Попытка {attempt + 1} для {method} не удалась: HTTP {response.status_code}")
+                if attempt < MAX_RETRIES - 1:
+                    time.sleep(backoff_delay(attempt))
+                continue
+            
+            try:
+                result = response.json()
+            except ValueError:
+                logger.error(f"Некорректный ответ Telegram для {method}: HTTP {response.status_code}")
+                return None
+            
+            if not result.get('ok'):
+                # 4xx (кроме 429) повторять бессмысленно: чат удален, бот заблокирован и т.п.
+                logger.error(f"Ошибка Telegram API для {method}: {result.get('description')}")
+            return result
+        
+        logger.error(f"Все попытки исчерпаны для {method}")
         return None
         
     def send_message(self, chat_id: int, text: str, reply_markup: Optional[Dict] = None) -> bool:
@@ -200,7 +248,7 @@ class DatabaseOptimizer:
     @staticmethod
     def get_messages_with_relations(status: str = None, school: School = None) -> QuerySet:
         """Получение сообщений с предзагруженными связями"""
-        queryset = Message.objects.select_related('school', 'user').prefetch_related('comments')
+        queryset = Message.objects.select_related('school').prefetch_related('comments')
         
         if status:
             queryset = queryset.filter(status=status)
@@ -224,6 +272,9 @@ class TelegramBotHandler:
     def __init__(self):
         self.bot = TelegramBot()
         self.user_sessions = {}  # Временное хранение сессий пользователей
+        self.search_queries = {}  # Последний поисковый запрос чата (для страниц результатов)
+        self.bulk_selections = {}  # ID сообщений последней показанной страницы (для массовых действий)
+        self.primary_pins = {}  # chat_id -> время (monotonic), до которого чат читает из основной БД
         self.cleanup_duplicate_users()  # Очищаем дублирующихся пользователей при запуске
     
     def cleanup_duplicate_users(self) -> None:
@@ -329,6 +380,7 @@ class TelegramBotHandler:
 📋 <b>Ваша роль:</b> {role_display}
 🏫 <b>Школа:</b> {school_name}
 
+Поиск по тексту сообщений: /search слова
 Перезагрузить бота можно командой /start
             """
         else:
@@ -337,6 +389,8 @@ class TelegramBotHandler:
 
 📋 <b>Ваша роль:</b> {role_display}
 
+Поиск по тексту сообщений: /search слова
+
 Выберите действие:
             """
         
@@ -430,6 +484,12 @@ class TelegramBotHandler:
             self.handle_set_status(chat_id, callback_data, user, message_id, query_id)
         elif callback_data.startswith('comment_'):
             self.handle_comment(chat_id, callback_data, user, message_id, query_id)
+        elif callback_data == 'bulk_page':
+            self.show_bulk_actions(chat_id, message_id, query_id)
+        elif callback_data.startswith('bulk_set_'):
+            self.confirm_bulk_page_status(chat_id, callback_data, message_id, query_id)
+        elif callback_data.startswith('bulk_confirm_'):
+            self.handle_bulk_page_status(chat_id, callback_data, user, message_id, query_id)
         elif callback_data == 'back_to_menu':
             self.send_main_menu(chat_id, user)
         elif callback_data == 'disabled':
@@ -464,6 +524,9 @@ class TelegramBotHandler:
         elif callback_data.startswith('school_messages_'):
             school_id = int(callback_data.split('_')[2])
             self.show_school_messages_by_id(chat_id, user, school_id)
+        elif callback_data.startswith('search_page_'):
+            page = int(callback_data.split('_')[2])
+            self.show_search_results(chat_id, user, page)
         elif callback_data == 'back_to_schools':
             self.show_schools(chat_id, user)
         else:
@@ -471,21 +534,21 @@ class TelegramBotHandler:
     
     def show_stats_all(self, chat_id: int, user: User, message_id: int = None) -> None:
         """Показать общую статистику"""
-        messages = Message.objects.all()
+        stats = get_message_stats()
         
         stats_text = f"""
 📊 <b>Общая статистика</b>
 
-🔴 Новых: {messages.filter(status='new').count()}
-🟡 В работе: {messages.filter(status='in_progress').count()}
-🟢 Решено: {messages.filter(status='resolved').count()}
-📈 Всего: {messages.count()}
+🔴 Новых: {stats['new']}
+🟡 В работе: {stats['in_progress']}
+🟢 Решено: {stats['resolved']}
+📈 Всего: {stats['total']}
 
 📋 <b>По типам проблем:</b>
-• Буллинг: {messages.filter(problem_type='bullying').count()}
-• Вымогательство: {messages.filter(problem_type='extortion').count()}
-• Притеснения: {messages.filter(problem_type='harassment').count()}
-• Другие: {messages.filter(problem_type='other').count()}
+• Буллинг: {stats['bullying']}
+• Вымогательство: {stats['extortion']}
+• Насилие: {stats['violence']}
+• Другие: {stats['other']}
         """
         
         keyboard = {
@@ -502,15 +565,15 @@ class TelegramBotHandler:
             self.bot.send_message(chat_id, "❌ Школа не назначена")
             return
             
-        messages = Message.objects.filter(school=user.school)
+        stats = get_message_stats(user.school)
         
         stats_text = f"""
 📊 <b>Статистика школы: {user.school.name}</b>
 
-🔴 Новых: {messages.filter(status='new').count()}
-🟡 В работе: {messages.filter(status='in_progress').count()}
-🟢 Решено: {messages.filter(status='resolved').count()}
-📈 Всего: {messages.count()}
+🔴 Новых: {stats['new']}
+🟡 В работе: {stats['in_progress']}
+🟢 Решено: {stats['resolved']}
+📈 Всего: {stats['total']}
         """
         
         keyboard = {
@@ -557,11 +620,50 @@ class TelegramBotHandler:
             # Создаем кнопки навигации
             navigation_buttons = KeyboardBuilder.create_navigation_buttons(page, total_pages, callback_prefix)
             
+            # Сообщения страницы для кнопки массовых действий
+            self.bulk_selections[chat_id] = [message.id for message in page_messages]
+            
             # Отправляем навигацию
             navigation_text = f"📄 Навигация ({page} страница из {total_pages})"
-            navigation_keyboard = KeyboardBuilder.create_inline_keyboard([navigation_buttons])
+            navigation_keyboard = KeyboardBuilder.create_inline_keyboard([
+                navigation_buttons,
+                [{'text': '⚡ Действия со страницей', 'callback_data': 'bulk_page'}]
+            ])
             self.bot.send_message(chat_id, navigation_text, navigation_keyboard)
     
+    def handle_search(self, chat_id: int, text: str) -> None:
+        """Обработка команды /search по полнотекстовому индексу сообщений"""
+        user = DatabaseOptimizer.get_user_with_relations(chat_id)
+        if not user:
+            self.bot.send_message(chat_id, "❌ Пользователь не найден. Используйте /start для авторизации.")
+            return
+        
+        # /search@имя_бота слова -> слова
+        parts = text.split(maxsplit=1)
+        query = parts[1].strip() if len(parts) > 1 else ''
+        if not query:
+            self.bot.send_message(chat_id, "🔍 Укажите слова для поиска: /search <i>текст</i>")
+            return
+        
+        self.search_queries[chat_id] = query
+        self.show_search_results(chat_id, user)
+    
+    def show_search_results(self, chat_id: int, user: User, page: int = 1) -> None:
+        """Показать результаты последнего поиска (учитель ищет только в своей школе)"""
+        query = self.search_queries.get(chat_id)
+        if not query:
+            self.bot.send_message(chat_id, "🔍 Повторите поиск командой /search <i>текст</i>")
+            return
+        
+        messages = Message.objects.select_related('school')
+        school_id = None
+        if user.role == ROLES['TEACHER']:
+            messages = messages.filter(school=user.school)
+            school_id = user.school_id
+        messages = search_messages(messages, query, school_id=school_id).order_by('-created_at')
+        
+        self.show_messages_with_pagination(chat_id, user, messages, f"🔍 Поиск «{html.escape(query)}»", page, "search")
+    
     def show_in_progress_messages(self, chat_id: int, user: User, page: int = 1) -> None:
         """Показать сообщения в работе"""
         if user.role == ROLES['TEACHER']:
@@ -939,10 +1041,11 @@ class TelegramBotHandler:
     def handle_set_status(self, chat_id: int, callback_data: str, user: User, message_id: int, query_id: str = None) -> None:
         """Обработка изменения статуса сообщения"""
         try:
-            # Парсим callback_data: set_status_{message_id}_{new_status}
-            parts = callback_data.split('_')
-            message_id_from_callback = int(parts[2])
-            new_status = parts[3]
+            # Парсим callback_data: set_status_{message_id}_{new_status} (статус может содержать "_")
+            message_id_part, _, new_status = callback_data[len('set_status_'):].partition('_')
+            message_id_from_callback = int(message_id_part)
+            if new_status not in dict(Message.STATUS_CHOICES):
+                raise ValueError(new_status)
             
             message = Message.objects.get(id=message_id_from_callback)
             
@@ -1018,6 +1121,113 @@ class TelegramBotHandler:
         except (Message.DoesNotExist, User.DoesNotExist):
             self.bot.send_message(chat_id, "❌ Ошибка добавления комментария")
     
+    def show_bulk_actions(self, chat_id: int, bot_message_id: int, query_id: str = None) -> None:
+        """Выбор статуса для всех сообщений последней показанной страницы"""
+        message_ids = self.bulk_selections.get(chat_id)
+        if not message_ids:
+            self.bot.answer_callback_query(query_id, "Откройте список сообщений заново")
+            return
+        
+        text = f"⚡ <b>Действия со страницей</b>\n\nСообщения: {', '.join(f'#{message_id}' for message_id in message_ids)}"
+        keyboard = KeyboardBuilder.create_inline_keyboard([
+            [
+                {'text': '⏳ В работу', 'callback_data': 'bulk_set_in_progress'},
+                {'text': '✅ Решено', 'callback_data': 'bulk_set_resolved'}
+            ],
+            [{'text': '🚫 Спам', 'callback_data': 'bulk_set_spam'}],
+            [{'text': '🔙 Назад', 'callback_data': 'back_to_menu'}]
+        ])
+        self.bot.edit_message(chat_id, bot_message_id, text, keyboard)
+    
+    def confirm_bulk_page_status(self, chat_id: int, callback_data: str, bot_message_id: int, query_id: str = None) -> None:
+        """Подтверждение смены статуса всей страницы: одно нажатие ничего не меняет"""
+        new_status = callback_data[len('bulk_set_'):]
+        message_ids = self.bulk_selections.get(chat_id)
+        if not message_ids or new_status not in dict(Message.STATUS_CHOICES):
+            self.bot.answer_callback_query(query_id, "Откройте список сообщений заново")
+            return
+        
+        status_display = dict(Message.STATUS_CHOICES)[new_status]
+        text = (
+            f"❓ <b>Изменить статус на «{status_display}»?</b>\n\n"
+            f"Сообщения ({len(message_ids)}): {', '.join(f'#{message_id}' for message_id in message_ids)}"
+        )
+        keyboard = KeyboardBuilder.create_inline_keyboard([
+            [
+                {'text': '✅ Подтвердить', 'callback_data': f'bulk_confirm_{new_status}'},
+                {'text': '❌ Отмена', 'callback_data': 'bulk_page'}
+            ]
+        ])
+        self.bot.edit_message(chat_id, bot_message_id, text, keyboard)
+    
+    def handle_bulk_page_status(self, chat_id: int, callback_data: str, user: User, bot_message_id: int, query_id: str = None) -> None:
+        """Смена статуса всех сообщений страницы одним UPDATE (после подтверждения)"""
+        new_status = callback_data[len('bulk_confirm_'):]
+        message_ids = self.bulk_selections.pop(chat_id, None)
+        if not message_ids or new_status not in dict(Message.STATUS_CHOICES):
+            self.bot.answer_callback_query(query_id, "Откройте список сообщений заново")
+            return
+        
+        updated, _ = apply_bulk_action(user, message_ids, new_status)
+        status_display = dict(Message.STATUS_CHOICES)[new_status]
+        self.bot.answer_callback_query(query_id, f"Статус изменен: {updated}")
+        self.bot.edit_message(chat_id, bot_message_id, f"✅ <b>{status_display}</b>: изменено сообщений {updated} из {len(message_ids)}")
+    
+    def handle_bulk_command(self, chat_id: int, text: str) -> None:
+        """Команда /bulk статус id... [-- комментарий]: массовая смена статуса и общий комментарий"""
+        user = DatabaseOptimizer.get_user_with_relations(chat_id)
+        if not user:
+            self.bot.send_message(chat_id, "❌ Пользователь не найден. Используйте /start для авторизации.")
+            return
+        
+        statuses = dict(Message.STATUS_CHOICES)
+        usage = (
+            "⚡ <b>Массовые действия</b>\n\n"
+            "/bulk <i>статус</i> <i>id или диапазоны</i> [-- <i>комментарий</i>]\n"
+            f"Статусы: {', '.join(statuses)}, - (не менять)\n"
+            "Пример: /bulk spam 120-180, 205 -- Рассылка рекламы"
+        )
+        # /bulk@имя_бота spam 1 2-5 -- текст -> статус, номера, комментарий.
+        # Комментарий только после --: число в тексте ("2 раза") не должно стать номером
+        parts = text.split()[1:]
+        if len(parts) < 2 or (parts[0] != '-' and parts[0] not in statuses):
+            self.bot.send_message(chat_id, usage)
+            return
+        status = None if parts[0] == '-' else parts[0]
+        if '--' in parts:
+            separator = parts.index('--')
+            id_parts, comment = parts[1:separator], ' '.join(parts[separator + 1:])
+        else:
+            id_parts, comment = parts[1:], ''
+        id_parts = [part for part in ','.join(id_parts).split(',') if part]
+        invalid = [
+            part for part in id_parts
+            if not all(bound.isdigit() for bound in part.split('-')) or part.count('-') > 1
+        ]
+        if invalid:
+            self.bot.send_message(
+                chat_id,
+                f"❌ Неверный номер: {html.escape(invalid[0])}. Комментарий пишется после --\n\n{usage}"
+            )
+            return
+        
+        try:
+            message_ids = parse_message_ids(id_parts)
+        except ValueError as e:
+            self.bot.send_message(chat_id, f"❌ {html.escape(str(e))}")
+            return
+        if not message_ids or not (status or comment):
+            self.bot.send_message(chat_id, usage)
+            return
+        
+        # Чужие сообщения (учитель - другой школы) не попадают в WHERE и не считаются
+        updated, commented = apply_bulk_action(user, message_ids, status, comment)
+        self.bot.send_message(
+            chat_id,
+            f"✅ <b>Готово</b>\n\nВыбрано номеров: {len(message_ids)}\n"
+            f"Статус изменен: {updated}\nКомментариев добавлено: {commented}"
+        )
+    
     def show_school_statistics(self, chat_id: int, user: User, school_id: int) -> None:
         """Показать статистику конкретной школы"""
         try:
@@ -1027,11 +1237,11 @@ class TelegramBotHandler:
             return
         
         # Статистика сообщений по школе
-        messages = Message.objects.filter(school=school)
-        new_count = messages.filter(status='new').count()
-        in_progress_count = messages.filter(status='in_progress').count()
-        resolved_count = messages.filter(status='resolved').count()
-        total_count = messages.count()
+        stats = get_message_stats(school)
+        new_count = stats['new']
+        in_progress_count = stats['in_progress']
+        resolved_count = stats['resolved']
+        total_count = stats['total']
         
         # Статистика учителей
         teachers_count = school.users.filter(role='teacher', is_active=True).count()
@@ -1127,13 +1337,29 @@ class TelegramBotHandler:
     def process_update(self, update: Dict[str, Any]) -> None:
         """Обработка входящего обновления от Telegram"""
         try:
-            if 'message' in update:
-                self.process_message(update['message'])
-            elif 'callback_query' in update:
-                self.process_callback_query(update['callback_query'])
+            # Списки и статистика читаются с реплики; после записи (статус, комментарий)
+            # обновление дочитывает данные из основной БД, а следующие обновления
+            # чата - еще REPLICA_PIN_SECONDS (как cookie ReplicaPinMiddleware в панели)
+            chat_id = self._update_chat_id(update)
+            pinned = self.primary_pins.get(chat_id, 0) > time.monotonic()
+            with routing_scope(pinned=pinned) as state, replica_reads():
+                try:
+                    if 'message' in update:
+                        self.process_message(update['message'])
+                    elif 'callback_query' in update:
+                        self.process_callback_query(update['callback_query'])
+                finally:
+                    if state.wrote and chat_id is not None:
+                        self.primary_pins[chat_id] = time.monotonic() + REPLICA_PIN_SECONDS
         except Exception as e:
             logger.error(f"Ошибка обработки обновления: {e}")
     
+    @staticmethod
+    def _update_chat_id(update: Dict[str, Any]) -> Optional[int]:
+        """Чат, из которого пришло обновление"""
+        message = update.get('message') or update.get('callback_query', {}).get('message')
+        return message['chat']['id'] if message else None
+    
     def process_message(self, message: Dict[str, Any]) -> None:
         """Обработка текстового сообщения"""
         chat_id = message['chat']['id']
@@ -1141,6 +1367,10 @@ class TelegramBotHandler:
         
         if text.startswith('/start'):
             self.handle_start(chat_id, message.get('from', {}))
+        elif text.startswith('/search'):
+            self.handle_search(chat_id, text)
+        elif text.startswith('/bulk'):
+            self.handle_bulk_command(chat_id, text)
         elif chat_id in self.user_sessions:
             state = self.user_sessions[chat_id]['state']
             if state == 'waiting_username':
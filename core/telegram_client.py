@@ -0,0 +1,95 @@
+"""Общий для процесса HTTP-клиент Telegram Bot API.
+
+Один лениво создаваемый экземпляр с пулом keep-alive соединений используется
+ботом, рассылкой уведомлений, polling и webhook-утилитами, поэтому TCP и TLS
+рукопожатия выполняются один раз на соединение, а не на каждый запрос.
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+from django.conf import settings
+
+# Размер пула соединений к api.telegram.org
+POOL_SIZE = getattr(settings, 'TELEGRAM_POOL_SIZE', 10)
+
+# Раздельные таймауты установки соединения и чтения ответа (секунды)
+CONNECT_TIMEOUT = getattr(settings, 'TELEGRAM_CONNECT_TIMEOUT', 3.05)
+READ_TIMEOUT = getattr(settings, 'TELEGRAM_READ_TIMEOUT', 10)
+
+API_URL = 'https://api.telegram.org'
+
+
+class TelegramClient:
+    """Потокобезопасный клиент Telegram API с учетом задержек по методам"""
+
+    def __init__(self, token: str, pool_size: int = POOL_SIZE,
+                 connect_timeout: float = CONNECT_TIMEOUT, read_timeout: float = READ_TIMEOUT):
+        self.base_url = f"{API_URL}/bot{token}"
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.session = requests.Session()
+        # Повторы выполняет TelegramBot с учетом лимитов, поэтому адаптер не повторяет запросы сам
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'User-Agent': 'AnonimMektepBot/1.0',
+            'Connection': 'keep-alive',
+        })
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def request(self, method: str, data: Optional[Dict[str, Any]] = None, http_method: str = 'post',
+                read_timeout: Optional[float] = None) -> requests.Response:
+        """Вызов метода API. Сетевые ошибки пробрасываются вызывающему коду"""
+        url = f"{self.base_url}/{method}"
+        timeout = (self.connect_timeout, read_timeout if read_timeout is not None else self.read_timeout)
+        started = time.monotonic()
+        error = True
+        try:
+            if http_method == 'get':
+                response = self.session.get(url, params=data, timeout=timeout)
+            else:
+                response = self.session.post(url, json=data, timeout=timeout)
+            error = response.status_code >= 400
+            return response
+        finally:
+            self._record(method, time.monotonic() - started, error)
+
+    def post(self, method: str, data: Optional[Dict[str, Any]] = None, **kwargs) -> requests.Response:
+        return self.request(method, data, 'post', **kwargs)
+
+    def get(self, method: str, params: Optional[Dict[str, Any]] = None, **kwargs) -> requests.Response:
+        return self.request(method, params, 'get', **kwargs)
+
+    def _record(self, method: str, elapsed: float, error: bool) -> None:
+        with self._stats_lock:
+            stats = self._stats.setdefault(method, {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            elapsed_ms = elapsed * 1000
+            stats['calls'] += 1
+            stats['errors'] += int(error)
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Задержки по методам API: количество вызовов, ошибок, среднее и максимум (мс)"""
+        with self._stats_lock:
+            return {
+                method: {**stats, 'avg_ms': stats['total_ms'] / stats['calls']}
+                for method, stats in self._stats.items()
+            }
+
+
+_client: Optional[TelegramClient] = None
+_client_lock = threading.Lock()
+
+
+def get_telegram_client() -> TelegramClient:
+    """Общий экземпляр клиента, создается при первом обращении"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TelegramClient(settings.TELEGRAM_BOT_TOKEN)
+    return _client
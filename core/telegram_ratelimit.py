@@ -0,0 +1,196 @@
+"""Ограничение частоты запросов к Telegram Bot API.
+
+Telegram допускает около 30 сообщений в секунду на бота и около одного
+сообщения в секунду в один чат, а при превышении отвечает HTTP 429 с
+``parameters.retry_after``. Лимитер общий для процесса: его используют все
+экземпляры TelegramBot и все потоки рассылки.
+"""
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+
+# Глобальный лимит на бота
+GLOBAL_RATE = getattr(settings, 'TELEGRAM_GLOBAL_RATE', 30)  # сообщений в секунду
+GLOBAL_BURST = getattr(settings, 'TELEGRAM_GLOBAL_BURST', 30)
+
+# Лимит на один чат
+PER_CHAT_RATE = getattr(settings, 'TELEGRAM_PER_CHAT_RATE', 1)  # сообщений в секунду
+PER_CHAT_BURST = getattr(settings, 'TELEGRAM_PER_CHAT_BURST', 3)
+
+# Экспоненциальная задержка между повторами (секунды)
+BACKOFF_BASE = getattr(settings, 'TELEGRAM_BACKOFF_BASE', 0.5)
+BACKOFF_MAX = getattr(settings, 'TELEGRAM_BACKOFF_MAX', 30)
+
+# Дольше этого времени (секунды) по ответу 429 не ждем: запрос считается
+# неудачным, и повтором занимается вызывающий код (например, очередь уведомлений)
+MAX_RETRY_AFTER = getattr(settings, 'TELEGRAM_MAX_RETRY_AFTER', 60)
+
+# Максимальное количество хранимых корзин для чатов
+MAX_CHAT_BUCKETS = 10000
+
+# Методы API, которые отправляют сообщения и подпадают под лимиты
+RATE_LIMITED_METHODS = {
+    'sendMessage',
+    'editMessageText',
+    'sendPhoto',
+    'sendDocument',
+}
+
+
+class RateLimitDeferred(Exception):
+    """Ожидание токена дольше MAX_RETRY_AFTER: отправку нужно отложить, а не ждать"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f'Отправка отложена на {retry_after:.0f} с')
+        self.retry_after = retry_after
+
+
+def backoff_delay(attempt: int) -> float:
+    """Задержка перед повтором: экспоненциальный рост с полным jitter"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class TokenBucket:
+    """Корзина токенов. Не потокобезопасна: блокировку держит TelegramRateLimiter"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, now: float) -> float:
+        """Сколько ждать до появления токена (0 - токен доступен)"""
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float) -> None:
+        """Запрет отправки на указанное время (ответ 429 от Telegram)"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+class TelegramRateLimiter:
+    """Глобальная корзина токенов и корзины для каждого чата"""
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, global_burst: float = GLOBAL_BURST,
+                 per_chat_rate: float = PER_CHAT_RATE, per_chat_burst: float = PER_CHAT_BURST):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.chat_buckets: Dict[str, TokenBucket] = {}
+        self.lock = threading.Lock()
+        self.counters = {
+            'waiting': 0,        # текущая глубина очереди (потоки, ожидающие токен)
+            'max_waiting': 0,    # максимальная глубина очереди
+            'acquired': 0,       # выдано токенов
+            'throttled': 0,      # сколько раз пришлось ждать токен
+            'throttled_seconds': 0.0,
+            'rate_limited': 0,   # получено ответов 429
+            'deferred': 0,       # отправок отложено без ожидания (блокировка дольше max_wait)
+            'retries': 0,        # повторов запросов
+        }
+
+    def _chat_bucket(self, chat_id: str, now: float) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= MAX_CHAT_BUCKETS:
+                self._prune(now)
+            bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _prune(self, now: float) -> None:
+        """Удаление корзин чатов, которые полностью восстановились"""
+        for chat_id in [key for key, bucket in self.chat_buckets.items() if bucket.is_idle(now)]:
+            del self.chat_buckets[chat_id]
+
+    def acquire(self, chat_id: Optional[str] = None, max_wait: float = MAX_RETRY_AFTER) -> float:
+        """Ожидание разрешения на отправку. Возвращает время ожидания в секундах.
+
+        Если ждать пришлось бы дольше max_wait (блокировка после 429), поток не
+        засыпает: выбрасывается RateLimitDeferred, повтор выполняет вызывающий код.
+        """
+        chat_key = str(chat_id) if chat_id is not None else None
+        waited = 0.0
+        with self.lock:
+            self.counters['waiting'] += 1
+            self.counters['max_waiting'] = max(self.counters['max_waiting'], self.counters['waiting'])
+        try:
+            while True:
+                with self.lock:
+                    now = time.monotonic()
+                    delay = self.global_bucket.wait_time(now)
+                    if chat_key is not None:
+                        delay = max(delay, self._chat_bucket(chat_key, now).wait_time(now))
+                    if delay <= 0:
+                        self.global_bucket.consume()
+                        if chat_key is not None:
+                            self.chat_buckets[chat_key].consume()
+                        self.counters['acquired'] += 1
+                        if waited:
+                            self.counters['throttled'] += 1
+                            self.counters['throttled_seconds'] += waited
+                        return waited
+                    if waited + delay > max_wait:
+                        self.counters['deferred'] += 1
+                        raise RateLimitDeferred(delay)
+                time.sleep(delay)
+                waited += delay
+        finally:
+            with self.lock:
+                self.counters['waiting'] -= 1
+
+    def penalize(self, chat_id: Optional[str], retry_after: float) -> None:
+        """Учет ответа 429: блокируем чат (или всего бота) на retry_after секунд"""
+        with self.lock:
+            now = time.monotonic()
+            self.counters['rate_limited'] += 1
+            if chat_id is None:
+                self.global_bucket.block(now, retry_after)
+            else:
+                self._chat_bucket(str(chat_id), now).block(now, retry_after)
+
+    def wait_time(self, chat_id: Optional[str] = None) -> float:
+        """Сколько секунд чат (или весь бот) еще заблокирован, без расхода токена"""
+        with self.lock:
+            now = time.monotonic()
+            delay = self.global_bucket.wait_time(now)
+            bucket = self.chat_buckets.get(str(chat_id)) if chat_id is not None else None
+            if bucket is not None:
+                delay = max(delay, bucket.wait_time(now))
+            return delay
+
+    def record_retry(self) -> None:
+        with self.lock:
+            self.counters['retries'] += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        """Снимок счетчиков лимитера"""
+        with self.lock:
+            stats = dict(self.counters)
+            stats['chats_tracked'] = len(self.chat_buckets)
+        return stats
+
+
+# Общий для процесса лимитер
+rate_limiter = TelegramRateLimiter()
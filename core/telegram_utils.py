@@ -1,21 +1,88 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from django.conf import settings
-from core.models import User, School
+from django.db.models import F, Q
+from django.utils import timezone
+from core.models import User, School, NotificationOutbox
 from .telegram_bot import TelegramBot
+from .telegram_client import POOL_SIZE
+from .telegram_ratelimit import rate_limiter
+from .recaptcha_utils import check_recaptcha, recaptcha_fields, RECAPTCHA_FAILURE_POLICY
+from dashboard.models import Message
+
+logger = logging.getLogger(__name__)
 
 TELEGRAM_BOT_TOKEN = getattr(settings, 'TELEGRAM_BOT_TOKEN', None)
 
-def send_telegram_message(chat_id, text, reply_markup=None):
+# Количество потоков для параллельной рассылки уведомлений
+NOTIFY_MAX_WORKERS = min(getattr(settings, 'TELEGRAM_NOTIFY_WORKERS', 8), POOL_SIZE)
+
+# Параметры очереди уведомлений
+OUTBOX_BATCH_SIZE = getattr(settings, 'NOTIFIER_BATCH_SIZE', 20)
+OUTBOX_MAX_ATTEMPTS = getattr(settings, 'NOTIFIER_MAX_ATTEMPTS', 12)
+OUTBOX_RETRY_BASE = getattr(settings, 'NOTIFIER_RETRY_BASE', 30)  # секунды
+OUTBOX_RETRY_MAX = getattr(settings, 'NOTIFIER_RETRY_MAX', 3600)  # секунды
+OUTBOX_LEASE = getattr(settings, 'NOTIFIER_LEASE', 300)  # секунды
+
+# Токен reCAPTCHA действителен около двух минут после выдачи
+RECAPTCHA_TOKEN_TTL = timedelta(minutes=2)
+
+def send_telegram_message(chat_id, text, reply_markup=None, bot=None):
     """Отправка сообщения через новый Telegram бот"""
     if not TELEGRAM_BOT_TOKEN:
         return False
     try:
-        bot = TelegramBot()
+        bot = bot or TelegramBot()
         return bot.send_message(chat_id, text, reply_markup)
     except Exception as e:
-        print(f"Ошибка отправки Telegram сообщения: {e}")
+        logger.error(f"Ошибка отправки Telegram сообщения в чат {chat_id}: {e}")
         return False
 
-def notify_admins_about_message(message_obj):
+def get_recipient_chat_ids(school):
+    """Chat ID всех получателей уведомления о сообщении одним запросом.
+
+    Учителя получают уведомления только по своей школе, районный отдел и
+    супер-админы - по всем сообщениям. Повторяющиеся chat_id схлопываются.
+    """
+    recipients = Q(role__in=[User.RAYON_OTDEL, User.SUPER_ADMIN])
+    if school:
+        recipients |= Q(role=User.TEACHER, school=school)
+    
+    chat_ids = User.objects.filter(
+        recipients,
+        is_active=True,
+        telegram_chat_id__isnull=False,
+    ).exclude(telegram_chat_id='').values_list('telegram_chat_id', flat=True).distinct()
+    return set(chat_ids)
+
+def broadcast_telegram_message(chat_ids, text, reply_markup=None):
+    """Параллельная отправка одного сообщения в несколько чатов.
+
+    Все потоки используют общий клиент Telegram API с пулом keep-alive
+    соединений.
+    Возвращает словарь {chat_id: успешно ли доставлено}.
+    """
+    chat_ids = list(chat_ids)
+    if not chat_ids:
+        return {}
+    if not TELEGRAM_BOT_TOKEN:
+        return {chat_id: False for chat_id in chat_ids}
+    
+    bot = TelegramBot()
+    with ThreadPoolExecutor(max_workers=min(NOTIFY_MAX_WORKERS, len(chat_ids))) as executor:
+        delivered = executor.map(
+            lambda chat_id: send_telegram_message(chat_id, text, reply_markup, bot=bot),
+            chat_ids
+        )
+        return dict(zip(chat_ids, delivered))
+
+def notify_admins_about_message(message_obj, skip_chat_ids=()):
+    """Рассылка уведомления о новом сообщении.
+
+    Возвращает словарь {chat_id: успешно ли доставлено}. Чаты из skip_chat_ids
+    пропускаются (уже получили уведомление при предыдущей попытке).
+    """
     school = message_obj.school
     site_domain = getattr(settings, 'SITE_DOMAIN', '127.0.0.1:8000')
     protocol = 'https' if not settings.DEBUG else 'http'
@@ -50,33 +117,157 @@ def notify_admins_about_message(message_obj):
         ]
     }
     
-    # Уведомление учителям по школе (только если сообщение для конкретной школы)
-    if school:
-        teachers = User.objects.filter(role=User.TEACHER, school=school, is_active=True)
-        for teacher in teachers:
-            if hasattr(teacher, 'telegram_chat_id') and teacher.telegram_chat_id:
-                send_telegram_message(
-                    teacher.telegram_chat_id, 
-                    message_text,
-                    reply_markup=inline_keyboard
-                )
+    # Учителя школы, районный отдел и супер-админы - одним запросом
+    chat_ids = get_recipient_chat_ids(school) - set(skip_chat_ids)
+    results = broadcast_telegram_message(chat_ids, message_text, reply_markup=inline_keyboard)
+    
+    failed = [chat_id for chat_id, ok in results.items() if not ok]
+    logger.info(
+        f"Уведомление о сообщении #{message_obj.id}: доставлено {len(results) - len(failed)} "
+        f"из {len(results)}" + (f", ошибки в чатах: {', '.join(failed)}" if failed else '')
+    )
+    return results
+
+def enqueue_message_notification(message_obj, recaptcha_token=''):
+    """Постановка уведомления о сообщении в очередь.
+
+    Вызывается внутри транзакции, создающей сообщение: доставку выполняет
+    команда run_notifier, поэтому отправка формы не ждет Telegram. Для
+    отложенной проверки reCAPTCHA в записи сохраняется токен.
+    """
+    return NotificationOutbox.objects.create(message=message_obj, recaptcha_token=recaptcha_token)
+
+def _verify_deferred_message(entry):
+    """Отложенная проверка reCAPTCHA перед рассылкой.
+
+    Возвращает True, если сообщение прошло проверку, False - если отклонено
+    (помечается как спам), None - если Google недоступен и проверку нужно
+    повторить позже. Истекший токен (очередь не успела за RECAPTCHA_TOKEN_TTL)
+    ничего не говорит об отправителе: сообщение рассылается без оценки.
+    """
+    message = entry.message
+    result = check_recaptcha(entry.recaptcha_token)
+    if not result['available'] and timezone.now() - entry.created_at < RECAPTCHA_TOKEN_TTL:
+        return None
+    
+    if result.get('expired'):
+        logger.warning(f"Токен reCAPTCHA сообщения #{message.id} истек до проверки, сообщение не проверено")
+        message.verification_pending = False
+        message.save(update_fields=['verification_pending', 'updated_at'])
+        entry.recaptcha_token = ''
+        return True
+    
+    passed = result['passed'] if result['available'] else RECAPTCHA_FAILURE_POLICY == 'allow'
+    message.verification_pending = False
+    # updated_at: смена статуса должна попасть в инкрементальную rollup_stats
+    update_fields = ['verification_pending', 'updated_at']
+    if result['available']:
+        for field, value in recaptcha_fields(result).items():
+            setattr(message, field, value)
+            update_fields.append(field)
+    if not passed:
+        message.status = Message.STATUS_SPAM
+        update_fields.append('status')
+    message.save(update_fields=update_fields)
+    
+    entry.recaptcha_token = ''
+    return passed
+
+def _retry_delay(attempts):
+    """Экспоненциальная задержка перед повторной попыткой"""
+    return timedelta(seconds=min(OUTBOX_RETRY_BASE * 2 ** max(attempts - 1, 0), OUTBOX_RETRY_MAX))
+
+def _claim_outbox_entry(entry):
+    """Захват записи очереди на время доставки.
+
+    Запись остается в статусе pending, но следующая попытка откладывается на
+    OUTBOX_LEASE: если процесс упадет во время отправки, запись будет подхвачена
+    снова после истечения аренды.
+    """
+    claimed = NotificationOutbox.objects.filter(
+        pk=entry.pk,
+        status=NotificationOutbox.STATUS_PENDING,
+        next_attempt_at=entry.next_attempt_at,
+    ).update(
+        next_attempt_at=timezone.now() + timedelta(seconds=OUTBOX_LEASE),
+        attempts=F('attempts') + 1,
+    )
+    if claimed:
+        entry.attempts += 1
+    return bool(claimed)
+
+def deliver_outbox_entry(entry):
+    """Доставка одной записи очереди. Возвращает итоговый статус записи."""
+    if entry.message.verification_pending:
+        verified = _verify_deferred_message(entry)
+        if verified is None:
+            entry.next_attempt_at = timezone.now() + _retry_delay(1)
+            entry.last_error = 'reCAPTCHA недоступна, проверка отложена'
+            entry.save(update_fields=['next_attempt_at', 'last_error'])
+            return entry.status
+        if not verified:
+            entry.status = NotificationOutbox.STATUS_SKIPPED
+            entry.last_error = 'Сообщение не прошло проверку reCAPTCHA'
+            entry.save(update_fields=['status', 'last_error', 'recaptcha_token'])
+            return entry.status
     
-    # Уведомление районному отделу по всем школам
-    rayon_admins = User.objects.filter(role=User.RAYON_OTDEL, is_active=True)
-    for admin in rayon_admins:
-        if hasattr(admin, 'telegram_chat_id') and admin.telegram_chat_id:
-            send_telegram_message(
-                admin.telegram_chat_id, 
-                message_text,
-                reply_markup=inline_keyboard
-            )
+    if entry.message.duplicate_of_id:
+        # Дубликаты видны в панели, но не рассылаются повторно
+        entry.status = NotificationOutbox.STATUS_SKIPPED
+        entry.last_error = f'Дубликат сообщения #{entry.message.duplicate_of_id}'
+        entry.save(update_fields=['status', 'last_error', 'recaptcha_token'])
+        return entry.status
     
-    # Уведомление супер-админов
-    super_admins = User.objects.filter(role=User.SUPER_ADMIN, is_active=True)
-    for admin in super_admins:
-        if hasattr(admin, 'telegram_chat_id') and admin.telegram_chat_id:
-            send_telegram_message(
-                admin.telegram_chat_id, 
-                message_text,
-                reply_markup=inline_keyboard
-            )
+    try:
+        results = notify_admins_about_message(entry.message, skip_chat_ids=entry.delivered_chat_ids)
+        error = ''
+    except Exception as e:
+        logger.exception(f"Ошибка рассылки уведомления #{entry.id}: {e}")
+        results = {}
+        error = str(e)
+    
+    delivered = list(entry.delivered_chat_ids) + [chat_id for chat_id, ok in results.items() if ok]
+    failed = [chat_id for chat_id, ok in results.items() if not ok]
+    if failed:
+        error = f"Не доставлено в чаты: {', '.join(failed)}"
+    
+    entry.delivered_chat_ids = delivered
+    entry.last_error = error
+    if not error:
+        entry.status = NotificationOutbox.STATUS_SENT
+        entry.sent_at = timezone.now()
+    elif entry.attempts >= OUTBOX_MAX_ATTEMPTS:
+        entry.status = NotificationOutbox.STATUS_FAILED
+        logger.error(f"Уведомление #{entry.id} не доставлено после {entry.attempts} попыток: {error}")
+    else:
+        # Чат, заблокированный Telegram (429 с долгим retry_after), повторяется после блокировки
+        blocked = max((rate_limiter.wait_time(chat_id) for chat_id in failed), default=0)
+        entry.next_attempt_at = timezone.now() + max(_retry_delay(entry.attempts), timedelta(seconds=blocked))
+    entry.save(update_fields=['status', 'delivered_chat_ids', 'last_error', 'sent_at', 'next_attempt_at', 'recaptcha_token'])
+    return entry.status
+
+def process_notification_outbox(batch_size=OUTBOX_BATCH_SIZE):
+    """Обработка готовых к отправке записей очереди.
+
+    Возвращает словарь со счетчиками по итоговым статусам записей.
+    """
+    stats = {
+        'processed': 0,
+        NotificationOutbox.STATUS_SENT: 0,
+        NotificationOutbox.STATUS_FAILED: 0,
+        NotificationOutbox.STATUS_SKIPPED: 0,
+        'retry': 0,
+    }
+    due = list(
+        NotificationOutbox.objects.select_related('message', 'message__school').filter(
+            status=NotificationOutbox.STATUS_PENDING,
+            next_attempt_at__lte=timezone.now(),
+        ).order_by('next_attempt_at')[:batch_size]
+    )
+    for entry in due:
+        if not _claim_outbox_entry(entry):
+            continue
+        status = deliver_outbox_entry(entry)
+        stats['processed'] += 1
+        stats[status if status != NotificationOutbox.STATUS_PENDING else 'retry'] += 1
+    return stats
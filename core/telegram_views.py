@@ -7,6 +7,7 @@ from django.utils.decorators import method_decorator
 from django.views import View
 from django.conf import settings
 from .telegram_bot import bot_handler
+from .telegram_client import get_telegram_client
 
 logger = logging.getLogger(__name__)
 
@@ -57,8 +58,6 @@ class TelegramWebhookView(View):
 def set_webhook(request):
     """Установка webhook для Telegram бота"""
     try:
-        import requests
-        
         webhook_url = settings.TELEGRAM_WEBHOOK_URL
         if not webhook_url:
             return JsonResponse({
@@ -74,13 +73,12 @@ def set_webhook(request):
             }, status=400)
         
         # Устанавливаем webhook
-        url = f"https://api.telegram.org/bot{bot_token}/setWebhook"
         data = {
             'url': webhook_url,
             'allowed_updates': ['message', 'callback_query']
         }
         
-        response = requests.post(url, data=data, timeout=10)
+        response = get_telegram_client().post('setWebhook', data)
         response.raise_for_status()
         
         result = response.json()
@@ -109,8 +107,6 @@ def set_webhook(request):
 def get_webhook_info(request):
     """Получение информации о webhook"""
     try:
-        import requests
-        
         bot_token = settings.TELEGRAM_BOT_TOKEN
         if not bot_token:
             return JsonResponse({
@@ -119,8 +115,7 @@ def get_webhook_info(request):
             }, status=400)
         
         # Получаем информацию о webhook
-        url = f"https://api.telegram.org/bot{bot_token}/getWebhookInfo"
-        response = requests.get(url, timeout=10)
+        response = get_telegram_client().get('getWebhookInfo')
         response.raise_for_status()
         
         result = response.json()
@@ -1,3 +1,797 @@
-from django.test import TestCase
+import gzip
+import io
+import re
+import tempfile
+import time
+from datetime import date, datetime, time as day_time, timedelta
+from unittest import mock
+import requests
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core import signing
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.test import Client, TestCase, override_settings
+from django.utils import timezone
+from dashboard.counters import rebuild_counters, update_status
+from dashboard.models import InternalComment, Message, MessageDailyStat
+from dashboard.rollup import run_rollup
+from .content import get_page
+from .content_render import render_content
+from .db_router import _current_state
+from .models import EditablePage, NotificationOutbox, School, User
+from .page_cache import CONTENT_PAGES, CSRF_PLACEHOLDER
+from .recaptcha_utils import CircuitBreaker, check_recaptcha
+from .school_cache import get_school_by_code
+from .static_export import export_site, output_file, verify_site
+from .stats import SCOPE_ALL, SCOPE_GENERAL, get_message_stats
+from .telegram_bot import TelegramBot, TelegramBotHandler
+from .telegram_client import TelegramClient, get_telegram_client
+from .telegram_ratelimit import RateLimitDeferred, TelegramRateLimiter, TokenBucket
+from .telegram_utils import (
+    _claim_outbox_entry, broadcast_telegram_message, deliver_outbox_entry, get_recipient_chat_ids,
+    notify_admins_about_message, process_notification_outbox,
+)
+from .throttling import SlidingWindowLimiter, THROTTLE_CACHE_ALIAS, get_client_ip, get_throttle_hits
+from .views import SEND_MESSAGE_TOKEN_SALT, _make_step_token
 
-# Create your tests here.
+
+class ContentRenderTests(TestCase):
+    """Очистка HTML страниц по белому списку и оглавление"""
+
+    def test_nested_removed_and_unknown_tags(self):
+        cases = {
+            '<form><custom>x</custom></form><p>ok</p>': '<p>ok</p>',
+            '<iframe><p>внутри</p></iframe><p>после</p>': '<p>после</p>',
+            '<object><embed src="x"></object>': '',
+            '<custom><other><p onclick="x()">текст</p></other></custom>': '<p>текст</p>',
+            '<div><script>alert(1)</script><span>a</span></div>': '<div><span>a</span></div>',
+        }
+        for source, expected in cases.items():
+            with self.subTest(source=source):
+                self.assertEqual(render_content(source)[0], expected)
+
+    def test_unsafe_links_and_toc(self):
+        html, toc = render_content('<h2>Раздел</h2><h2>Раздел</h2><a href="javascript:alert(1)">x</a>')
+        self.assertNotIn('javascript', html)
+        self.assertEqual([item['id'] for item in toc], ['раздел', 'раздел-2'])
+
+    @override_settings(SITE_DOMAIN='anonim-m.online')
+    def test_attributes_comments_and_links(self):
+        html, _ = render_content(
+            '<!-- заметка --><p style="color:red" class="lead" onclick="x()">a</p>'
+            '<img src="/media/a.png" onerror="x()">'
+            '<a href="https://anonim-m.online/faq/?q=1">свой</a><a href="https://example.com">чужой</a>'
+        )
+        self.assertEqual(html, (
+            '<p class="lead">a</p><img src="/media/a.png"/>'
+            '<a href="/faq/?q=1">свой</a>'
+            '<a href="https://example.com" rel="noopener noreferrer" target="_blank">чужой</a>'
+        ))
+
+    def test_toc_levels_saved_with_page(self):
+        page = EditablePage.objects.create(
+            page='faq', language='ru', title='FAQ',
+            content='<h2 id="start">Начало</h2><h3>Шаг 1</h3><h5>Мелкий</h5><h4> </h4>',
+        )
+        self.assertEqual(page.toc, [
+            {'id': 'start', 'title': 'Начало', 'level': 2},
+            {'id': 'шаг-1', 'title': 'Шаг 1', 'level': 3},
+        ])
+        self.assertIn('<h3 id="шаг-1">', page.rendered_html)
+
+    def test_page_save_with_nested_removed_tags(self):
+        page = EditablePage.objects.create(page='faq', language='ru', title='FAQ', content='<form><custom>x</custom></form><p>ok</p>')
+        self.assertEqual(page.rendered_html, '<p>ok</p>')
+
+
+class PageContentTests(TestCase):
+    """Чтение страниц через общий кэш: правка видна сразу"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_default_then_edit(self):
+        self.assertTrue(get_page('faq', 'ru').is_default)
+        page = EditablePage.objects.create(page='faq', language='ru', title='FAQ', content='<p>первая</p>')
+        self.assertEqual(get_page('faq', 'ru').rendered_html, '<p>первая</p>')
+
+        page.content = '<p>вторая</p>'
+        page.save()
+        self.assertEqual(get_page('faq', 'ru').rendered_html, '<p>вторая</p>')
+        # Повторное чтение идет из общего кэша без запросов к БД
+        with self.assertNumQueries(0):
+            self.assertEqual(get_page('faq', 'ru').title, 'FAQ')
+
+    def test_reads_do_not_write_defaults(self):
+        self.assertEqual(self.client.get('/about/').status_code, 200)
+        self.assertFalse(EditablePage.objects.exists())
+        # Отсутствие страницы тоже кэшируется
+        with self.assertNumQueries(0):
+            self.assertTrue(get_page('about', 'ru').is_default)
+
+    def test_delete_returns_default(self):
+        page = EditablePage.objects.create(page='about', language='ky', title='Долбоор', content='<p>текст</p>')
+        self.assertFalse(get_page('about', 'ky').is_default)
+        page.delete()
+        self.assertTrue(get_page('about', 'ky').is_default)
+
+
+class StatsTimeseriesTests(TestCase):
+    """JSON динамики сообщений из MessageDailyStat"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rayon = User.objects.create_user('stats_rayon', password='pw', role=User.RAYON_OTDEL)
+
+    def test_invalid_dates_return_400(self):
+        self.client.force_login(self.rayon)
+        for query in ('to=2024-02-30', 'from=2024-13-01', 'period=year'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/staff/stats/timeseries/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()['success'])
+        self.assertEqual(self.client.get('/staff/stats/timeseries/?from=2024-02-01&to=2024-02-29').status_code, 200)
+
+    def _message_on(self, day, **fields):
+        message = Message.objects.create(problem='Текст', help='', **fields)
+        created_at = timezone.make_aware(datetime.combine(day, day_time(12)))
+        Message.objects.filter(pk=message.pk).update(created_at=created_at)
+        message.refresh_from_db()
+        return message
+
+    def test_incremental_rollup(self):
+        today = timezone.localdate()
+        old_day, day = today - timedelta(days=40), today - timedelta(days=2)
+        old = self._message_on(old_day)
+        self._message_on(day)
+        self.assertEqual(run_rollup(), [old_day, day])
+        self.assertEqual(run_rollup(), [])
+
+        # Удаление отмечает день, смена статуса попадает по updated_at
+        recent = self._message_on(day)
+        old.delete()
+        self.assertEqual(run_rollup(), [old_day, day])
+        recent.status = Message.STATUS_RESOLVED
+        recent.save()
+        self.assertEqual(run_rollup(), [day])
+        self.assertEqual(
+            sorted(MessageDailyStat.objects.values_list('date', 'status', 'count')),
+            [(day, Message.STATUS_NEW, 1), (day, Message.STATUS_RESOLVED, 1)],
+        )
+
+    def test_series_grouping_and_teacher_scope(self):
+        school = School.objects.create(name='Школа', unique_code='series1')
+        teacher = User.objects.create_user('series_teacher', password='pw', role=User.TEACHER, school=school)
+        self._message_on(date(2024, 3, 5), school=school)
+        self._message_on(date(2024, 3, 20), school=school, status=Message.STATUS_SPAM)
+        self._message_on(date(2024, 4, 1))
+        run_rollup(full=True)
+
+        url = '/staff/stats/timeseries/?from=2024-01-01&to=2024-12-31&period=month&by=status'
+        self.client.force_login(self.rayon)
+        self.assertEqual(self.client.get(url).json()['series'], [
+            {'period': '2024-03-01', 'count': 1, 'status': Message.STATUS_NEW},
+            {'period': '2024-03-01', 'count': 1, 'status': Message.STATUS_SPAM},
+            {'period': '2024-04-01', 'count': 1, 'status': Message.STATUS_NEW},
+        ])
+        self.client.force_login(teacher)
+        self.assertEqual([item['period'] for item in self.client.get(url).json()['series']], ['2024-03-01', '2024-03-01'])
+
+    def test_deferred_spam_reaches_rollup(self):
+        school = School.objects.create(name='Школа', unique_code='rollup1')
+        message = Message.objects.create(problem='Текст', help='', school=school, verification_pending=True)
+        entry = NotificationOutbox.objects.create(message=message, recaptcha_token='token')
+        run_rollup(full=True)
+
+        rejected = {'passed': False, 'available': True, 'score': 0.1, 'action': 'send_message', 'latency_ms': 5}
+        with mock.patch('core.telegram_utils.check_recaptcha', return_value=rejected):
+            self.assertEqual(deliver_outbox_entry(entry), NotificationOutbox.STATUS_SKIPPED)
+
+        self.assertEqual(run_rollup(), [timezone.localdate(message.created_at)])
+        self.assertEqual(list(MessageDailyStat.objects.values_list('status', 'count')), [(Message.STATUS_SPAM, 1)])
+
+
+class DeferredVerificationTests(TestCase):
+    """Отложенная проверка reCAPTCHA в run_notifier"""
+
+    def setUp(self):
+        self.message = Message.objects.create(problem='Текст', help='', verification_pending=True)
+        self.entry = NotificationOutbox.objects.create(message=self.message, recaptcha_token='token')
+
+    def test_expired_token_is_delivered_unverified(self):
+        expired = {'passed': False, 'available': True, 'expired': True, 'score': None, 'action': '', 'latency_ms': 5}
+        with mock.patch('core.telegram_utils.check_recaptcha', return_value=expired), \
+                mock.patch('core.telegram_utils.notify_admins_about_message', return_value={'1': True}) as notify:
+            self.assertEqual(deliver_outbox_entry(self.entry), NotificationOutbox.STATUS_SENT)
+        notify.assert_called_once()
+
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.status, Message.STATUS_NEW)
+        self.assertFalse(self.message.verification_pending)
+        self.assertIsNone(self.message.recaptcha_score)
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.recaptcha_token, '')
+
+    @override_settings(RECAPTCHA_PRIVATE_KEY='secret')
+    def test_check_recaptcha_reports_expired_token(self):
+        response = mock.Mock()
+        response.json.return_value = {'success': False, 'error-codes': ['timeout-or-duplicate']}
+        with mock.patch('core.recaptcha_utils._get_session') as session:
+            session.return_value.post.return_value = response
+            result = check_recaptcha('token')
+        self.assertTrue(result['available'])
+        self.assertTrue(result['expired'])
+        self.assertFalse(result['passed'])
+
+
+class SubmitThrottleCacheTests(TestCase):
+    """Счетчики лимитов хранятся в отдельном кэше"""
+
+    def test_counters_survive_default_cache_clear(self):
+        caches[THROTTLE_CACHE_ALIAS].clear()
+        limiter = SlidingWindowLimiter('test', 2, 600)
+        self.assertTrue(limiter.allow('ip'))
+        self.assertTrue(limiter.allow('ip'))
+        cache.clear()
+        self.assertFalse(limiter.allow('ip'))
+
+
+@override_settings(RECAPTCHA_PRIVATE_KEY='')
+class SubmitThrottleTests(TestCase):
+    """Лимит отправки по IP расходуют только заполненные формы"""
+
+    def setUp(self):
+        caches[THROTTLE_CACHE_ALIAS].clear()
+        self.url = '/send/general/?step=2'
+        self.token = _make_step_token('general', Message.PROBLEM_TYPE_BULLYING)
+
+    def post(self, **data):
+        return self.client.post(self.url, {'token': self.token, **data}, REMOTE_ADDR='10.0.0.1')
+
+    @mock.patch.dict('core.throttling.SUBMIT_RATE_LIMITS', {'ip': (2, 600), 'school': None})
+    def test_invalid_submits_do_not_count(self):
+        for _ in range(5):
+            self.assertEqual(self.post(problem='', help='').status_code, 200)
+        for number in range(2):
+            self.assertEqual(self.post(problem=f'Проблема {number}', help='Помощь').status_code, 302)
+        response = self.post(problem='Еще одна', help='Помощь')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(Message.objects.count(), 2)
+
+    @mock.patch.dict('core.throttling.SUBMIT_RATE_LIMITS', {'ip': None, 'school': (2, 600)})
+    def test_school_limit_across_ips(self):
+        for number in range(2):
+            response = self.client.post(self.url, {'token': self.token, 'problem': f'Текст {number}', 'help': 'Помощь'},
+                REMOTE_ADDR=f'10.0.0.{number}')
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.post(problem='Текст', help='Помощь').status_code, 429)
+        self.assertEqual(get_throttle_hits()['school'], 1)
+
+    @mock.patch.dict('core.throttling.SUBMIT_RATE_LIMITS', {'ip': (1, 600), 'school': None})
+    def test_throttled_submit_skips_school_lookup(self):
+        school = School.objects.create(name='Школа', unique_code='thr1')
+        url = '/send/thr1/?step=2'
+        data = {'token': _make_step_token('thr1', Message.PROBLEM_TYPE_BULLYING), 'problem': 'Текст', 'help': 'Помощь'}
+        self.assertEqual(self.client.post(url, data, REMOTE_ADDR='10.0.0.1').status_code, 302)
+        with mock.patch('core.views.get_school_by_code', return_value=school) as lookup:
+            self.assertEqual(self.client.post(url, data, REMOTE_ADDR='10.0.0.1').status_code, 429)
+        lookup.assert_not_called()
+
+    def test_sliding_window_weights_previous_window(self):
+        limiter = SlidingWindowLimiter('test', 10, 100)
+        with mock.patch('core.throttling.time.time', return_value=1000.0):
+            for _ in range(10):
+                self.assertTrue(limiter.allow('ip'))
+            self.assertFalse(limiter.allow('ip'))
+        # Четверть следующего окна: 10 * 0.75 = 7.5 из предыдущего, свободно еще 2
+        with mock.patch('core.throttling.time.time', return_value=1125.0):
+            self.assertTrue(limiter.allow('ip'))
+            self.assertTrue(limiter.allow('ip'))
+            self.assertFalse(limiter.allow('ip'))
+
+    def test_client_ip(self):
+        request = mock.Mock(META={'REMOTE_ADDR': '172.18.0.2', 'HTTP_X_FORWARDED_FOR': '1.1.1.1, 2.2.2.2'})
+        self.assertEqual(get_client_ip(request), '172.18.0.2')
+        with override_settings(SUBMIT_TRUST_X_FORWARDED_FOR=True):
+            self.assertEqual(get_client_ip(request), '2.2.2.2')
+
+
+class BotPrimaryPinTests(TestCase):
+    """После записи следующие обновления чата читают из основной БД"""
+
+    def test_pin_survives_next_update(self):
+        handler = TelegramBotHandler()
+        pinned = []
+
+        def process(message):
+            pinned.append(_current_state().pinned)
+            if message['text'] == 'write':
+                School.objects.create(name='Школа', unique_code=f'pin{len(pinned)}')
+
+        def update(chat_id, text):
+            return {'message': {'chat': {'id': chat_id}, 'text': text}}
+
+        with mock.patch.object(handler, 'process_message', side_effect=process):
+            handler.process_update(update(1, 'read'))
+            handler.process_update(update(1, 'write'))
+            handler.process_update(update(1, 'read'))
+            handler.process_update(update(2, 'read'))
+            with mock.patch('core.telegram_bot.time.monotonic', return_value=time.monotonic() + 60):
+                handler.process_update(update(1, 'read'))
+        self.assertEqual(pinned, [False, False, True, False, False])
+
+
+class BotBulkActionTests(TestCase):
+    """Массовые действия в боте: /bulk и смена статуса страницы"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rayon = User.objects.create_user('bulk_rayon', password='pw', role=User.RAYON_OTDEL, telegram_chat_id='42')
+        cls.messages = [Message.objects.create(problem=f'Текст {i}', help='') for i in range(3)]
+
+    def setUp(self):
+        self.handler = TelegramBotHandler()
+        self.handler.bot = mock.Mock()
+        self.ids = [message.id for message in self.messages]
+
+    def statuses(self):
+        return list(Message.objects.filter(id__in=self.ids).order_by('id').values_list('status', flat=True))
+
+    def test_comment_follows_separator(self):
+        first, second, third = self.ids
+        self.handler.handle_bulk_command(42, f'/bulk spam {first}, {second} -- пришло {third} раза')
+        self.assertEqual(self.statuses(), [Message.STATUS_SPAM, Message.STATUS_SPAM, Message.STATUS_NEW])
+        self.assertEqual(InternalComment.objects.filter(text=f'пришло {third} раза').count(), 2)
+
+    def test_text_without_separator_is_rejected(self):
+        self.handler.handle_bulk_command(42, f'/bulk spam {self.ids[0]} {self.ids[1]} раза')
+        self.assertEqual(self.statuses(), [Message.STATUS_NEW] * 3)
+        self.assertIn('Неверный номер', self.handler.bot.send_message.call_args[0][1])
+
+    def test_page_status_needs_confirmation(self):
+        self.handler.bulk_selections[42] = self.ids
+        self.handler.confirm_bulk_page_status(42, 'bulk_set_spam', 1, 'q')
+        self.assertEqual(self.statuses(), [Message.STATUS_NEW] * 3)
+        keyboard = self.handler.bot.edit_message.call_args[0][3]
+        self.assertEqual(keyboard['inline_keyboard'][0][0]['callback_data'], 'bulk_confirm_spam')
+
+        self.handler.handle_bulk_page_status(42, 'bulk_confirm_spam', self.rayon, 1, 'q')
+        self.assertEqual(self.statuses(), [Message.STATUS_SPAM] * 3)
+        self.assertNotIn(42, self.handler.bulk_selections)
+
+
+@override_settings(RECAPTCHA_PRIVATE_KEY='')
+class NotificationOutboxTests(TestCase):
+    """Очередь уведомлений: отправка формы не ждет Telegram, run_notifier повторяет доставку"""
+
+    def setUp(self):
+        caches[THROTTLE_CACHE_ALIAS].clear()
+
+    def test_submit_only_enqueues(self):
+        token = _make_step_token('general', Message.PROBLEM_TYPE_BULLYING)
+        with mock.patch('core.telegram_utils.notify_admins_about_message') as notify:
+            response = self.client.post('/send/general/?step=2', {'token': token, 'problem': 'Текст', 'help': 'Помощь'})
+        self.assertRedirects(response, '/message-sent/', fetch_redirect_response=False)
+        notify.assert_not_called()
+        entry = NotificationOutbox.objects.get()
+        self.assertEqual(entry.status, NotificationOutbox.STATUS_PENDING)
+        self.assertEqual(entry.message.problem, 'Текст')
+
+    def test_partial_delivery_is_retried_for_failed_chats(self):
+        entry = NotificationOutbox.objects.create(message=Message.objects.create(problem='Текст', help=''))
+        with mock.patch('core.telegram_utils.notify_admins_about_message', return_value={'1': True, '2': False}):
+            stats = process_notification_outbox()
+        self.assertEqual((stats['processed'], stats['retry']), (1, 1))
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, NotificationOutbox.STATUS_PENDING)
+        self.assertEqual((entry.attempts, entry.delivered_chat_ids), (1, ['1']))
+        self.assertGreater(entry.next_attempt_at, timezone.now())
+
+        # Запись еще не готова к повтору: второй запуск ее не трогает
+        self.assertEqual(process_notification_outbox()['processed'], 0)
+
+        NotificationOutbox.objects.filter(pk=entry.pk).update(next_attempt_at=timezone.now())
+        with mock.patch('core.telegram_utils.notify_admins_about_message', return_value={'2': True}) as notify:
+            self.assertEqual(process_notification_outbox()[NotificationOutbox.STATUS_SENT], 1)
+        self.assertEqual(notify.call_args.kwargs['skip_chat_ids'], ['1'])
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.delivered_chat_ids), (NotificationOutbox.STATUS_SENT, ['1', '2']))
+
+    def test_duplicate_is_not_broadcast(self):
+        original = Message.objects.create(problem='Текст', help='')
+        entry = NotificationOutbox.objects.create(message=Message.objects.create(problem='Текст', help='', duplicate_of=original))
+        with mock.patch('core.telegram_utils.notify_admins_about_message') as notify:
+            self.assertEqual(deliver_outbox_entry(entry), NotificationOutbox.STATUS_SKIPPED)
+        notify.assert_not_called()
+
+    def test_claim_is_exclusive(self):
+        entry = NotificationOutbox.objects.create(message=Message.objects.create(problem='Текст', help=''))
+        stale = NotificationOutbox.objects.get(pk=entry.pk)
+        self.assertTrue(_claim_outbox_entry(entry))
+        self.assertFalse(_claim_outbox_entry(stale))
+
+    def test_gives_up_after_max_attempts(self):
+        entry = NotificationOutbox.objects.create(message=Message.objects.create(problem='Текст', help=''), attempts=11)
+        with mock.patch('core.telegram_utils.OUTBOX_MAX_ATTEMPTS', 12), \
+                mock.patch('core.telegram_utils.notify_admins_about_message', side_effect=RuntimeError('сеть')), \
+                self.assertLogs('core.telegram_utils', 'ERROR'):
+            self.assertEqual(process_notification_outbox()[NotificationOutbox.STATUS_FAILED], 1)
+        self.assertEqual(NotificationOutbox.objects.get(pk=entry.pk).last_error, 'сеть')
+
+
+class RecipientFanOutTests(TestCase):
+    """Получатели уведомления одним запросом и параллельная рассылка"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name='Школа', unique_code='fan1')
+        other = School.objects.create(name='Другая школа', unique_code='fan2')
+        User.objects.create_user('fan_teacher', role=User.TEACHER, school=cls.school, telegram_chat_id='1')
+        User.objects.create_user('fan_other', role=User.TEACHER, school=other, telegram_chat_id='2')
+        User.objects.create_user('fan_rayon', role=User.RAYON_OTDEL, telegram_chat_id='3')
+        # Тот же чат у второй учетной записи - одно уведомление
+        User.objects.create_user('fan_admin', role=User.SUPER_ADMIN, telegram_chat_id='3')
+        User.objects.create_user('fan_inactive', role=User.RAYON_OTDEL, telegram_chat_id='4', is_active=False)
+        User.objects.create_user('fan_no_chat', role=User.RAYON_OTDEL, telegram_chat_id='')
+
+    def test_recipients_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_recipient_chat_ids(self.school), {'1', '3'})
+        self.assertEqual(get_recipient_chat_ids(None), {'3'})
+
+    def test_broadcast_skips_delivered_chats(self):
+        message = Message.objects.create(problem='Текст', help='', school=self.school)
+        with mock.patch('core.telegram_utils.TELEGRAM_BOT_TOKEN', 'token'), \
+                mock.patch('core.telegram_utils.TelegramBot'), \
+                mock.patch('core.telegram_utils.send_telegram_message', side_effect=lambda chat_id, *args, **kwargs: chat_id != '3') as send:
+            self.assertEqual(notify_admins_about_message(message, skip_chat_ids=['1']), {'3': False})
+            self.assertEqual(broadcast_telegram_message(['1', '3'], 'текст'), {'1': True, '3': False})
+        self.assertEqual(send.call_count, 3)
+
+
+class TelegramRateLimitTests(TestCase):
+    """Корзины токенов и обработка ответа 429 от Telegram"""
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=1, capacity=3)
+        bucket.updated_at = 0.0
+        for _ in range(3):
+            self.assertEqual(bucket.wait_time(0.0), 0.0)
+            bucket.consume()
+        self.assertEqual(bucket.wait_time(0.0), 1.0)
+        self.assertEqual(bucket.wait_time(0.5), 0.5)
+        bucket.block(0.5, 10)
+        self.assertEqual(bucket.wait_time(1.0), 9.5)
+        self.assertFalse(bucket.is_idle(5.0))
+        self.assertTrue(bucket.is_idle(20.0))
+
+    def test_penalize_blocks_only_that_chat(self):
+        limiter = TelegramRateLimiter()
+        limiter.penalize('1', 30)
+        self.assertEqual(limiter.acquire('2'), 0.0)
+        now = time.monotonic()
+        self.assertAlmostEqual(limiter.chat_buckets['1'].wait_time(now), 30, delta=1)
+        self.assertEqual(limiter.global_bucket.wait_time(now), 0.0)
+        self.assertEqual(limiter.get_stats()['rate_limited'], 1)
+
+    def make_bot(self, *responses):
+        bot = TelegramBot()
+        bot.client = mock.Mock()
+        bot.client.post.side_effect = [
+            mock.Mock(status_code=status, json=mock.Mock(return_value=payload)) for status, payload in responses
+        ]
+        return bot
+
+    @mock.patch('core.telegram_bot.time.sleep')
+    def test_retry_after_is_honoured(self, sleep):
+        limiter = TelegramRateLimiter()
+        bot = self.make_bot((429, {'ok': False, 'parameters': {'retry_after': 3}}), (200, {'ok': True}))
+        with mock.patch('core.telegram_bot.rate_limiter', limiter):
+            self.assertTrue(bot.answer_callback_query('q'))
+        sleep.assert_called_once_with(3)
+        self.assertEqual((limiter.get_stats()['rate_limited'], limiter.get_stats()['retries']), (1, 1))
+
+    @mock.patch('core.telegram_bot.time.sleep')
+    @mock.patch('core.telegram_ratelimit.time.sleep')
+    def test_long_retry_after_is_left_to_caller(self, limiter_sleep, sleep):
+        limiter = TelegramRateLimiter()
+        bot = self.make_bot((429, {'ok': False, 'parameters': {'retry_after': 600}}))
+        with mock.patch('core.telegram_bot.rate_limiter', limiter):
+            self.assertFalse(bot.send_message(1, 'текст'))
+            # Следующая отправка в заблокированный чат не ждет 10 минут
+            self.assertFalse(bot.send_message(1, 'текст'))
+        sleep.assert_not_called()
+        limiter_sleep.assert_not_called()
+        self.assertEqual(bot.client.post.call_count, 1)
+        self.assertAlmostEqual(limiter.wait_time('1'), 600, delta=1)
+        with self.assertRaises(RateLimitDeferred):
+            limiter.acquire('1')
+        self.assertEqual(limiter.get_stats()['deferred'], 2)
+
+    def test_outbox_waits_for_blocked_chat(self):
+        limiter = TelegramRateLimiter()
+        limiter.penalize('2', 600)
+        entry = NotificationOutbox.objects.create(message=Message.objects.create(problem='Текст', help=''))
+        with mock.patch('core.telegram_utils.rate_limiter', limiter), \
+                mock.patch('core.telegram_utils.notify_admins_about_message', return_value={'1': True, '2': False}):
+            deliver_outbox_entry(entry)
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, NotificationOutbox.STATUS_PENDING)
+        self.assertGreater(entry.next_attempt_at, timezone.now() + timedelta(seconds=590))
+
+
+class TelegramClientTests(TestCase):
+    """Общий для процесса клиент Telegram API"""
+
+    @mock.patch('core.telegram_client._client', None)
+    def test_one_client_per_process(self):
+        client = get_telegram_client()
+        self.assertIs(get_telegram_client(), client)
+        self.assertIs(TelegramBot().client, TelegramBot().client)
+        self.assertIs(TelegramBot().client, client)
+
+    def test_pool_and_latency_stats(self):
+        client = TelegramClient('token', pool_size=4)
+        self.assertEqual(client.session.get_adapter('https://api.telegram.org')._pool_maxsize, 4)
+        with mock.patch.object(client.session, 'post', side_effect=[mock.Mock(status_code=200), mock.Mock(status_code=400)]):
+            client.post('sendMessage', {'chat_id': 1})
+            client.post('sendMessage', {'chat_id': 1})
+        stats = client.get_stats()['sendMessage']
+        self.assertEqual((stats['calls'], stats['errors']), (2, 1))
+
+
+@override_settings(RECAPTCHA_PRIVATE_KEY='secret')
+class RecaptchaBreakerTests(TestCase):
+    """Предохранитель и политика при недоступности Google"""
+
+    def test_breaker_states(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=60)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+        with self.assertLogs('core.recaptcha_utils', 'WARNING'):
+            breaker.record_failure()
+        self.assertFalse(breaker.allow_request())
+        with mock.patch('core.recaptcha_utils.time.monotonic', return_value=time.monotonic() + 61):
+            # half-open: один пробный запрос после паузы
+            self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+
+    def test_open_breaker_skips_google(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=60)
+        with mock.patch('core.recaptcha_utils.breaker', breaker), \
+                mock.patch('core.recaptcha_utils._get_session') as session, \
+                self.assertLogs('core.recaptcha_utils', 'WARNING'):
+            session.return_value.post.side_effect = requests.Timeout()
+            result = check_recaptcha('token')
+            self.assertEqual((result['available'], result['passed']), (False, False))
+            self.assertTrue(breaker.is_open)
+
+            with mock.patch('core.recaptcha_utils.RECAPTCHA_FAILURE_POLICY', 'allow'):
+                result = check_recaptcha('token')
+            self.assertEqual((result['available'], result['passed']), (False, True))
+        self.assertEqual(session.return_value.post.call_count, 1)
+
+
+class RecaptchaScoreTests(TestCase):
+    """Оценка reCAPTCHA сохраняется в сообщении, reclassify_spam переводит низкие оценки в спам"""
+
+    def setUp(self):
+        caches[THROTTLE_CACHE_ALIAS].clear()
+
+    def test_submit_stores_score(self):
+        token = _make_step_token('general', Message.PROBLEM_TYPE_BULLYING)
+        result = {'passed': True, 'available': True, 'expired': False, 'score': 0.9, 'action': 'send_message', 'latency_ms': 120}
+        with mock.patch('core.views.check_recaptcha', return_value=result):
+            self.client.post('/send/general/?step=2', {'token': token, 'problem': 'Текст', 'help': 'Помощь'})
+        message = Message.objects.get()
+        self.assertEqual((message.recaptcha_score, message.recaptcha_action, message.recaptcha_latency_ms), (0.9, 'send_message', 120))
+
+    def test_reclassify_spam(self):
+        low = Message.objects.create(problem='a', help='', recaptcha_score=0.1)
+        handled = Message.objects.create(problem='b', help='', recaptcha_score=0.1, status=Message.STATUS_IN_PROGRESS)
+        high = Message.objects.create(problem='c', help='', recaptcha_score=0.9)
+        unscored = Message.objects.create(problem='d', help='')
+
+        call_command('reclassify_spam', '--dry-run', stdout=io.StringIO())
+        self.assertEqual(Message.objects.filter(status=Message.STATUS_SPAM).count(), 0)
+
+        with self.assertRaisesMessage(CommandError, '--batch-size'):
+            call_command('reclassify_spam', '--batch-size', '0', stdout=io.StringIO())
+        call_command('reclassify_spam', '--batch-size', '2', stdout=io.StringIO())
+        statuses = dict(Message.objects.values_list('id', 'status'))
+        self.assertEqual(statuses, {
+            low.id: Message.STATUS_SPAM,
+            handled.id: Message.STATUS_IN_PROGRESS,
+            high.id: Message.STATUS_NEW,
+            unscored.id: Message.STATUS_NEW,
+        })
+        self.assertEqual(rebuild_counters(), 0)
+
+
+class SchoolCacheTests(TestCase):
+    """Школа по коду из ссылки читается из общего кэша"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_read_through_and_invalidation(self):
+        school = School.objects.create(name='Школа', unique_code='cache1')
+        with self.assertNumQueries(1):
+            self.assertEqual(get_school_by_code('cache1').name, 'Школа')
+            self.assertEqual(get_school_by_code('cache1').name, 'Школа')
+
+        school.name = 'Новое название'
+        school.save()
+        self.assertEqual(get_school_by_code('cache1').name, 'Новое название')
+
+        school.delete()
+        self.assertIsNone(get_school_by_code('cache1'))
+
+    def test_unknown_and_invalid_codes(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_school_by_code('missing'))
+            self.assertIsNone(get_school_by_code('missing'))
+            self.assertIsNone(get_school_by_code('../etc/passwd'))
+        # Отрицательная запись сбрасывается при создании школы с этим кодом
+        School.objects.create(name='Школа', unique_code='missing')
+        self.assertIsNotNone(get_school_by_code('missing'))
+        self.assertEqual(self.client.get('/send/nope/').status_code, 404)
+
+
+class StepTokenTests(TestCase):
+    """Двухшаговая отправка без сессии: выбор шага 1 в подписанном токене"""
+
+    def step2(self, token, unique_id='general'):
+        return self.client.get(f'/send/{unique_id}/', {'step': 2, 'token': token})
+
+    def test_step1_redirects_with_token_and_no_session(self):
+        response = self.client.post('/send/general/?step=1', {'problem_type': Message.PROBLEM_TYPE_BULLYING})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('token=', response['Location'])
+        self.assertEqual(self.client.get(response['Location']).status_code, 200)
+        self.assertFalse(Session.objects.exists())
+
+    def test_rejected_tokens_return_to_step1(self):
+        School.objects.create(name='Школа', unique_code='token1')
+        token = _make_step_token('general', Message.PROBLEM_TYPE_BULLYING)
+        forged = signing.dumps({'school': 'general', 'problem_type': 'unknown'}, salt=SEND_MESSAGE_TOKEN_SALT)
+        cases = {
+            'другая школа': (token, 'token1'),
+            'подделка': (token[:-2] + 'xx', 'general'),
+            'неизвестный тип': (forged, 'general'),
+            'без токена': ('', 'general'),
+        }
+        for name, (value, unique_id) in cases.items():
+            with self.subTest(name):
+                self.assertRedirects(self.step2(value, unique_id), f'/send/{unique_id}/?step=1', fetch_redirect_response=False)
+        with mock.patch('core.views.SEND_MESSAGE_TOKEN_MAX_AGE', -1):
+            self.assertRedirects(self.step2(token), '/send/general/?step=1', fetch_redirect_response=False)
+
+
+class MessageStatsTests(TestCase):
+    """Статистика области одним запросом по счетчикам, с коротким кэшем"""
+
+    def setUp(self):
+        cache.clear()
+        self.school = School.objects.create(name='Школа', unique_code='stats1')
+        self.general_school = School.objects.create(name='Общие', unique_code='general')
+        Message.objects.create(problem='a', help='', school=self.school, problem_type=Message.PROBLEM_TYPE_BULLYING)
+        Message.objects.create(problem='b', help='', school=self.general_school, status=Message.STATUS_SPAM)
+        Message.objects.create(problem='c', help='')
+
+    def test_scopes(self):
+        with self.assertNumQueries(1):
+            stats = get_message_stats(SCOPE_ALL)
+        self.assertEqual((stats['total'], stats[Message.STATUS_NEW], stats[Message.STATUS_SPAM]), (3, 2, 1))
+        self.assertEqual(set(stats), {'total'} | set(dict(Message.STATUS_CHOICES)) | set(dict(Message.PROBLEM_TYPE_CHOICES)))
+        # Общие: без школы и служебная школа general
+        self.assertEqual(get_message_stats(SCOPE_GENERAL)['total'], 2)
+        school_stats = get_message_stats(self.school)
+        self.assertEqual((school_stats['total'], school_stats[Message.PROBLEM_TYPE_BULLYING]), (1, 1))
+        self.assertEqual(get_message_stats(self.school.id), school_stats)
+
+    def test_cache_and_invalidation(self):
+        get_message_stats(self.school)
+        with self.assertNumQueries(0):
+            get_message_stats(self.school)
+        Message.objects.create(problem='d', help='', school=self.school)
+        self.assertEqual(get_message_stats(self.school)['total'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            update_status(Message.objects.filter(school=self.school), Message.STATUS_RESOLVED)
+        self.assertEqual(get_message_stats(self.school)[Message.STATUS_RESOLVED], 2)
+
+
+class DbConnectionBenchmarkTests(TestCase):
+    """Ошибки потоков нагрузки прерывают прогон, а не дают 0 запросов в секунду"""
+
+    @mock.patch('core.stats.count_messages', side_effect=RuntimeError('нет соединения'))
+    def test_worker_errors_fail_the_run(self, count):
+        out = io.StringIO()
+        with self.assertRaisesMessage(CommandError, 'нет соединения'):
+            call_command('benchmark_db_connections', '--worker', '--duration', '0.2', '--threads', '2', stdout=out)
+        self.assertEqual(out.getvalue(), '')
+
+
+class PublicPageCacheTests(TestCase):
+    """Кэш главной и страниц контента для анонимных посетителей"""
+
+    CSRF_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]*)"')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_page_gets_fresh_csrf_token(self):
+        self.client.get('/')
+        client = Client(enforce_csrf_checks=True)
+        with self.assertNumQueries(0):
+            response = client.get('/')
+        content = response.content.decode()
+        self.assertNotIn(CSRF_PLACEHOLDER, content)
+        token = self.CSRF_RE.search(content).group(1)
+        # Токен из кэшированной страницы принимается формой
+        response = client.post('/send/general/?step=1', {
+            'csrfmiddlewaretoken': token, 'problem_type': Message.PROBLEM_TYPE_BULLYING,
+        })
+        self.assertEqual(response.status_code, 302)
+
+    def test_language_and_invalidation(self):
+        EditablePage.objects.create(page='faq', language='ru', title='FAQ', content='<p>русский</p>')
+        EditablePage.objects.create(page='faq', language='ky', title='FAQ', content='<p>кыргызча</p>')
+        self.assertContains(self.client.get('/faq/'), 'русский')
+        self.client.cookies['django_language'] = 'ky'
+        self.assertContains(self.client.get('/faq/'), 'кыргызча')
+
+        page = EditablePage.objects.get(page='faq', language='ky')
+        page.content = '<p>жаңы</p>'
+        page.save()
+        self.assertContains(self.client.get('/faq/'), 'жаңы')
+
+    def test_staff_session_bypasses_cache(self):
+        self.client.get('/')
+        self.client.force_login(User.objects.create_user('page_rayon', password='pw', role=User.RAYON_OTDEL))
+        with mock.patch('core.page_cache.cache') as page_cache:
+            self.assertEqual(self.client.get('/').status_code, 200)
+        page_cache.get.assert_not_called()
+
+
+class StaticExportTests(TestCase):
+    """Экспорт страниц контента в статические файлы для Caddy"""
+
+    CSRF_RE = PublicPageCacheTests.CSRF_RE
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = root.name
+
+    def test_export_and_verify(self):
+        written = export_site(root=self.root)
+        self.assertEqual(len(written), len(CONTENT_PAGES) * len(settings.LANGUAGES))
+        path = output_file('faq', 'ky', self.root)
+        html = path.read_text(encoding='utf-8')
+        self.assertNotIn('csrfmiddlewaretoken', html)
+        # Язык переключается ссылками на экспортированные копии, а не формой set_language
+        self.assertNotIn('/set-language/', html)
+        self.assertIn('href="/ru/faq/"', html)
+        self.assertEqual(gzip.decompress(path.with_name('index.html.gz').read_bytes()).decode(), html)
+        self.assertEqual(verify_site(root=self.root), {})
+
+        EditablePage.objects.create(page='faq', language='ky', title='Суроолор', content='<p>жаңы текст</p>')
+        self.assertEqual(list(verify_site(root=self.root)), [path])
+
+    def test_set_language_requires_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        self.assertEqual(client.post('/set-language/', {'language': 'ky'}).status_code, 403)
+        token = self.CSRF_RE.search(client.get('/faq/').content.decode()).group(1)
+        response = client.post('/set-language/', {'language': 'ky', 'csrfmiddlewaretoken': token})
+        self.assertEqual(response.cookies['django_language'].value, 'ky')
+
+    @override_settings(STATIC_SITE_EXPORT_ON_SAVE=True)
+    def test_export_on_save(self):
+        with mock.patch('core.signals.export_page') as export_page, self.captureOnCommitCallbacks(execute=True):
+            EditablePage.objects.create(page='faq', language='ru', title='FAQ', content='<p>текст</p>')
+            EditablePage.objects.create(page='contacts', language='ru', title='Контакты', content='<p>текст</p>')
+        export_page.assert_called_once_with('faq', ['ru'])
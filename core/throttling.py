@@ -0,0 +1,128 @@
+"""Ограничение частоты отправки сообщений по IP и по школе.
+
+Скользящее окно (sliding window counter) в отдельном кэше Django 'throttle'
+(см. CACHES в settings): счетчики текущего и предыдущего окна взвешиваются
+по прошедшей доле окна. Учитываются только отправки прошедшей валидацию
+формы, проверка выполняется до поиска школы, reCAPTCHA и записи в БД. Лимит
+по IP рассчитан на школу за NAT, где весь класс выходит с одного адреса.
+
+Ограничение приблизительное (best-effort): в файловом кэше add() и incr()
+не атомарны, и одновременные запросы разных воркеров могут потерять
+приращение, а вытеснение при переполнении кэша сбрасывает часть счетчиков.
+Лимит защищает от массовой отправки, а не от единичного превышения;
+для точного подсчета нужен кэш с атомарным incr (Redis, Memcached).
+"""
+import hashlib
+import logging
+import time
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_HITS_KEY = 'throttle:hits:{scope}'
+THROTTLE_CACHE_ALIAS = 'throttle'
+
+
+def _cache():
+    """Кэш счетчиков: отдельный от основного, чтобы лимиты не вытеснялись"""
+    return caches[THROTTLE_CACHE_ALIAS]
+
+
+def parse_rate(rate):
+    """'20/600' -> (20, 600); пустая строка отключает ограничение"""
+    if not rate:
+        return None
+    count, seconds = rate.split('/')
+    return int(count), int(seconds)
+
+
+SUBMIT_RATE_LIMITS = {
+    'ip': parse_rate(getattr(settings, 'SUBMIT_RATE_LIMIT_IP', '20/600')),
+    'school': parse_rate(getattr(settings, 'SUBMIT_RATE_LIMIT_SCHOOL', '60/60')),
+}
+
+
+def get_client_ip(request):
+    """IP клиента с учетом X-Forwarded-For от Caddy"""
+    if getattr(settings, 'SUBMIT_TRUST_X_FORWARDED_FOR', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if forwarded:
+            # Caddy дописывает адрес клиента последним
+            return forwarded.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _anonymize(value):
+    """Хэш идентификатора: IP-адреса не сохраняются даже в кэше, а ключи остаются допустимыми"""
+    return hashlib.sha256(f'{settings.SECRET_KEY}:{value}'.encode()).hexdigest()[:32]
+
+
+class SlidingWindowLimiter:
+    """Ограничитель limit запросов за window секунд"""
+
+    def __init__(self, scope, limit, window):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+
+    def _key(self, ident, bucket):
+        return f'throttle:{self.scope}:{ident}:{bucket}'
+
+    def allow(self, ident):
+        """Учитывает запрос и возвращает False, если лимит превышен"""
+        now = time.time()
+        bucket = int(now // self.window)
+        current_key = self._key(ident, bucket)
+        counts = _cache().get_many([current_key, self._key(ident, bucket - 1)])
+        current = counts.get(current_key, 0)
+        previous = counts.get(self._key(ident, bucket - 1), 0)
+
+        elapsed = (now % self.window) / self.window
+        if previous * (1 - elapsed) + current + 1 > self.limit:
+            return False
+
+        # Ключ живет два окна: он нужен и как "предыдущее окно"
+        if not _cache().add(current_key, 1, self.window * 2):
+            try:
+                _cache().incr(current_key)
+            except ValueError:
+                _cache().set(current_key, 1, self.window * 2)
+        return True
+
+    def retry_after(self):
+        return self.window - int(time.time() % self.window)
+
+
+def _record_hit(scope):
+    key = THROTTLE_HITS_KEY.format(scope=scope)
+    if not _cache().add(key, 1, None):
+        try:
+            _cache().incr(key)
+        except ValueError:
+            _cache().set(key, 1, None)
+
+
+def check_submit_throttle(request, unique_id):
+    """Проверка лимитов отправки. Возвращает None или число секунд до повтора"""
+    idents = {
+        'ip': _anonymize(get_client_ip(request)),
+        'school': _anonymize(unique_id),
+    }
+    for scope, ident in idents.items():
+        rate = SUBMIT_RATE_LIMITS.get(scope)
+        if not rate:
+            continue
+        limiter = SlidingWindowLimiter(f'submit:{scope}', *rate)
+        if not limiter.allow(ident):
+            _record_hit(scope)
+            logger.warning(f"Превышен лимит отправки сообщений ({scope}) для школы {unique_id}")
+            return limiter.retry_after()
+    return None
+
+
+def get_throttle_hits():
+    """Количество отклоненных ограничителем запросов по типам лимитов"""
+    keys = {scope: THROTTLE_HITS_KEY.format(scope=scope) for scope in SUBMIT_RATE_LIMITS}
+    values = _cache().get_many(keys.values())
+    return {scope: values.get(key, 0) for scope, key in keys.items()}
@@ -24,7 +24,10 @@ urlpatterns = [
     path('staff-logout/', admin_views.admin_logout, name='admin_logout'),
     path('staff/', admin_views.admin_dashboard, name='admin_dashboard'),
     path('staff/messages/', admin_views.admin_messages, name='admin_messages'),
+    path('staff/messages/bulk/', admin_views.admin_messages_bulk, name='admin_messages_bulk'),
+    path('staff/stats/timeseries/', admin_views.admin_stats_timeseries, name='admin_stats_timeseries'),
     path('staff/messages/<int:message_id>/', admin_views.admin_message_detail, name='admin_message_detail'),
+    path('staff/archive/<int:message_id>/', admin_views.admin_archived_message_detail, name='admin_archived_message_detail'),
     path('staff/schools/', admin_views.admin_schools, name='admin_schools'),
     path('staff/schools/add/', admin_views.add_school, name='add_school'),
     path('staff/schools/<int:school_id>/edit/', admin_views.edit_school, name='edit_school'),
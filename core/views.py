@@ -1,14 +1,24 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect
+from django.http import Http404, HttpResponse
 from django.utils import translation
 from django.conf import settings
 from django.contrib import messages
 from django.utils.translation import gettext_lazy as _
+from django.db import transaction
+from django.core import signing
+from django.utils.http import urlencode
 
 from .forms import SendMessageForm, ProblemTypeForm
-from .models import School, EditablePage
-from .telegram_utils import notify_admins_about_message
-from .recaptcha_utils import verify_recaptcha
+from .models import School
+from .content import get_page
+from .school_cache import get_school_by_code
+from .telegram_utils import enqueue_message_notification
+from .recaptcha_utils import check_recaptcha, recaptcha_fields, RECAPTCHA_DEFERRED
+from .throttling import check_submit_throttle, get_client_ip
+from .stats import get_message_stats
+from .page_cache import cache_public_page, INDEX_PAGE
 from dashboard.models import Message
+from dashboard.duplicates import register_message
 
 
 def send_message_info(request):
@@ -22,151 +32,101 @@ def send_message_info(request):
         'domain': domain,
     })
 
-def _get_message_statistics():
-    """Универсальная функция для получения статистики сообщений"""
-    # Статистика по статусам
-    status_stats = {
-        'total_messages': Message.objects.count(),
-        'pending_messages': Message.objects.filter(status='pending').count(),
-        'in_progress_messages': Message.objects.filter(status='in_progress').count(),
-        'resolved_messages': Message.objects.filter(status='resolved').count(),
-    }
-    
-    # Статистика по типам проблем
-    problem_stats = {
-        'bullying_count': Message.objects.filter(problem_type='bullying').count(),
-        'extortion_count': Message.objects.filter(problem_type='extortion').count(),
-        'harassment_count': Message.objects.filter(problem_type='harassment').count(),
-        'other_count': Message.objects.filter(problem_type='other').count(),
-    }
-    
-    return {**status_stats, **problem_stats}
-
+@cache_public_page(INDEX_PAGE)
 def index(request):
     """Главная страница с статистикой платформы"""
-    print(f"DEBUG: Текущий язык в index: {translation.get_language()}")
-    print(f"DEBUG: Язык в сессии: {request.session.get('django_language')}")
-    context = _get_message_statistics()
-    return render(request, 'core/index.html', context)
+    return render(request, 'core/index.html', {'stats': get_message_stats()})
 
 def set_language(request):
 	if request.method == 'POST':
 		language = request.POST.get('language')
-		print(f"DEBUG: Получен язык: {language}")
-		print(f"DEBUG: Доступные языки: {[lang[0] for lang in settings.LANGUAGES]}")
 		if language in [lang[0] for lang in settings.LANGUAGES]:
-			print(f"DEBUG: Активируем язык: {language}")
 			translation.activate(language)
 			request.session['django_language'] = language
-			print(f"DEBUG: Язык в сессии: {request.session.get('django_language')}")
-		else:
-			print(f"DEBUG: Язык {language} не найден в доступных языках")
 	return redirect(request.META.get('HTTP_REFERER', '/'))
 
-def _get_or_create_page(page_key, title, default_content):
-	"""Универсальная функция для получения или создания страницы"""
-	try:
-		page = EditablePage.objects.get(page=page_key, language=translation.get_language())
-	except EditablePage.DoesNotExist:
-		page = EditablePage.objects.create(
-			page=page_key,
-			language=translation.get_language(),
-			title=title,
-			content=default_content
-		)
-	return page
+def _render_page(request, page_key):
+	"""Страница EditablePage на текущем языке (только чтение, через кэш)"""
+	page = get_page(page_key, translation.get_language())
+	return render(request, f'core/{page_key}.html', {'page': page})
 
+@cache_public_page('about')
 def about(request):
-	page = _get_or_create_page(
-		'about', 
-		'О проекте', 
-		'Аноним Мектеп — это платформа, созданная для поддержки школьников, учителей и родителей. Здесь вы можете получить консультацию, поделиться проблемой или узнать полезную информацию, сохраняя анонимность.'
-	)
-	return render(request, 'core/about.html', {'page': page})
+	return _render_page(request, 'about')
 
+@cache_public_page('faq')
 def faq(request):
-	page = _get_or_create_page(
-		'faq', 
-		'Часто задаваемые вопросы', 
-		'<ul><li><strong>Как работает анонимность?</strong> Ваши сообщения не содержат личных данных и не отслеживаются.</li><li><strong>Кто может воспользоваться сервисом?</strong> Любой школьник, учитель или родитель.</li><li><strong>Как получить ответ?</strong> Ответ поступит на указанный вами способ связи или будет опубликован на сайте.</li></ul>'
-	)
-	return render(request, 'core/faq.html', {'page': page})
+	return _render_page(request, 'faq')
 
 def contacts(request):
-	page = _get_or_create_page(
-		'contacts', 
-		'Полезные контакты', 
-		'<ul><li>Телефон доверия: <a href="tel:150">150</a></li><li>Министерство образования: <a href="https://edu.gov.kg/">edu.gov.kg</a></li><li>Психологическая помощь: <a href="tel:142">142</a></li><li>Экстренная помощь: <a href="tel:112">112</a></li></ul>'
-	)
-	return render(request, 'core/contacts.html', {'page': page})
+	return _render_page(request, 'contacts')
 
 def what_to_do(request):
-	page = _get_or_create_page(
-		'what_to_do', 
-		'Что делать, если...', 
-		'<ul><li>...вы столкнулись с буллингом — обратитесь к школьному психологу или напишите нам анонимно.</li><li>...заметили нарушение — сообщите администрации или используйте форму на сайте.</li><li>...нужна срочная помощь — позвоните на горячую линию.</li><li>...вас вымогают деньги — немедленно сообщите родителям и в полицию.</li></ul>'
-	)
-	return render(request, 'core/what_to_do.html', {'page': page})
-
+	return _render_page(request, 'what_to_do')
 
+@cache_public_page('knowledge_base')
 def knowledge_base(request):
 	"""База знаний"""
-	page = _get_or_create_page(
-		'knowledge_base', 
-		_('База знаний'), 
-		'<p>База знаний по вопросам безопасности в школах, профилактике буллинга и другим темам.</p>'
-	)
-	return render(request, 'core/knowledge_base.html', {'page': page})
-
-def instructions(request):
-	"""Инструкции"""
-	page = _get_or_create_page(
-		'instructions', 
-		_('Инструкции'), 
-		'<p>Подробные инструкции по использованию платформы Аноним Мектеп.</p>'
-	)
-	return render(request, 'core/instructions.html', {'page': page})
-
+	return _render_page(request, 'knowledge_base')
 
+@cache_public_page('service_contacts')
 def service_contacts(request):
 	"""Контакты служб"""
-	page = _get_or_create_page(
-		'service_contacts', 
-		'Контакты служб', 
-		'<p>Контактная информация служб поддержки, психологов, правоохранительных органов.</p>'
-	)
-	return render(request, 'core/service_contacts.html', {'page': page})
-
+	return _render_page(request, 'service_contacts')
 
+@cache_public_page('instructions')
 def instructions(request):
 	"""Инструкции"""
-	page = _get_or_create_page(
-		'instructions', 
-		'Инструкции', 
-		'<p>Пошаговые инструкции по использованию платформы "Аноним Мектеп".</p>'
-	)
-	return render(request, 'core/instructions.html', {'page': page})
+	return _render_page(request, 'instructions')
+
 
+# Выбор шага 1 передается на шаг 2 в подписанном токене, а не в сессии,
+# чтобы анонимные посетители не создавали записей в django_session
+SEND_MESSAGE_TOKEN_SALT = 'core.send_message'
+SEND_MESSAGE_TOKEN_MAX_AGE = getattr(settings, 'SEND_MESSAGE_TOKEN_MAX_AGE', 60 * 60)
+
+def _make_step_token(unique_id, problem_type):
+	return signing.dumps({'school': unique_id, 'problem_type': problem_type}, salt=SEND_MESSAGE_TOKEN_SALT, compress=True)
+
+def _load_step_token(token, unique_id):
+	"""Тип проблемы из токена шага 1 или None, если токен неверный или истек"""
+	if not token:
+		return None
+	try:
+		data = signing.loads(token, salt=SEND_MESSAGE_TOKEN_SALT, max_age=SEND_MESSAGE_TOKEN_MAX_AGE)
+	except signing.BadSignature:
+		return None
+	if data.get('school') != unique_id:
+		return None
+	# Повторно валидируем выбор той же формой, что и на шаге 1
+	form = ProblemTypeForm({'problem_type': data.get('problem_type')})
+	if not form.is_valid():
+		return None
+	return form.cleaned_data['problem_type']
+
+def _get_school_or_404(unique_id):
+	"""Школа по уникальному коду из URL (через кэш); None для общих сообщений"""
+	if unique_id == 'general':
+		return None
+	school = get_school_by_code(unique_id)
+	if school is None:
+		raise Http404('Школа не найдена')
+	return school
 
 def send_message(request, unique_id):
+	step = request.GET.get('step', '1')
+	
 	# Проверяем, является ли это общим сообщением
 	is_general_message = unique_id == 'general'
 	
-	if is_general_message:
-		school = None
-	else:
-		# Определяем школу по уникальному коду из URL
-		school = get_object_or_404(School, unique_code=unique_id)
-	
-	step = request.GET.get('step', '1')
-	
 	if step == '1':
 		# Первый шаг: выбор типа проблемы
+		school = _get_school_or_404(unique_id)
 		form = ProblemTypeForm(request.POST or None)
 		if request.method == 'POST':
 			if form.is_valid():
-				request.session['problem_type'] = form.cleaned_data['problem_type']
-				return redirect(f'/send/{unique_id}/?step=2')
+				token = _make_step_token(unique_id, form.cleaned_data['problem_type'])
+				return redirect(f'/send/{unique_id}/?' + urlencode({'step': 2, 'token': token}))
 			else:
 				# Форма не валидна, показываем ошибки
 				print(f"Form errors: {form.errors}")
@@ -178,29 +138,48 @@ def send_message(request, unique_id):
 	
 	elif step == '2':
 		# Второй шаг: описание проблемы
-		if 'problem_type' not in request.session:
+		token = request.POST.get('token') or request.GET.get('token')
+		problem_type = _load_step_token(token, unique_id)
+		if problem_type is None:
 			return redirect(f'/send/{unique_id}/?step=1')
 		
 		form = SendMessageForm(request.POST or None)
-		if request.method == 'POST' and form.is_valid():
-			# Проверка reCAPTCHA v3
+		submitted = request.method == 'POST' and form.is_valid()
+		if submitted:
+			# Лимит учитывает только заполненные формы (ошибки ввода не расходуют его)
+			# и проверяется до поиска школы, reCAPTCHA и записи в БД. Код школы в URL
+			# уже подтвержден подписанным токеном шага 1
+			retry_after = check_submit_throttle(request, unique_id)
+			if retry_after is not None:
+				response = HttpResponse('Слишком много сообщений. Попробуйте позже.', status=429)
+				response['Retry-After'] = str(retry_after)
+				return response
+		
+		school = _get_school_or_404(unique_id)
+		if submitted:
+			# Проверка reCAPTCHA v3 (в отложенном режиме токен проверит run_notifier)
 			recaptcha_token = request.POST.get('recaptcha_token')
-			if not verify_recaptcha(recaptcha_token, request.META.get('REMOTE_ADDR')):
+			recaptcha = None if RECAPTCHA_DEFERRED else check_recaptcha(recaptcha_token, get_client_ip(request))
+			if recaptcha and not recaptcha['passed']:
 				form.add_error(None, 'Проверка безопасности не пройдена. Попробуйте еще раз.')
 			else:
-				msg = Message.objects.create(
-					problem=form.cleaned_data['problem'],
-					help=form.cleaned_data['help'],
-					contact=form.cleaned_data['contact'],
-					school=school,
-					problem_type=request.session['problem_type']
-				)
-				# Очищаем сессию
-				del request.session['problem_type']
-				notify_admins_about_message(msg)
+				# Сообщение и уведомление в очереди сохраняются в одной транзакции,
+				# доставку в Telegram выполняет команда run_notifier
+				with transaction.atomic():
+					msg = Message.objects.create(
+						problem=form.cleaned_data['problem'],
+						help=form.cleaned_data['help'],
+						contact=form.cleaned_data['contact'],
+						school=school,
+						problem_type=problem_type,
+						verification_pending=RECAPTCHA_DEFERRED,
+						**(recaptcha_fields(recaptcha) if recaptcha else {})
+					)
+					# Почти одинаковые сообщения связываются с исходным, уведомление по ним не рассылается
+					register_message(msg)
+					enqueue_message_notification(msg, recaptcha_token=(recaptcha_token or '') if RECAPTCHA_DEFERRED else '')
 				return redirect('message_sent')
 		
-		problem_type = request.session.get('problem_type')
 		# Получаем отображаемое название типа проблемы
 		problem_type_display = dict(Message.PROBLEM_TYPE_CHOICES).get(problem_type, 'Неизвестно')
 		return render(request, 'core/send_message_step2.html', {
@@ -208,6 +187,7 @@ def send_message(request, unique_id):
 			'school': school,
 			'problem_type': problem_type,
 			'problem_type_display': problem_type_display,
+			'token': token,
 			'recaptcha_public_key': settings.RECAPTCHA_PUBLIC_KEY,
 			'is_general_message': is_general_message
 		})
@@ -1,6 +1,8 @@
 
 from django.contrib import admin
-from .models import Message, InternalComment
+from .models import Message, InternalComment, ArchivedMessage, ArchivedComment
+from .search import search_messages
+from .archive import search_archive
 
 class InternalCommentInline(admin.TabularInline):
 	model = InternalComment
@@ -8,11 +10,48 @@ class InternalCommentInline(admin.TabularInline):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-	list_display = ('id', 'problem', 'school', 'problem_type', 'status', 'created_at')
+	list_display = ('id', 'problem', 'school', 'problem_type', 'status', 'recaptcha_score', 'duplicate_of', 'created_at')
 	list_filter = ('school', 'problem_type', 'status')
-	search_fields = ('problem', 'school', 'contact')
+	# Поля только включают строку поиска: сам поиск идет по полнотекстовому индексу
+	search_fields = ('problem', 'help')
+	search_help_text = 'Поиск по тексту сообщения, просьбе о помощи и комментариям'
+	raw_id_fields = ('duplicate_of',)
 	inlines = [InternalCommentInline]
 
+	def get_search_results(self, request, queryset, search_term):
+		if not search_term:
+			return queryset, False
+		return search_messages(queryset, search_term), False
+
 @admin.register(InternalComment)
 class InternalCommentAdmin(admin.ModelAdmin):
 	list_display = ('id', 'message', 'author', 'created_at')
+
+class ArchivedCommentInline(admin.TabularInline):
+	model = ArchivedComment
+	extra = 0
+	can_delete = False
+	readonly_fields = ('author', 'text', 'created_at')
+
+	def has_add_permission(self, request, obj=None):
+		return False
+
+@admin.register(ArchivedMessage)
+class ArchivedMessageAdmin(admin.ModelAdmin):
+	"""Архив только для просмотра: сообщения переносит команда archive_messages"""
+	list_display = ('id', 'problem', 'school', 'problem_type', 'status', 'created_at', 'archived_at')
+	list_filter = ('school', 'problem_type', 'status')
+	search_fields = ('problem', 'help')
+	search_help_text = 'Поиск по тексту сообщения, просьбе о помощи и комментариям'
+	inlines = [ArchivedCommentInline]
+
+	def has_add_permission(self, request):
+		return False
+
+	def has_change_permission(self, request, obj=None):
+		return False
+
+	def get_search_results(self, request, queryset, search_term):
+		if not search_term:
+			return queryset, False
+		return search_archive(queryset, search_term), False
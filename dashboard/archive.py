@@ -0,0 +1,122 @@
+"""Перенос старых решенных сообщений и спама в архив (ArchivedMessage).
+
+Списки, статистика и бот читают таблицу Message, поэтому в ней остаются только
+сообщения в работе и недавно закрытые. Команда archive_messages переносит
+сообщения со статусом resolved/spam, не менявшиеся ARCHIVE_AFTER_DAYS дней,
+пачками по ARCHIVE_BATCH_SIZE: каждая пачка - отдельная короткая транзакция
+(копия в архив и удаление из Message), между пачками - пауза, чтобы не
+мешать отправке сообщений и работе бота.
+
+Архивирование не меняет статистику: счетчики MessageCounter (поле count) и
+дневная статистика учитывают архив, а строка полнотекстового индекса сохраняется
+(id в архиве совпадает с исходным). Поэтому сигналы удаления Message и
+InternalComment внутри archiving() ничего не делают. Перенесенные сообщения
+добавляются в MessageCounter.archived, чтобы итог списков панели не включал архив.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from .counters import adjust_counter
+from .models import Message, InternalComment, ArchivedMessage, ArchivedComment
+from .search import search_messages
+
+ARCHIVE_AFTER_DAYS = getattr(settings, 'ARCHIVE_AFTER_DAYS', 90)
+ARCHIVE_BATCH_SIZE = getattr(settings, 'ARCHIVE_BATCH_SIZE', 500)
+ARCHIVE_BATCH_PAUSE = getattr(settings, 'ARCHIVE_BATCH_PAUSE', 0.5)
+ARCHIVE_STATUSES = (Message.STATUS_RESOLVED, Message.STATUS_SPAM)
+
+_archiving = ContextVar('dashboard_archiving', default=False)
+
+
+def is_archiving():
+	"""Идет перенос в архив: удаление сообщений не должно менять счетчики и индекс"""
+	return _archiving.get()
+
+
+@contextmanager
+def archiving():
+	token = _archiving.set(True)
+	try:
+		yield
+	finally:
+		_archiving.reset(token)
+
+
+def _field_names(model):
+	return [field.attname for field in model._meta.concrete_fields if field.name != 'archived_at']
+
+
+MESSAGE_FIELDS = _field_names(ArchivedMessage)
+COMMENT_FIELDS = _field_names(ArchivedComment)
+
+
+def archive_candidates(days=ARCHIVE_AFTER_DAYS):
+	"""Сообщения для переноса: закрытые и без изменений дольше days дней"""
+	cutoff = timezone.now() - timedelta(days=days)
+	return (
+		Message.objects.filter(status__in=ARCHIVE_STATUSES, updated_at__lt=cutoff)
+		# Уведомление еще не доставлено - run_notifier нужна исходная строка
+		.exclude(notifications__status='pending')
+		# Исходное сообщение ждет, пока в архив уйдут его дубликаты: удаление
+		# обнулило бы их duplicate_of (SET_NULL)
+		.exclude(duplicates__isnull=False)
+	)
+
+
+def archive_batch(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+	"""Перенос одной пачки. Возвращает число перенесенных сообщений"""
+	with transaction.atomic():
+		# Самые давно измененные первыми: порядок по индексу dashboard_msg_updated_idx
+		ids = list(
+			archive_candidates(days).order_by('updated_at', 'id').values_list('id', flat=True)[:batch_size]
+		)
+		if not ids:
+			return 0
+		ArchivedMessage.objects.bulk_create([
+			ArchivedMessage(**row) for row in Message.objects.filter(id__in=ids).values(*MESSAGE_FIELDS)
+		])
+		ArchivedComment.objects.bulk_create([
+			ArchivedComment(**row)
+			for row in InternalComment.objects.filter(message_id__in=ids).order_by('id').values(*COMMENT_FIELDS)
+		])
+		groups = Message.objects.filter(id__in=ids).values('school_id', 'status', 'problem_type').annotate(total=Count('id'))
+		for group in groups:
+			adjust_counter(group['school_id'], group['status'], group['problem_type'], 0, group['total'])
+		with archiving():
+			# Комментарии, полосы сигнатур и очередь уведомлений удаляются каскадом
+			Message.objects.filter(id__in=ids).delete()
+	return len(ids)
+
+
+def archive_messages(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, pause=ARCHIVE_BATCH_PAUSE,
+		max_batches=None, on_batch=None):
+	"""Перенос всех подходящих сообщений пачками. Возвращает общее число"""
+	total = 0
+	batches = 0
+	while max_batches is None or batches < max_batches:
+		moved = archive_batch(days, batch_size)
+		if not moved:
+			break
+		total += moved
+		batches += 1
+		if on_batch is not None:
+			on_batch(batches, moved, total)
+		if moved < batch_size:
+			break
+		time.sleep(pause)
+	return total
+
+
+def search_archive(queryset, query, school_id=None):
+	"""Поиск в архиве по запросу панели: без лимита SEARCH_MAX_MATCHES.
+
+	Новые совпадения в индексе почти всегда из Message, поэтому лимит
+	самых новых строк отсек бы архивные сообщения. Поиск по архиву
+	выполняется только по явному запросу сотрудника.
+	"""
+	return search_messages(queryset, query, max_matches=None, school_id=school_id)
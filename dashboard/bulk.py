@@ -0,0 +1,65 @@
+"""Массовые действия со списком сообщений: смена статуса и общий комментарий.
+
+Статус меняется одним UPDATE ... WHERE id IN (...) через update_status (счетчики
+обновляются по группам), комментарии создаются одним bulk_create. Ограничение
+по роли входит в WHERE тех же запросов: id чужих сообщений просто не совпадут,
+отдельная проверка каждого сообщения не нужна.
+"""
+from django.conf import settings
+from django.db import transaction
+from .counters import update_status
+from .models import Message, InternalComment
+from .search import index_messages
+
+BULK_MAX_MESSAGES = getattr(settings, 'BULK_MAX_MESSAGES', 500)
+
+
+def scoped_messages(user):
+	"""Сообщения, доступные пользователю (как в списках панели и бота)"""
+	if user.role == 'teacher':
+		# Учитель без школы не видит ни одного сообщения (school_id IS NULL - общие)
+		return Message.objects.filter(school_id=user.school_id) if user.school_id else Message.objects.none()
+	if user.is_superuser or user.role in ('super_admin', 'rayon_otdel'):
+		return Message.objects.all()
+	return Message.objects.none()
+
+
+def parse_message_ids(values):
+	"""ID из формы или команды бота: числа и диапазоны вида 10-20.
+
+	Неверные значения пропускаются; больше BULK_MAX_MESSAGES - ValueError.
+	"""
+	ids = set()
+	for value in values:
+		start, _, end = str(value).strip().partition('-')
+		if not start.isdigit() or (end and not end.isdigit()):
+			continue
+		start = int(start)
+		end = int(end) if end else start
+		if end - start >= BULK_MAX_MESSAGES or len(ids) + end - start + 1 > BULK_MAX_MESSAGES:
+			raise ValueError(f'Не больше {BULK_MAX_MESSAGES} сообщений за раз')
+		ids.update(range(start, end + 1))
+	return sorted(ids)
+
+
+def apply_bulk_action(user, message_ids, status=None, comment=''):
+	"""Смена статуса и/или общий комментарий для сообщений из message_ids.
+
+	Возвращает (сообщений со сменой статуса, добавленных комментариев).
+	"""
+	if status and status not in dict(Message.STATUS_CHOICES):
+		raise ValueError(f'Неизвестный статус: {status}')
+	comment = comment.strip()
+	queryset = scoped_messages(user).filter(id__in=message_ids)
+	updated = commented = 0
+	with transaction.atomic():
+		if status:
+			updated = update_status(queryset, status)
+		if comment:
+			ids = list(queryset.values_list('id', flat=True))
+			InternalComment.objects.bulk_create([
+				InternalComment(message_id=message_id, author=user, text=comment) for message_id in ids
+			])
+			index_messages(ids)
+			commented = len(ids)
+	return updated, commented
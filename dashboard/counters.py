@@ -0,0 +1,88 @@
+"""Материализованные счетчики сообщений (MessageCounter).
+
+Счетчики обновляются сигналами при сохранении и удалении Message, поэтому
+статистика (core.stats) читается из нескольких строк вместо COUNT по всей таблице.
+Сообщения, перенесенные в архив (dashboard.archive), остаются в count и
+дополнительно учитываются в archived: статистика включает архив, а итог
+списков панели (count - archived) - нет.
+Массовые изменения через QuerySet.update() сигналов не вызывают - для них
+есть update_status(). Расхождения исправляет команда rebuild_counters.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.dispatch import Signal
+from django.utils import timezone
+from .models import Message, MessageCounter, ArchivedMessage
+
+# Отправляется после массового изменения сообщений (QuerySet.update не вызывает post_save),
+# аргумент school_ids - школы затронутых сообщений
+messages_bulk_updated = Signal()
+
+
+def adjust_counter(school_id, status, problem_type, delta, archived=0):
+	"""Изменение счетчика на delta и числа архивных на archived (строка создается при первом сообщении)"""
+	if not delta and not archived:
+		return
+	lookup = {'school_id': school_id, 'status': status, 'problem_type': problem_type}
+	changes = {'count': F('count') + delta, 'archived': F('archived') + archived}
+	if MessageCounter.objects.filter(**lookup).update(**changes):
+		return
+	try:
+		with transaction.atomic():
+			MessageCounter.objects.create(count=delta, archived=archived, **lookup)
+	except IntegrityError:
+		# Строку успел создать параллельный запрос
+		MessageCounter.objects.filter(**lookup).update(**changes)
+
+
+def update_status(queryset, status, **extra_fields):
+	"""Массовая смена статуса одним UPDATE с обновлением счетчиков.
+
+	Возвращает количество измененных сообщений.
+	"""
+	queryset = queryset.exclude(status=status)
+	# updated_at нужен инкрементальной rollup_stats
+	extra_fields.setdefault('updated_at', timezone.now())
+	with transaction.atomic():
+		groups = list(
+			queryset.values('school_id', 'status', 'problem_type').annotate(total=Count('id'))
+		)
+		updated = queryset.update(status=status, **extra_fields)
+		for group in groups:
+			adjust_counter(group['school_id'], group['status'], group['problem_type'], -group['total'])
+			adjust_counter(group['school_id'], status, group['problem_type'], group['total'])
+	if groups:
+		school_ids = {group['school_id'] for group in groups}
+		transaction.on_commit(lambda: messages_bulk_updated.send(sender=Message, school_ids=school_ids))
+	return updated
+
+
+def fold_school_counters(school_id):
+	"""Перенос счетчиков удаляемой школы в общие: Message.school становится NULL"""
+	for counter in MessageCounter.objects.filter(school_id=school_id):
+		adjust_counter(None, counter.status, counter.problem_type, counter.count, counter.archived)
+
+
+def rebuild_counters():
+	"""Пересчет всех счетчиков по таблицам Message и ArchivedMessage. Возвращает число исправленных строк"""
+	actual = {}
+	for model in (Message, ArchivedMessage):
+		for row in model.objects.values('school_id', 'status', 'problem_type').annotate(total=Count('id')):
+			key = (row['school_id'], row['status'], row['problem_type'])
+			count, archived = actual.get(key, (0, 0))
+			actual[key] = (count + row['total'], archived + (row['total'] if model is ArchivedMessage else 0))
+	fixed = 0
+	with transaction.atomic():
+		for counter in MessageCounter.objects.select_for_update():
+			key = (counter.school_id, counter.status, counter.problem_type)
+			expected = actual.pop(key, (0, 0))
+			if (counter.count, counter.archived) != expected:
+				counter.count, counter.archived = expected
+				counter.save(update_fields=['count', 'archived'])
+				fixed += 1
+		for (school_id, status, problem_type), (count, archived) in actual.items():
+			MessageCounter.objects.create(
+				school_id=school_id, status=status, problem_type=problem_type, count=count, archived=archived
+			)
+			fixed += 1
+	return fixed
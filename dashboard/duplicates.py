@@ -0,0 +1,142 @@
+"""Поиск почти одинаковых сообщений (волны спама, повторные жалобы).
+
+При сохранении сообщения по символьным шинглам текста строится MinHash-сигнатура
+из NUM_PERMUTATIONS значений. Она делится на BANDS полос по ROWS значений, хэш
+каждой полосы хранится в MessageSignatureBand. Кандидаты ищутся точным
+совпадением полос по индексу (band, value, created_at), поэтому проверка не
+зависит от размера истории. Доля совпавших полос оценивает сходство: для
+сходства s ожидаемая доля равна s ** ROWS.
+
+Дубликаты ищутся только среди сообщений той же школы (общие сообщения без
+школы - отдельная группа): иначе уведомление другой школе было бы пропущено.
+
+Полосы сохраняются только для исходных сообщений: дубликаты ссылаются на
+исходное сообщение через Message.duplicate_of и сами кандидатами не становятся.
+Полосы старше окна поиска новым сообщениям не нужны и удаляются
+prune_signature_bands (команда archive_messages).
+"""
+import hashlib
+import math
+import random
+import re
+import struct
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+from .models import Message, MessageSignatureBand
+
+SHINGLE_SIZE = 5
+BANDS = 16
+ROWS = 4
+NUM_PERMUTATIONS = BANDS * ROWS
+
+# Слишком короткие тексты ("помогите") совпадают случайно и не проверяются
+MIN_TEXT_LENGTH = 20
+MAX_TEXT_LENGTH = 4000
+
+# Окно поиска и порог сходства (0..1)
+DUPLICATE_WINDOW_DAYS = getattr(settings, 'DUPLICATE_WINDOW_DAYS', 14)
+DUPLICATE_SIMILARITY = getattr(settings, 'DUPLICATE_SIMILARITY', 0.8)
+PRUNE_BATCH_SIZE = 5000
+
+# Минимальное число совпавших полос для порога сходства
+MIN_MATCHING_BANDS = max(1, math.ceil(BANDS * DUPLICATE_SIMILARITY ** ROWS))
+
+# Фиксированные маски перестановок: сигнатуры должны совпадать между процессами
+_MASKS = [random.Random(1729 + i).getrandbits(64) for i in range(NUM_PERMUTATIONS)]
+
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+def _hash64(data):
+	return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def _normalize(text):
+	return _NON_WORD_RE.sub(' ', text.lower()).strip()[:MAX_TEXT_LENGTH]
+
+
+def compute_signature(text):
+	"""MinHash-сигнатура текста или None, если текст слишком короткий"""
+	text = _normalize(text or '')
+	if len(text) < MIN_TEXT_LENGTH:
+		return None
+	hashes = {
+		_hash64(text[i:i + SHINGLE_SIZE].encode())
+		for i in range(len(text) - SHINGLE_SIZE + 1)
+	}
+	return [min(h ^ mask for h in hashes) for mask in _MASKS]
+
+
+def signature_bands(signature):
+	"""Список (номер полосы, хэш полосы) в диапазоне BigIntegerField"""
+	bands = []
+	for band in range(BANDS):
+		rows = signature[band * ROWS:(band + 1) * ROWS]
+		value = int.from_bytes(
+			hashlib.blake2b(struct.pack(f'<{ROWS}Q', *rows), digest_size=8).digest(), 'little', signed=True
+		)
+		bands.append((band, value))
+	return bands
+
+
+def find_original(bands, created_at, school_id=None, exclude_id=None):
+	"""ID исходного сообщения той же школы с наибольшим числом совпавших полос или None"""
+	lookup = Q()
+	for band, value in bands:
+		lookup |= Q(band=band, value=value)
+	candidates = MessageSignatureBand.objects.filter(
+		lookup,
+		# school_id=None дает IS NULL: общие сообщения сравниваются только между собой
+		school_id=school_id,
+		created_at__gte=created_at - timedelta(days=DUPLICATE_WINDOW_DAYS),
+		created_at__lte=created_at,
+	)
+	if exclude_id is not None:
+		candidates = candidates.exclude(message_id=exclude_id)
+	return (
+		candidates.values('message_id')
+		.annotate(matches=Count('id'))
+		.filter(matches__gte=MIN_MATCHING_BANDS)
+		.order_by('-matches', 'message_id')
+		.values_list('message_id', flat=True)
+		.first()
+	)
+
+
+def register_message(message):
+	"""Проверка нового сообщения на дубликат и сохранение его сигнатуры.
+
+	Вызывается в транзакции, создающей сообщение. Возвращает ID исходного
+	сообщения, если найден дубликат, иначе None.
+	"""
+	signature = compute_signature(message.problem)
+	if signature is None:
+		return None
+	bands = signature_bands(signature)
+
+	original_id = find_original(bands, message.created_at, school_id=message.school_id, exclude_id=message.pk)
+	if original_id is not None:
+		Message.objects.filter(pk=message.pk).update(duplicate_of=original_id)
+		message.duplicate_of_id = original_id
+		return original_id
+
+	MessageSignatureBand.objects.bulk_create([
+		MessageSignatureBand(message=message, band=band, value=value, school_id=message.school_id, created_at=message.created_at)
+		for band, value in bands
+	])
+	return None
+
+
+def prune_signature_bands(days=DUPLICATE_WINDOW_DAYS, batch_size=PRUNE_BATCH_SIZE):
+	"""Удаление полос старше окна поиска пачками. Возвращает число удаленных строк"""
+	cutoff = timezone.now() - timedelta(days=days)
+	total = 0
+	while True:
+		ids = list(MessageSignatureBand.objects.filter(created_at__lt=cutoff).values_list('id', flat=True)[:batch_size])
+		if not ids:
+			return total
+		total += MessageSignatureBand.objects.filter(id__in=ids).delete()[0]
+		if len(ids) < batch_size:
+			return total
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0003_alter_message_problem_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='verification_pending',
+            field=models.BooleanField(default=False),
+        ),
+    ]
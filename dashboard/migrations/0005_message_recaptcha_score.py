@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0004_message_verification_pending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='recaptcha_action',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='recaptcha_latency_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='recaptcha_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0005_message_recaptcha_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='dashboard.message'),
+        ),
+        migrations.CreateModel(
+            name='MessageSignatureBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('value', models.BigIntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='signature_bands', to='dashboard.message')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['band', 'value', 'created_at'], name='dashboard_sigband_lookup_idx')],
+            },
+        ),
+    ]
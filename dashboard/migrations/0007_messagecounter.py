@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    Message = apps.get_model('dashboard', 'Message')
+    MessageCounter = apps.get_model('dashboard', 'MessageCounter')
+    MessageCounter.objects.bulk_create([
+        MessageCounter(school_id=row['school_id'], status=row['status'], problem_type=row['problem_type'], count=row['total'])
+        for row in Message.objects.values('school_id', 'status', 'problem_type').annotate(total=Count('id'))
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_notificationoutbox_recaptcha_token'),
+        ('dashboard', '0006_message_duplicate_of'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('new', 'Новое'), ('in_progress', 'В работе'), ('resolved', 'Решено'), ('spam', 'Спам')], max_length=16)),
+                ('problem_type', models.CharField(choices=[('bullying', 'Буллинг'), ('extortion', 'Вымогательство'), ('violence', 'Насилие'), ('discrimination', 'Дискриминация'), ('academic', 'Академические проблемы'), ('other', 'Другое')], max_length=32)),
+                ('count', models.IntegerField(default=0)),
+                ('school', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='message_counters', to='core.school')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('school__isnull', False)), fields=('school', 'status', 'problem_type'), name='dashboard_counter_school_uniq'), models.UniqueConstraint(condition=models.Q(('school__isnull', True)), fields=('status', 'problem_type'), name='dashboard_counter_general_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_notificationoutbox_recaptcha_token'),
+        ('dashboard', '0007_messagecounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('problem_type', models.CharField(choices=[('bullying', 'Буллинг'), ('extortion', 'Вымогательство'), ('violence', 'Насилие'), ('discrimination', 'Дискриминация'), ('academic', 'Академические проблемы'), ('other', 'Другое')], max_length=32)),
+                ('status', models.CharField(choices=[('new', 'Новое'), ('in_progress', 'В работе'), ('resolved', 'Решено'), ('spam', 'Спам')], max_length=16)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StatsDirtyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StatsRollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['updated_at'], name='dashboard_msg_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='messagedailystat',
+            name='school',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='core.school'),
+        ),
+        migrations.AddIndex(
+            model_name='messagedailystat',
+            index=models.Index(fields=['date'], name='dashboard_daily_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='messagedailystat',
+            index=models.Index(fields=['school', 'date'], name='dashboard_daily_school_idx'),
+        ),
+    ]
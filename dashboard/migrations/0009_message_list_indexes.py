@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_editablepage_rendered_html'),
+        ('dashboard', '0008_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='school',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='messages', to='core.school'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['created_at', 'id'], name='dashboard_msg_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['school', 'created_at', 'id'], name='dashboard_msg_school_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='dashboard_msg_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['problem_type', 'created_at', 'id'], name='dashboard_msg_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['school', 'status', 'created_at', 'id'], name='dashboard_msg_sch_status_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Таблица полнотекстового индекса (см. dashboard.search) и ее заполнение"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            # Префиксный индекс для поиска по началу слова длиной 3-6 символов (dashboard.search.STEM_LENGTH)
+            "CREATE VIRTUAL TABLE dashboard_message_search USING fts5("
+            "document, tokenize='unicode61 remove_diacritics 2', prefix='3 4 5 6')"
+        )
+        insert = 'INSERT INTO dashboard_message_search (rowid, document) VALUES (%s, %s)'
+    elif vendor == 'postgresql':
+        # Без внешнего ключа: удаление отслеживают сигналы, а flush/TRUNCATE таблицы сообщений не блокируется
+        schema_editor.execute(
+            'CREATE TABLE dashboard_message_search (message_id integer PRIMARY KEY, document tsvector NOT NULL)'
+        )
+        schema_editor.execute('CREATE INDEX dashboard_message_search_gin ON dashboard_message_search USING GIN (document)')
+        insert = "INSERT INTO dashboard_message_search (message_id, document) VALUES (%s, to_tsvector('simple', %s))"
+    else:
+        return
+
+    Message = apps.get_model('dashboard', 'Message')
+    InternalComment = apps.get_model('dashboard', 'InternalComment')
+    comments = {}
+    for message_id, text in InternalComment.objects.order_by('id').values_list('message_id', 'text').iterator():
+        comments.setdefault(message_id, []).append(text)
+    with schema_editor.connection.cursor() as cursor:
+        for message_id, problem, help_text in Message.objects.values_list('id', 'problem', 'help').iterator():
+            cursor.execute(insert, [message_id, '\n'.join([problem or '', help_text or '', *comments.get(message_id, [])])])
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS dashboard_message_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0009_message_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_editablepage_rendered_html'),
+        ('dashboard', '0010_message_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMessage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('problem', models.TextField()),
+                ('help', models.TextField()),
+                ('contact', models.CharField(blank=True, max_length=255)),
+                ('problem_type', models.CharField(choices=[('bullying', 'Буллинг'), ('extortion', 'Вымогательство'), ('violence', 'Насилие'), ('discrimination', 'Дискриминация'), ('academic', 'Академические проблемы'), ('other', 'Другое')], max_length=32)),
+                ('status', models.CharField(choices=[('new', 'Новое'), ('in_progress', 'В работе'), ('resolved', 'Решено'), ('spam', 'Спам')], max_length=16)),
+                ('recaptcha_score', models.FloatField(blank=True, null=True)),
+                ('recaptcha_action', models.CharField(blank=True, max_length=64)),
+                ('recaptcha_latency_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('duplicate_of_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('school', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_messages', to='core.school')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('text', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('author', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_comments', to=settings.AUTH_USER_MODEL)),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='dashboard.archivedmessage')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedmessage',
+            index=models.Index(fields=['created_at', 'id'], name='dashboard_arch_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedmessage',
+            index=models.Index(fields=['school', 'created_at', 'id'], name='dashboard_arch_school_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_school(apps, schema_editor):
+    MessageSignatureBand = apps.get_model('dashboard', 'MessageSignatureBand')
+    Message = apps.get_model('dashboard', 'Message')
+    MessageSignatureBand.objects.update(
+        school=Subquery(Message.objects.filter(pk=OuterRef('message_id')).values('school_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_editablepage_rendered_html'),
+        ('dashboard', '0011_archive'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='messagesignatureband',
+            name='dashboard_sigband_lookup_idx',
+        ),
+        migrations.AddField(
+            model_name='messagesignatureband',
+            name='school',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.school'),
+        ),
+        migrations.RunPython(copy_school, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='messagesignatureband',
+            index=models.Index(fields=['band', 'value', 'school', 'created_at'], name='dashboard_sigband_school_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+from django.db import migrations
+
+SQLITE_COLUMNS = "tokenize='unicode61 remove_diacritics 2', prefix='3 4 5 6'"
+
+
+def _recreate_sqlite(schema_editor, with_school):
+    """FTS5 не поддерживает ADD COLUMN: таблица пересоздается с копированием документов"""
+    schema_editor.execute('ALTER TABLE dashboard_message_search RENAME TO dashboard_message_search_old')
+    if with_school:
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE dashboard_message_search USING fts5(document, school_id UNINDEXED, {SQLITE_COLUMNS})'
+        )
+        schema_editor.execute(
+            'INSERT INTO dashboard_message_search (rowid, document, school_id) '
+            'SELECT old.rowid, old.document, COALESCE(m.school_id, a.school_id) FROM dashboard_message_search_old old '
+            'LEFT JOIN dashboard_message m ON m.id = old.rowid '
+            'LEFT JOIN dashboard_archivedmessage a ON a.id = old.rowid'
+        )
+    else:
+        schema_editor.execute(f'CREATE VIRTUAL TABLE dashboard_message_search USING fts5(document, {SQLITE_COLUMNS})')
+        schema_editor.execute(
+            'INSERT INTO dashboard_message_search (rowid, document) SELECT rowid, document FROM dashboard_message_search_old'
+        )
+    schema_editor.execute('DROP TABLE dashboard_message_search_old')
+
+
+def add_school(apps, schema_editor):
+    """Копия school_id в индексе поиска (см. dashboard.search)"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _recreate_sqlite(schema_editor, with_school=True)
+    elif vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE dashboard_message_search ADD COLUMN school_id integer NULL')
+        for table in ('dashboard_message', 'dashboard_archivedmessage'):
+            schema_editor.execute(
+                f'UPDATE dashboard_message_search s SET school_id = m.school_id FROM {table} m WHERE m.id = s.message_id'
+            )
+        schema_editor.execute(
+            'CREATE INDEX dashboard_message_search_school ON dashboard_message_search (school_id, message_id)'
+        )
+
+
+def remove_school(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _recreate_sqlite(schema_editor, with_school=False)
+    elif vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE dashboard_message_search DROP COLUMN school_id')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0012_signature_band_school'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_school, remove_school),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:49
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_archived(apps, schema_editor):
+    ArchivedMessage = apps.get_model('dashboard', 'ArchivedMessage')
+    MessageCounter = apps.get_model('dashboard', 'MessageCounter')
+    for row in ArchivedMessage.objects.values('school_id', 'status', 'problem_type').annotate(total=Count('id')):
+        MessageCounter.objects.filter(
+            school_id=row['school_id'], status=row['status'], problem_type=row['problem_type'],
+        ).update(archived=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0013_message_search_school'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagecounter',
+            name='archived',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_archived, migrations.RunPython.noop),
+    ]
@@ -33,17 +33,147 @@ class Message(models.Model):
 	problem = models.TextField()
 	help = models.TextField()
 	contact = models.CharField(max_length=255, blank=True)
-	school = models.ForeignKey('core.School', on_delete=models.SET_NULL, null=True, blank=True, related_name='messages')
+	# Отдельный индекс FK не нужен: его заменяют составные индексы, начинающиеся со school
+	school = models.ForeignKey('core.School', on_delete=models.SET_NULL, null=True, blank=True, related_name='messages', db_index=False)
 	problem_type = models.CharField(max_length=32, choices=PROBLEM_TYPE_CHOICES, default=PROBLEM_TYPE_OTHER)
 	status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_NEW)
+	# Отложенная проверка reCAPTCHA: уведомления рассылаются только после проверки
+	verification_pending = models.BooleanField(default=False)
+	# Результат проверки reCAPTCHA v3 (пусто, если проверка не выполнялась)
+	recaptcha_score = models.FloatField(null=True, blank=True)
+	recaptcha_action = models.CharField(max_length=64, blank=True)
+	recaptcha_latency_ms = models.PositiveIntegerField(null=True, blank=True)
+	# Исходное сообщение, если текст почти совпадает с недавним (см. dashboard.duplicates)
+	duplicate_of = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='duplicates')
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
+	class Meta:
+		indexes = [
+			# Списки сообщений (панель, dashboard, бот): фильтр по школе, статусу
+			# и типу проблемы, сортировка по -created_at (id - для одинакового времени)
+			models.Index(fields=['created_at', 'id'], name='dashboard_msg_created_idx'),
+			models.Index(fields=['school', 'created_at', 'id'], name='dashboard_msg_school_idx'),
+			models.Index(fields=['status', 'created_at', 'id'], name='dashboard_msg_status_idx'),
+			models.Index(fields=['problem_type', 'created_at', 'id'], name='dashboard_msg_type_idx'),
+			models.Index(fields=['school', 'status', 'created_at', 'id'], name='dashboard_msg_sch_status_idx'),
+			# Поиск измененных сообщений для инкрементальной rollup_stats
+			models.Index(fields=['updated_at'], name='dashboard_msg_updated_idx'),
+		]
+
 	def __str__(self):
 		return f"{self.problem[:30]}... ({self.get_status_display()})"
 
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		# Значения из БД нужны счетчикам MessageCounter при изменении сообщения
+		if {'school_id', 'status', 'problem_type'}.issubset(field_names):
+			instance._counter_key = (instance.school_id, instance.status, instance.problem_type)
+		return instance
+
+class MessageCounter(models.Model):
+	"""Количество сообщений по (школа, статус, тип проблемы), см. dashboard.counters"""
+	school = models.ForeignKey('core.School', on_delete=models.CASCADE, null=True, blank=True, related_name='message_counters')
+	status = models.CharField(max_length=16, choices=Message.STATUS_CHOICES)
+	problem_type = models.CharField(max_length=32, choices=Message.PROBLEM_TYPE_CHOICES)
+	count = models.IntegerField(default=0)
+	# Сколько из count перенесено в архив: списки панели читают только Message
+	archived = models.IntegerField(default=0)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(
+				fields=['school', 'status', 'problem_type'],
+				condition=models.Q(school__isnull=False),
+				name='dashboard_counter_school_uniq',
+			),
+			# Общие сообщения (без школы): NULL в уникальном индексе не сравнивается
+			models.UniqueConstraint(
+				fields=['status', 'problem_type'],
+				condition=models.Q(school__isnull=True),
+				name='dashboard_counter_general_uniq',
+			),
+		]
+
+	def __str__(self):
+		return f"{self.school or 'Общие'}: {self.status}/{self.problem_type} = {self.count}"
+
+class MessageSignatureBand(models.Model):
+	"""Полоса MinHash-сигнатуры текста сообщения (LSH) для поиска почти одинаковых сообщений"""
+	message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='signature_bands')
+	band = models.PositiveSmallIntegerField()
+	value = models.BigIntegerField()
+	# Копии Message.school и Message.created_at: школа и окно поиска ограничиваются по индексу без JOIN
+	school = models.ForeignKey('core.School', on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_index=False)
+	created_at = models.DateTimeField()
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['band', 'value', 'school', 'created_at'], name='dashboard_sigband_school_idx'),
+		]
+
+class MessageDailyStat(models.Model):
+	"""Количество сообщений за день по (школа, тип проблемы, статус), см. dashboard.rollup"""
+	date = models.DateField()
+	school = models.ForeignKey('core.School', on_delete=models.CASCADE, null=True, blank=True, related_name='daily_stats')
+	problem_type = models.CharField(max_length=32, choices=Message.PROBLEM_TYPE_CHOICES)
+	status = models.CharField(max_length=16, choices=Message.STATUS_CHOICES)
+	count = models.IntegerField(default=0)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['date'], name='dashboard_daily_date_idx'),
+			models.Index(fields=['school', 'date'], name='dashboard_daily_school_idx'),
+		]
+
+class StatsRollupState(models.Model):
+	"""Момент последнего запуска rollup_stats (одна строка)"""
+	last_run_at = models.DateTimeField(null=True, blank=True)
+
+class StatsDirtyDay(models.Model):
+	"""День, который нужно пересчитать: сообщения удалены или перенесены без изменения updated_at"""
+	date = models.DateField(unique=True)
+
 class InternalComment(models.Model):
 	message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='comments')
 	author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
 	text = models.TextField()
 	created_at = models.DateTimeField(auto_now_add=True)
+
+class ArchivedMessage(models.Model):
+	"""Решенное сообщение или спам, перенесенное из Message командой archive_messages (см. dashboard.archive)"""
+	# id исходного сообщения: ссылки и строка полнотекстового индекса остаются прежними
+	id = models.BigIntegerField(primary_key=True)
+	problem = models.TextField()
+	help = models.TextField()
+	contact = models.CharField(max_length=255, blank=True)
+	school = models.ForeignKey('core.School', on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_messages', db_index=False)
+	problem_type = models.CharField(max_length=32, choices=Message.PROBLEM_TYPE_CHOICES)
+	status = models.CharField(max_length=16, choices=Message.STATUS_CHOICES)
+	recaptcha_score = models.FloatField(null=True, blank=True)
+	recaptcha_action = models.CharField(max_length=64, blank=True)
+	recaptcha_latency_ms = models.PositiveIntegerField(null=True, blank=True)
+	# Без внешнего ключа: исходное сообщение может быть как в Message, так и в архиве
+	duplicate_of_id = models.BigIntegerField(null=True, blank=True)
+	created_at = models.DateTimeField()
+	updated_at = models.DateTimeField()
+	archived_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		indexes = [
+			# Поиск в архиве из панели: те же сортировка и фильтр по школе, что у Message
+			models.Index(fields=['created_at', 'id'], name='dashboard_arch_created_idx'),
+			models.Index(fields=['school', 'created_at', 'id'], name='dashboard_arch_school_idx'),
+		]
+
+	def __str__(self):
+		return f"{self.problem[:30]}... ({self.get_status_display()}, архив)"
+
+class ArchivedComment(models.Model):
+	"""Внутренний комментарий архивного сообщения"""
+	id = models.BigIntegerField(primary_key=True)
+	message = models.ForeignKey(ArchivedMessage, on_delete=models.CASCADE, related_name='comments')
+	author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='archived_comments')
+	text = models.TextField()
+	created_at = models.DateTimeField()
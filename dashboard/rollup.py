@@ -0,0 +1,86 @@
+"""Дневная статистика сообщений (MessageDailyStat) для графиков в панели.
+
+Команда rollup_stats пересчитывает только дни, в которых что-то изменилось
+с прошлого запуска: дни создания сообщений с updated_at не раньше отметки
+StatsRollupState и дни из StatsDirtyDay (удаления, удаление школы). День
+пересчитывается целиком, поэтому повторный запуск безопасен. Архивные
+сообщения (ArchivedMessage) учитываются наравне с Message: перенос в архив
+статистику не меняет.
+"""
+from datetime import datetime, time, timedelta
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Message, ArchivedMessage, MessageDailyStat, StatsRollupState, StatsDirtyDay
+
+
+def mark_dirty(dates):
+	"""Отметка дней для пересчета при следующем запуске rollup_stats"""
+	StatsDirtyDay.objects.bulk_create(
+		[StatsDirtyDay(date=date) for date in set(dates)],
+		ignore_conflicts=True,
+	)
+
+
+def _day_bounds(day):
+	start = timezone.make_aware(datetime.combine(day, time.min))
+	return start, start + timedelta(days=1)
+
+
+def rollup_day(day):
+	"""Пересчет одного дня. Возвращает количество строк MessageDailyStat"""
+	start, end = _day_bounds(day)
+	totals = {}
+	for model in (Message, ArchivedMessage):
+		rows = (
+			model.objects.filter(created_at__gte=start, created_at__lt=end)
+			.values('school_id', 'problem_type', 'status')
+			.annotate(total=Count('id'))
+		)
+		for row in rows:
+			key = (row['school_id'], row['problem_type'], row['status'])
+			totals[key] = totals.get(key, 0) + row['total']
+	stats = [
+		MessageDailyStat(date=day, school_id=school_id, problem_type=problem_type, status=status, count=count)
+		for (school_id, problem_type, status), count in totals.items()
+	]
+	with transaction.atomic():
+		MessageDailyStat.objects.filter(date=day).delete()
+		MessageDailyStat.objects.bulk_create(stats)
+	return len(stats)
+
+
+def touched_days(since=None):
+	"""Дни, требующие пересчета; без отметки - все дни с сообщениями, включая архив"""
+	messages = Message.objects.all()
+	if since is not None:
+		messages = messages.filter(updated_at__gte=since)
+	days = set(
+		messages.annotate(day=TruncDate('created_at')).values_list('day', flat=True).distinct()
+	)
+	if since is None:
+		days.update(
+			ArchivedMessage.objects.annotate(day=TruncDate('created_at')).values_list('day', flat=True).distinct()
+		)
+	days.update(StatsDirtyDay.objects.values_list('date', flat=True))
+	return sorted(days)
+
+
+def run_rollup(full=False):
+	"""Инкрементальный пересчет. Возвращает список пересчитанных дней"""
+	state, _ = StatsRollupState.objects.get_or_create(pk=1)
+	# Отметка берется до чтения: изменения во время пересчета попадут в следующий запуск
+	started = timezone.now()
+	since = None if full or state.last_run_at is None else state.last_run_at
+
+	days = touched_days(since)
+	if full:
+		MessageDailyStat.objects.exclude(date__in=days).delete()
+	for day in days:
+		rollup_day(day)
+
+	StatsDirtyDay.objects.filter(date__in=days).delete()
+	state.last_run_at = started
+	state.save(update_fields=['last_run_at'])
+	return days
@@ -0,0 +1,175 @@
+"""Полнотекстовый поиск по сообщениям (problem, help и внутренние комментарии).
+
+Индекс хранится в отдельной таблице dashboard_message_search: в SQLite это
+виртуальная таблица FTS5 (rowid = id сообщения), в PostgreSQL - tsvector
+с GIN-индексом. Индекс обновляется сигналами (dashboard.signals) при
+сохранении сообщений и комментариев; bulk_create и загрузку данных
+догоняет команда rebuild_search_index. Архивные сообщения (dashboard.archive)
+сохраняют id и остаются в индексе.
+
+Поиск возвращает подзапрос id, поэтому фильтры по роли, статусу и
+сортировка остаются в том же SQL-запросе. Подзапрос ограничен
+SEARCH_MAX_MATCHES самыми новыми совпадениями: частое слово не заставляет
+читать весь индекс. Индекс хранит копию school_id, поэтому поиск учителя
+ограничивается его школой внутри подзапроса и лимит не отсекает старые
+совпадения своей школы более новыми из других школ. Слова длиннее STEM_LENGTH обрезаются до префикса -
+грубая замена стемминга для русских и казахских окончаний.
+"""
+import re
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .models import Message, InternalComment, ArchivedMessage, ArchivedComment
+
+SEARCH_TABLE = 'dashboard_message_search'
+# Конфигурация PostgreSQL: 'simple' не зависит от языка (русский и казахский)
+SEARCH_CONFIG = getattr(settings, 'SEARCH_CONFIG', 'simple')
+SEARCH_MAX_MATCHES = getattr(settings, 'SEARCH_MAX_MATCHES', 5000)
+MAX_QUERY_TERMS = 8
+# Длины префиксов, для которых в FTS5 построен префиксный индекс (см. миграцию 0010)
+MIN_PREFIX_LENGTH = 3
+STEM_LENGTH = 6
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_supported(using=None):
+	return (using or connection).vendor in ('sqlite', 'postgresql')
+
+
+def _terms(query):
+	"""Слова запроса в нижнем регистре; операторы FTS из ввода не передаются"""
+	return [term.lower() for term in WORD_RE.findall(query)][:MAX_QUERY_TERMS]
+
+
+def _match_sql(terms, max_matches=SEARCH_MAX_MATCHES, school_id=None):
+	"""Подзапрос id самых новых сообщений, содержащих все слова (max_matches=None - все)"""
+	# Короткие слова ищутся точно, остальные - по префиксу не длиннее STEM_LENGTH
+	terms = [(term[:STEM_LENGTH], len(term) >= MIN_PREFIX_LENGTH) for term in terms]
+	limit = '' if max_matches is None else ' LIMIT %s'
+	school = '' if school_id is None else ' AND school_id = %s'
+	if connection.vendor == 'sqlite':
+		expression = ' '.join(f'"{term}"*' if prefix else f'"{term}"' for term, prefix in terms)
+		sql = f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s{school} ORDER BY rowid DESC{limit}'
+		params = [expression]
+	else:
+		expression = ' & '.join(f"'{term}':*" if prefix else f"'{term}'" for term, prefix in terms)
+		sql = (
+			f'SELECT message_id FROM {SEARCH_TABLE} WHERE document @@ to_tsquery(%s::regconfig, %s){school} '
+			f'ORDER BY message_id DESC{limit}'
+		)
+		params = [SEARCH_CONFIG, expression]
+	if school_id is not None:
+		params.append(school_id)
+	if max_matches is not None:
+		params.append(max_matches)
+	return sql, params
+
+
+def search_messages(queryset, query, max_matches=SEARCH_MAX_MATCHES, school_id=None):
+	"""Сообщения queryset (Message или ArchivedMessage), содержащие все слова запроса.
+
+	school_id - школа, которой уже ограничен queryset (учитель): фильтр
+	повторяется в подзапросе, чтобы лимит считался только по этой школе.
+	"""
+	terms = _terms(query)
+	if not terms:
+		return queryset
+	if not is_supported():
+		condition = Q()
+		for term in terms:
+			condition &= Q(problem__icontains=term) | Q(help__icontains=term) | Q(comments__text__icontains=term)
+		return queryset.filter(condition).distinct()
+	return queryset.filter(id__in=RawSQL(*_match_sql(terms, max_matches, school_id)))
+
+
+def _document(message_id, problem, help_text):
+	comments = InternalComment.objects.filter(message_id=message_id).values_list('text', flat=True)
+	return '\n'.join([problem or '', help_text or '', *comments])
+
+
+def _write(cursor, message_id, document, school_id):
+	if connection.vendor == 'sqlite':
+		cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [message_id])
+		cursor.execute(
+			f'INSERT INTO {SEARCH_TABLE} (rowid, document, school_id) VALUES (%s, %s, %s)',
+			[message_id, document, school_id],
+		)
+	else:
+		cursor.execute(
+			f'INSERT INTO {SEARCH_TABLE} (message_id, document, school_id) VALUES (%s, to_tsvector(%s::regconfig, %s), %s) '
+			'ON CONFLICT (message_id) DO UPDATE SET document = EXCLUDED.document, school_id = EXCLUDED.school_id',
+			[message_id, SEARCH_CONFIG, document, school_id],
+		)
+
+
+def index_message(message_id):
+	"""Переиндексация одного сообщения"""
+	if not is_supported():
+		return
+	row = Message.objects.filter(pk=message_id).values_list('problem', 'help', 'school_id').first()
+	if row is None:
+		return
+	problem, help_text, school_id = row
+	with connection.cursor() as cursor:
+		_write(cursor, message_id, _document(message_id, problem, help_text), school_id)
+
+
+def index_messages(message_ids, batch_size=1000):
+	"""Переиндексация нескольких сообщений: комментарии из bulk_create сигналов не вызывают"""
+	if not is_supported():
+		return
+	with connection.cursor() as cursor:
+		_index_rows(cursor, Message.objects.filter(id__in=message_ids), InternalComment, batch_size)
+
+
+def unindex_message(message_id):
+	if not is_supported():
+		return
+	column = 'rowid' if connection.vendor == 'sqlite' else 'message_id'
+	with connection.cursor() as cursor:
+		cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {column} = %s', [message_id])
+
+
+def clear_school(school_id):
+	"""Школа удаляется: ее сообщения становятся общими (SET_NULL без сигналов)"""
+	if not is_supported():
+		return
+	with connection.cursor() as cursor:
+		cursor.execute(f'UPDATE {SEARCH_TABLE} SET school_id = NULL WHERE school_id = %s', [school_id])
+
+
+def _index_rows(cursor, messages, comment_model, batch_size):
+	total = 0
+	last_id = 0
+	while True:
+		rows = list(
+			messages.filter(id__gt=last_id).order_by('id').values_list('id', 'problem', 'help', 'school_id')[:batch_size]
+		)
+		if not rows:
+			break
+		comments = {}
+		for message_id, text in comment_model.objects.filter(
+			message_id__in=[row[0] for row in rows]
+		).order_by('id').values_list('message_id', 'text'):
+			comments.setdefault(message_id, []).append(text)
+		for message_id, problem, help_text, school_id in rows:
+			_write(cursor, message_id, '\n'.join([problem or '', help_text or '', *comments.get(message_id, [])]), school_id)
+		total += len(rows)
+		last_id = rows[-1][0]
+	return total
+
+
+def rebuild_index(batch_size=1000):
+	"""Полная перестройка индекса (сообщения и архив). Возвращает число проиндексированных сообщений"""
+	if not is_supported():
+		return 0
+	with connection.cursor() as cursor:
+		cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+		total = _index_rows(cursor, Message.objects.all(), InternalComment, batch_size)
+		total += _index_rows(cursor, ArchivedMessage.objects.all(), ArchivedComment, batch_size)
+		if connection.vendor == 'sqlite':
+			# Слияние сегментов FTS5 после массовой вставки
+			cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+	return total
@@ -0,0 +1,81 @@
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from core.models import School
+from .archive import is_archiving
+from .counters import adjust_counter, fold_school_counters
+from .models import Message, MessageDailyStat, InternalComment, ArchivedMessage
+from .rollup import mark_dirty
+from .search import index_message, unindex_message, clear_school
+
+
+def _counter_key(message):
+	return (message.school_id, message.status, message.problem_type)
+
+
+@receiver(pre_save, sender=Message)
+def remember_counter_key(sender, instance, **kwargs):
+	"""Сообщение изменяется без загрузки из БД - берем исходные значения запросом"""
+	if instance.pk is not None and not hasattr(instance, '_counter_key'):
+		instance._counter_key = (
+			Message.objects.filter(pk=instance.pk).values_list('school_id', 'status', 'problem_type').first()
+		)
+
+
+@receiver(post_save, sender=Message)
+def update_counters_on_save(sender, instance, created, **kwargs):
+	"""Учет нового сообщения или переноса в другой статус, тип или школу"""
+	new_key = _counter_key(instance)
+	old_key = None if created else getattr(instance, '_counter_key', None)
+	if old_key != new_key:
+		if old_key is not None:
+			adjust_counter(*old_key, -1)
+		adjust_counter(*new_key, 1)
+	instance._counter_key = new_key
+
+
+@receiver(post_delete, sender=Message)
+def update_counters_on_delete(sender, instance, **kwargs):
+	# Перенос в архив: сообщение остается в счетчиках и дневной статистике
+	if is_archiving():
+		return
+	adjust_counter(*getattr(instance, '_counter_key', _counter_key(instance)), -1)
+	if instance.created_at:
+		mark_dirty([timezone.localdate(instance.created_at)])
+
+
+@receiver(post_save, sender=Message)
+def update_search_index_on_save(sender, instance, created, update_fields=None, **kwargs):
+	"""Переиндексация при изменении текста или школы: смена статуса индекс не трогает"""
+	if created or update_fields is None or {'problem', 'help', 'school'} & set(update_fields):
+		index_message(instance.pk)
+
+
+@receiver(post_delete, sender=Message)
+def update_search_index_on_delete(sender, instance, **kwargs):
+	if not is_archiving():
+		unindex_message(instance.pk)
+
+
+@receiver(post_delete, sender=ArchivedMessage)
+def forget_archived_message(sender, instance, **kwargs):
+	"""Удаление из архива: сообщение больше не учитывается в статистике и поиске"""
+	adjust_counter(*_counter_key(instance), -1, -1)
+	mark_dirty([timezone.localdate(instance.created_at)])
+	unindex_message(instance.pk)
+
+
+@receiver(post_save, sender=InternalComment)
+@receiver(post_delete, sender=InternalComment)
+def update_search_index_on_comment(sender, instance, **kwargs):
+	# При переносе в архив текст комментариев остается в строке индекса
+	if not is_archiving():
+		index_message(instance.message_id)
+
+
+@receiver(pre_delete, sender=School)
+def fold_counters_on_school_delete(sender, instance, **kwargs):
+	fold_school_counters(instance.pk)
+	clear_school(instance.pk)
+	# Сообщения школы переходят в общие без изменения updated_at
+	mark_dirty(MessageDailyStat.objects.filter(school=instance).values_list('date', flat=True).distinct())
@@ -1,3 +1,506 @@
+import io
+import random
+from datetime import timedelta
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from core.models import School, User
+from core.pagination import encode_cursor, FORWARD, BACKWARD
+from core.telegram_bot import DatabaseOptimizer
+from core.stats import SCOPE_ALL, count_messages, get_message_stats
+from .archive import archive_messages
+from .bulk import apply_bulk_action, parse_message_ids
+from .counters import rebuild_counters, update_status
+from .duplicates import compute_signature, prune_signature_bands, register_message, BANDS, DUPLICATE_WINDOW_DAYS
+from .models import Message, InternalComment, ArchivedMessage, MessageCounter, MessageDailyStat, MessageSignatureBand
+from .rollup import run_rollup
+from .search import search_messages
 
-# Create your tests here.
+SEED_MESSAGES = 20000
+SEED_SCHOOLS = 50
+
+
+class MessageQueryPlanTests(TestCase):
+	"""Списки сообщений должны идти по индексам без полного сканирования и сортировки.
+
+	Таблица заполняется большим набором данных и анализируется (ANALYZE), после
+	чего для каждого запроса списка проверяется EXPLAIN (SQLite или PostgreSQL).
+	"""
+
+	@classmethod
+	def setUpTestData(cls):
+		rnd = random.Random(42)
+		cls.schools = School.objects.bulk_create([School(name=f'Школа {i}', unique_code=f'plan{i}') for i in range(SEED_SCHOOLS)])
+		cls.school = cls.schools[0]
+		statuses = [status for status, _ in Message.STATUS_CHOICES]
+		problem_types = [problem_type for problem_type, _ in Message.PROBLEM_TYPE_CHOICES]
+		now = timezone.now()
+		Message.objects.bulk_create([
+			Message(
+				problem='Текст сообщения',
+				help='Помощь',
+				school=rnd.choice(cls.schools + [None]),
+				status=rnd.choice(statuses),
+				problem_type=rnd.choice(problem_types),
+			)
+			for _ in range(SEED_MESSAGES)
+		], batch_size=2000)
+		# Разносим время создания, чтобы сортировка была реальной
+		with connection.cursor() as cursor:
+			for message_id in Message.objects.values_list('id', flat=True)[::97]:
+				Message.objects.filter(id=message_id).update(created_at=now - timedelta(minutes=rnd.randint(0, 500000)))
+			cursor.execute('ANALYZE')
+
+		cls.rayon = User.objects.create_user('plan_rayon', password='pw', role=User.RAYON_OTDEL)
+		cls.teacher = User.objects.create_user('plan_teacher', password='pw', role=User.TEACHER, school=cls.school)
+
+	def _explain(self, sql):
+		with connection.cursor() as cursor:
+			if connection.vendor == 'sqlite':
+				cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+				return '\n'.join(row[-1] for row in cursor.fetchall())
+			cursor.execute(f'EXPLAIN {sql}')
+			return '\n'.join(row[0] for row in cursor.fetchall())
+
+	def assertIndexedPlan(self, sql, filtered=True):
+		plan = self._explain(sql)
+		if connection.vendor == 'sqlite':
+			self.assertNotRegex(plan, r'SCAN (dashboard_message|"dashboard_message")(?! USING)', f'Полное сканирование:\n{plan}\n{sql}')
+			self.assertNotIn('TEMP B-TREE', plan, f'Сортировка во временном B-дереве:\n{plan}\n{sql}')
+			if filtered:
+				self.assertRegex(plan, r'SEARCH "?dashboard_message"? USING (COVERING )?INDEX', f'Фильтр не использует индекс:\n{plan}\n{sql}')
+		elif connection.vendor == 'postgresql':
+			self.assertNotIn('Seq Scan on dashboard_message', plan, f'Полное сканирование:\n{plan}\n{sql}')
+			self.assertNotRegex(plan, r'(^|\s)Sort\b', f'Отдельная сортировка:\n{plan}\n{sql}')
+		else:
+			self.skipTest(f'EXPLAIN для {connection.vendor} не проверяется')
+
+	def assertQuerysetIndexed(self, queryset, filtered=True):
+		sql, params = queryset.query.sql_with_params()
+		with connection.cursor() as cursor:
+			sql = connection.ops.last_executed_query(cursor, sql, params) if connection.vendor == 'sqlite' else cursor.mogrify(sql, params).decode()
+		self.assertIndexedPlan(sql, filtered)
+
+	def _cursor(self, direction, school=None):
+		"""Курсор из середины списка (глубокая страница)"""
+		queryset = Message.objects.filter(school=school) if school else Message.objects.all()
+		message = queryset.order_by('-created_at', '-id')[queryset.count() // 2]
+		return encode_cursor(message, direction)
+
+	def _list_queries(self, user, url):
+		"""SQL запросов к dashboard_message с сортировкой, выполненных страницей"""
+		self.client.force_login(user)
+		with CaptureQueriesContext(connection) as context:
+			response = self.client.get(url)
+		self.assertEqual(response.status_code, 200)
+		queries = [
+			query['sql'] for query in context.captured_queries
+			if 'FROM "dashboard_message"' in query['sql'] and 'ORDER BY' in query['sql']
+		]
+		self.assertTrue(queries, f'Страница {url} не выполнила запрос списка')
+		return queries
+
+	def test_staff_messages_list(self):
+		cases = [
+			(self.rayon, '/staff/messages/', False),
+			(self.rayon, '/staff/messages/?status=new', True),
+			(self.rayon, '/staff/messages/?problem_type=bullying', True),
+			(self.rayon, f'/staff/messages/?status=resolved&cursor={self._cursor(FORWARD)}', True),
+			(self.rayon, f'/staff/messages/?cursor={self._cursor(FORWARD)}', False),
+			(self.rayon, f'/staff/messages/?cursor={self._cursor(BACKWARD)}', False),
+			(self.teacher, '/staff/messages/', True),
+			(self.teacher, '/staff/messages/?status=new', True),
+			(self.teacher, '/staff/messages/?problem_type=violence', True),
+			(self.teacher, f'/staff/messages/?cursor={self._cursor(FORWARD, self.school)}', True),
+			(self.teacher, f'/staff/messages/?status=new&cursor={self._cursor(BACKWARD, self.school)}', True),
+		]
+		for user, url, filtered in cases:
+			with self.subTest(user=user.role, url=url):
+				for sql in self._list_queries(user, url):
+					self.assertIndexedPlan(sql, filtered)
+
+	def test_staff_dashboard_recent_messages(self):
+		for user in (self.rayon, self.teacher):
+			with self.subTest(user=user.role):
+				for sql in self._list_queries(user, '/staff/'):
+					self.assertIndexedPlan(sql, filtered=user.role == User.TEACHER)
+
+	def test_dashboard_app_list(self):
+		cases = [
+			(self.rayon, '/dashboard/', False),
+			(self.rayon, '/dashboard/?status=new', True),
+			(self.teacher, '/dashboard/', True),
+			(self.teacher, '/dashboard/?status=in_progress', True),
+			(self.teacher, f'/dashboard/?cursor={self._cursor(FORWARD, self.school)}', True),
+		]
+		for user, url, filtered in cases:
+			with self.subTest(user=user.role, url=url):
+				for sql in self._list_queries(user, url):
+					self.assertIndexedPlan(sql, filtered)
+
+	def test_bot_message_lists(self):
+		page = slice(0, 5)
+		cases = [
+			(DatabaseOptimizer.get_messages_with_relations(Message.STATUS_IN_PROGRESS), True),
+			(DatabaseOptimizer.get_messages_with_relations(Message.STATUS_IN_PROGRESS, self.school), True),
+			(Message.objects.filter(status=Message.STATUS_NEW).order_by('-created_at'), True),
+			(Message.objects.filter(school=self.school, status=Message.STATUS_RESOLVED).order_by('-created_at'), True),
+			(Message.objects.filter(school=self.school).order_by('-created_at'), True),
+			(Message.objects.filter(school__isnull=True).order_by('-created_at'), True),
+			(Message.objects.all().order_by('-created_at'), False),
+		]
+		for queryset, filtered in cases:
+			with self.subTest(query=str(queryset.query.where)):
+				self.assertQuerysetIndexed(queryset[page], filtered)
+
+
+class KeysetPaginationTests(TestCase):
+	"""Курсорная пагинация проходит список без пропусков и повторов в обе стороны"""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.school = School.objects.create(name='Школа', unique_code='pages')
+		now = timezone.now()
+		messages = Message.objects.bulk_create([
+			Message(problem='Текст', help='Помощь', school=cls.school, status=Message.STATUS_NEW if i % 3 else Message.STATUS_RESOLVED)
+			for i in range(55)
+		])
+		# Одинаковое время у части сообщений: порядок должен держаться на id
+		for i, message in enumerate(messages):
+			Message.objects.filter(id=message.id).update(created_at=now - timedelta(minutes=i // 4))
+		# bulk_create не вызывает сигналы счетчиков
+		rebuild_counters()
+		cls.rayon = User.objects.create_user('pages_rayon', password='pw', role=User.RAYON_OTDEL)
+
+	def _walk(self, url):
+		self.client.force_login(self.rayon)
+		pages = []
+		while url:
+			page = self.client.get(url).context['messages']
+			pages.append([message.id for message in page])
+			url = page.next_url and f'/staff/messages/{page.next_url}'
+		return pages, page
+
+	def test_forward_and_back(self):
+		expected = list(Message.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+		pages, last_page = self._walk('/staff/messages/')
+		self.assertEqual(sum(pages, []), expected)
+		self.assertEqual([len(ids) for ids in pages], [20, 20, 15])
+
+		page = last_page
+		for ids in reversed(pages[:-1]):
+			page = self.client.get(f'/staff/messages/{page.previous_url}').context['messages']
+			self.assertEqual([message.id for message in page], ids)
+		self.assertFalse(page.has_previous)
+
+	def test_filters_preserved(self):
+		pages, last_page = self._walk('/staff/messages/?status=new')
+		expected = list(Message.objects.filter(status=Message.STATUS_NEW).order_by('-created_at', '-id').values_list('id', flat=True))
+		self.assertEqual(sum(pages, []), expected)
+		self.assertIn('status=new', last_page.previous_url)
+		self.assertEqual(self.client.get('/staff/messages/?status=new').context['total'], len(expected))
+
+	def test_bad_cursor_opens_first_page(self):
+		self.client.force_login(self.rayon)
+		page = self.client.get('/staff/messages/?cursor=forged').context['messages']
+		self.assertEqual(len(page), 20)
+		self.assertFalse(page.has_previous)
+
+
+class MessageSearchTests(TestCase):
+	"""Полнотекстовый поиск по тексту, просьбе о помощи и комментариям с учетом роли"""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.school = School.objects.create(name='Школа', unique_code='search1')
+		cls.other_school = School.objects.create(name='Другая школа', unique_code='search2')
+		cls.canteen = Message.objects.create(problem='Меня обижают одноклассники в столовой', help='Поговорите с учителем', school=cls.school)
+		cls.money = Message.objects.create(problem='Старшеклассники отбирают деньги', help='', school=cls.other_school)
+		InternalComment.objects.create(message=cls.money, text='Передано инспектору полиции')
+		cls.rayon = User.objects.create_user('search_rayon', password='pw', role=User.RAYON_OTDEL)
+		cls.teacher = User.objects.create_user('search_teacher', password='pw', role=User.TEACHER, school=cls.school)
+
+	def _found(self, query, queryset=None):
+		return set(search_messages(queryset or Message.objects.all(), query).values_list('id', flat=True))
+
+	def test_word_forms_and_comments(self):
+		self.assertEqual(self._found('столовая'), {self.canteen.id})
+		self.assertEqual(self._found('одноклассниками учитель'), {self.canteen.id})
+		self.assertEqual(self._found('инспектор'), {self.money.id})
+		self.assertEqual(self._found('деньги столовая'), set())
+		# Синтаксис FTS из ввода не интерпретируется
+		self.assertEqual(self._found('"деньги OR NEAR('), set())
+
+	def test_index_follows_changes(self):
+		self.canteen.problem = 'Текст исправлен'
+		self.canteen.save()
+		self.assertEqual(self._found('столовая'), set())
+		self.assertEqual(self._found('исправлен'), {self.canteen.id})
+
+		comment = InternalComment.objects.create(message=self.canteen, text='Связались с родителями')
+		self.assertEqual(self._found('родители'), {self.canteen.id})
+		comment.delete()
+		self.assertEqual(self._found('родители'), set())
+
+		self.money.delete()
+		self.assertEqual(self._found('деньги'), set())
+
+	def test_limit_counts_only_teacher_school(self):
+		for i in range(3):
+			Message.objects.create(problem=f'Драка в столовой {i}', help='', school=self.other_school)
+		own = Message.objects.filter(school=self.school)
+		# Лимит на все школы отсекает старое совпадение своей школы, лимит внутри школы - нет
+		self.assertEqual(set(search_messages(own, 'столовая', max_matches=3).values_list('id', flat=True)), set())
+		self.assertEqual(
+			set(search_messages(own, 'столовая', max_matches=3, school_id=self.school.id).values_list('id', flat=True)),
+			{self.canteen.id},
+		)
+
+		# Перенос в другую школу и удаление школы обновляют копию school_id в индексе
+		self.canteen.school = self.other_school
+		self.canteen.save()
+		self.assertEqual(set(search_messages(Message.objects.all(), 'обижают', school_id=self.other_school.id).values_list('id', flat=True)), {self.canteen.id})
+		other_school_id = self.other_school.id
+		self.other_school.delete()
+		self.assertEqual(set(search_messages(Message.objects.all(), 'обижают', school_id=other_school_id).values_list('id', flat=True)), set())
+
+	def test_role_scoping(self):
+		self.client.force_login(self.teacher)
+		self.assertEqual([m.id for m in self.client.get('/staff/messages/?q=инспектор').context['messages']], [])
+		self.assertEqual([m.id for m in self.client.get('/dashboard/?q=столовой').context['messages']], [self.canteen.id])
+		self.client.force_login(self.rayon)
+		self.assertEqual([m.id for m in self.client.get('/staff/messages/?q=инспектор').context['messages']], [self.money.id])
+
+
+class MessageArchiveTests(TestCase):
+	"""Перенос старых решенных сообщений в архив без изменения статистики"""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.school = School.objects.create(name='Школа', unique_code='archive1')
+		old = timezone.now() - timedelta(days=200)
+		cls.resolved = Message.objects.create(problem='Старая драка в раздевалке', help='', school=cls.school, status=Message.STATUS_RESOLVED)
+		cls.spam = Message.objects.create(problem='Реклама', help='', school=cls.school, status=Message.STATUS_SPAM)
+		cls.open = Message.objects.create(problem='Старая драка, еще в работе', help='', school=cls.school, status=Message.STATUS_IN_PROGRESS)
+		cls.recent = Message.objects.create(problem='Свежая драка в раздевалке', help='', school=cls.school, status=Message.STATUS_RESOLVED)
+		InternalComment.objects.create(message=cls.resolved, text='Разговор с родителями')
+		Message.objects.filter(id__in=[cls.resolved.id, cls.spam.id, cls.open.id]).update(updated_at=old)
+		cls.teacher = User.objects.create_user('archive_teacher', password='pw', role=User.TEACHER, school=cls.school)
+
+	def test_moves_only_old_closed_messages(self):
+		run_rollup(full=True)
+		daily = list(MessageDailyStat.objects.values_list('status', 'count').order_by('status'))
+		total = get_message_stats(SCOPE_ALL)['total']
+
+		self.assertEqual(archive_messages(days=90, batch_size=1, pause=0), 2)
+
+		self.assertEqual(set(ArchivedMessage.objects.values_list('id', flat=True)), {self.resolved.id, self.spam.id})
+		self.assertEqual(set(Message.objects.values_list('id', flat=True)), {self.open.id, self.recent.id})
+		self.assertEqual(list(ArchivedMessage.objects.get(id=self.resolved.id).comments.values_list('text', flat=True)), ['Разговор с родителями'])
+		# Статистика включает архив, итог списков - только Message
+		cache.clear()
+		self.assertEqual(get_message_stats(SCOPE_ALL)['total'], total)
+		self.assertEqual(count_messages(), 2)
+		self.assertEqual(count_messages(school=self.school, status=Message.STATUS_RESOLVED), 1)
+		self.assertEqual(rebuild_counters(), 0)
+		MessageCounter.objects.update(archived=0)
+		self.assertEqual(rebuild_counters(), 2)
+		self.assertEqual(count_messages(), 2)
+		run_rollup(full=True)
+		self.assertEqual(list(MessageDailyStat.objects.values_list('status', 'count').order_by('status')), daily)
+		self.assertEqual(archive_messages(days=90, pause=0), 0)
+
+	def test_original_with_hot_duplicates_stays(self):
+		Message.objects.filter(id=self.open.id).update(duplicate_of=self.spam.id)
+		archive_messages(days=90, pause=0)
+		self.assertTrue(Message.objects.filter(id=self.spam.id).exists())
+		self.assertEqual(Message.objects.get(id=self.open.id).duplicate_of_id, self.spam.id)
+
+		# Дубликат закрыт и ушел в архив - за ним уходит исходное сообщение
+		Message.objects.filter(id=self.open.id).update(status=Message.STATUS_SPAM)
+		archive_messages(days=90, pause=0)
+		archive_messages(days=90, pause=0)
+		self.assertEqual(ArchivedMessage.objects.get(id=self.open.id).duplicate_of_id, self.spam.id)
+		self.assertTrue(ArchivedMessage.objects.filter(id=self.spam.id).exists())
+
+	def test_list_total_excludes_archive(self):
+		archive_messages(days=90, pause=0)
+		self.client.force_login(self.teacher)
+		self.assertEqual(self.client.get('/staff/messages/').context['total'], 2)
+		self.assertEqual(self.client.get('/dashboard/').context['total'], 2)
+
+		# Учитель без школы не видит сообщений - и итог нулевой
+		self.client.force_login(User.objects.create_user('no_school', password='pw', role=User.TEACHER))
+		self.assertEqual(self.client.get('/staff/messages/').context['total'], 0)
+		self.assertEqual(self.client.get('/dashboard/').context['total'], 0)
+
+	def test_archive_search_toggle(self):
+		archive_messages(days=90, pause=0)
+		self.client.force_login(self.teacher)
+		hot = self.client.get('/staff/messages/?q=драка').context['messages']
+		self.assertEqual({m.id for m in hot}, {self.open.id, self.recent.id})
+		archived = self.client.get('/staff/messages/?archive=1&q=родители').context['messages']
+		self.assertEqual([m.id for m in archived], [self.resolved.id])
+
+		response = self.client.get(f'/staff/messages/{self.resolved.id}/')
+		self.assertRedirects(response, f'/staff/archive/{self.resolved.id}/')
+		self.assertContains(self.client.get(f'/staff/archive/{self.resolved.id}/'), 'Разговор с родителями')
+
+
+class BulkActionTests(TestCase):
+	"""Массовая смена статуса и общий комментарий одним UPDATE и одним INSERT"""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.school = School.objects.create(name='Школа', unique_code='bulk1')
+		cls.other_school = School.objects.create(name='Другая школа', unique_code='bulk2')
+		cls.own = [Message.objects.create(problem=f'Реклама {i}', help='', school=cls.school) for i in range(3)]
+		cls.foreign = Message.objects.create(problem='Реклама в другой школе', help='', school=cls.other_school)
+		cls.teacher = User.objects.create_user('bulk_teacher', password='pw', role=User.TEACHER, school=cls.school)
+		cls.ids = [m.id for m in cls.own] + [cls.foreign.id]
+
+	def test_single_update_scoped_by_role(self):
+		with CaptureQueriesContext(connection) as queries:
+			updated, commented = apply_bulk_action(self.teacher, self.ids, Message.STATUS_SPAM, 'Рассылка рекламы')
+		self.assertEqual((updated, commented), (3, 3))
+		sql = [query['sql'] for query in queries.captured_queries]
+		self.assertEqual(len([q for q in sql if q.startswith('UPDATE "dashboard_message"')]), 1)
+		self.assertEqual(len([q for q in sql if q.startswith('INSERT INTO "dashboard_internalcomment"')]), 1)
+
+		self.assertEqual(Message.objects.get(id=self.foreign.id).status, Message.STATUS_NEW)
+		self.assertEqual(Message.objects.filter(status=Message.STATUS_SPAM).count(), 3)
+		self.assertFalse(InternalComment.objects.filter(message=self.foreign).exists())
+		self.assertEqual(rebuild_counters(), 0)
+		self.assertEqual(set(search_messages(Message.objects.all(), 'рассылка').values_list('id', flat=True)), {m.id for m in self.own})
+
+	def test_parse_ids(self):
+		self.assertEqual(parse_message_ids(['3', '1-2', 'x', '2']), [1, 2, 3])
+		with self.assertRaises(ValueError):
+			parse_message_ids(['1-100000'])
+
+	def test_staff_list_form(self):
+		self.client.force_login(self.teacher)
+		response = self.client.post('/staff/messages/bulk/', {
+			'message_ids': self.ids, 'action': 'spam', 'next': '/staff/messages/?status=new',
+		})
+		self.assertRedirects(response, '/staff/messages/?status=new')
+		self.assertEqual(Message.objects.filter(status=Message.STATUS_SPAM).count(), 3)
+		self.assertEqual(Message.objects.get(id=self.foreign.id).status, Message.STATUS_NEW)
+		response = self.client.post('/staff/messages/bulk/', {'message_ids': self.ids, 'next': 'https://example.com/'})
+		self.assertRedirects(response, '/staff/messages/')
+
+
+class DuplicateDetectionTests(TestCase):
+	"""Почти одинаковые сообщения связываются только внутри одной школы"""
+
+	TEXT = 'В нашем классе старшеклассники каждый день отбирают деньги на обед у младших'
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.school = School.objects.create(name='Школа', unique_code='dup1')
+		cls.other_school = School.objects.create(name='Другая школа', unique_code='dup2')
+
+	def _send(self, text, school):
+		message = Message.objects.create(problem=text, help='', school=school)
+		register_message(message)
+		return message
+
+	def test_same_school_duplicate(self):
+		original = self._send(self.TEXT, self.school)
+		duplicate = self._send(self.TEXT + '!!', self.school)
+		self.assertEqual(duplicate.duplicate_of_id, original.id)
+		self.assertIsNone(self._send('Совсем другой текст про учителя физкультуры и оценки', self.school).duplicate_of_id)
+
+	def test_other_school_is_not_duplicate(self):
+		self._send(self.TEXT, self.school)
+		self.assertIsNone(self._send(self.TEXT, self.other_school).duplicate_of_id)
+		# Общие сообщения (без школы) - отдельная группа
+		general = self._send(self.TEXT, None)
+		self.assertIsNone(general.duplicate_of_id)
+		self.assertEqual(self._send(self.TEXT, None).duplicate_of_id, general.id)
+
+	def test_signature(self):
+		self.assertIsNone(compute_signature('помогите'))
+		self.assertEqual(compute_signature(self.TEXT), compute_signature(self.TEXT.upper() + ' !!!'))
+		self.assertNotEqual(compute_signature(self.TEXT), compute_signature('Совсем другой текст про учителя физкультуры'))
+
+	def test_only_originals_are_indexed_within_window(self):
+		old = Message.objects.create(problem=self.TEXT, help='', school=self.school)
+		Message.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=DUPLICATE_WINDOW_DAYS + 1))
+		old.refresh_from_db()
+		register_message(old)
+		# Исходное сообщение вне окна: новое сообщение само становится исходным
+		fresh = self._send(self.TEXT, self.school)
+		self.assertIsNone(fresh.duplicate_of_id)
+		duplicate = self._send(self.TEXT, self.school)
+		self.assertEqual(duplicate.duplicate_of_id, fresh.id)
+		self.assertFalse(MessageSignatureBand.objects.filter(message=duplicate).exists())
+
+	def test_archive_command_prunes_old_bands(self):
+		old = Message.objects.create(problem=self.TEXT, help='', school=self.school)
+		Message.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=DUPLICATE_WINDOW_DAYS + 1))
+		old.refresh_from_db()
+		register_message(old)
+		fresh = self._send('Совсем другой текст про учителя физкультуры и оценки', self.school)
+
+		self.assertEqual(prune_signature_bands(batch_size=5), BANDS)
+		self.assertFalse(MessageSignatureBand.objects.filter(message=old).exists())
+		self.assertEqual(MessageSignatureBand.objects.filter(message=fresh).count(), BANDS)
+		# Периодический запуск archive_messages удаляет полосы старше окна
+		register_message(old)
+		call_command('archive_messages', '--pause', '0', stdout=io.StringIO())
+		self.assertEqual(set(MessageSignatureBand.objects.values_list('message_id', flat=True)), {fresh.id})
+
+	def test_index_existing_messages(self):
+		first = Message.objects.create(problem=self.TEXT, help='', school=self.school)
+		second = Message.objects.create(problem=self.TEXT, help='', school=self.school)
+		call_command('index_duplicates', stdout=io.StringIO())
+		second.refresh_from_db()
+		self.assertEqual(second.duplicate_of_id, first.id)
+		self.assertTrue(MessageSignatureBand.objects.filter(message=first).exists())
+
+
+class MessageCounterTests(TestCase):
+	"""Счетчики MessageCounter совпадают с COUNT по таблице сообщений"""
+
+	def setUp(self):
+		self.school = School.objects.create(name='Школа', unique_code='cnt1')
+
+	def counters(self):
+		return dict(
+			((school_id, status), count)
+			for school_id, status, count in MessageCounter.objects.filter(count__gt=0).values_list('school_id', 'status', 'count')
+		)
+
+	def test_signals_follow_save_and_delete(self):
+		message = Message.objects.create(problem='Текст', help='', school=self.school)
+		Message.objects.create(problem='Текст', help='', school=self.school)
+		message.status = Message.STATUS_RESOLVED
+		message.save()
+		self.assertEqual(self.counters(), {(self.school.id, Message.STATUS_NEW): 1, (self.school.id, Message.STATUS_RESOLVED): 1})
+		message.delete()
+		self.assertEqual(self.counters(), {(self.school.id, Message.STATUS_NEW): 1})
+		self.assertEqual(count_messages(school=self.school, status=Message.STATUS_NEW), 1)
+		self.assertEqual(rebuild_counters(), 0)
+
+	def test_update_status_and_school_delete(self):
+		for _ in range(3):
+			Message.objects.create(problem='Текст', help='', school=self.school)
+		Message.objects.create(problem='Текст', help='')
+		self.assertEqual(update_status(Message.objects.filter(school=self.school), Message.STATUS_SPAM), 3)
+		self.assertEqual(self.counters(), {(self.school.id, Message.STATUS_SPAM): 3, (None, Message.STATUS_NEW): 1})
+
+		# Сообщения удаленной школы становятся общими (school = NULL)
+		self.school.delete()
+		self.assertEqual(self.counters(), {(None, Message.STATUS_SPAM): 3, (None, Message.STATUS_NEW): 1})
+		self.assertEqual(rebuild_counters(), 0)
+
+	def test_rebuild_fixes_drift(self):
+		Message.objects.create(problem='Текст', help='', school=self.school)
+		MessageCounter.objects.update(count=10)
+		Message.objects.filter(school=self.school).update(status=Message.STATUS_RESOLVED)
+		self.assertEqual(rebuild_counters(), 2)
+		self.assertEqual(self.counters(), {(self.school.id, Message.STATUS_RESOLVED): 1})
@@ -1,16 +1,22 @@
 
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib.messages import get_messages
 from .models import Message, InternalComment
 from core.models import User
+from .search import search_messages
+from core.db_router import replica_view
+from core.pagination import paginate_keyset
+from core.stats import count_messages
 
 def is_admin(user):
 	return user.is_authenticated and user.role in ['super_admin', 'rayon_otdel', 'teacher']
 
 @login_required
 @user_passes_test(is_admin)
+@replica_view
 def dashboard(request):
-	messages = Message.objects.select_related('school').order_by('-created_at')
+	messages = Message.objects.select_related('school')
 	
 	# Фильтрация по ролям
 	if request.user.role == 'teacher':
@@ -25,15 +31,36 @@ def dashboard(request):
 	school_filter = request.GET.get('school')
 	problem_type = request.GET.get('problem_type')
 	status = request.GET.get('status')
+	search_query = request.GET.get('q', '').strip()
 	
 	if school_filter:
 		messages = messages.filter(school__name__icontains=school_filter)
+	if search_query:
+		messages = search_messages(
+			messages, search_query, school_id=request.user.school_id if request.user.role == 'teacher' else None
+		)
 	if problem_type:
 		messages = messages.filter(problem_type=problem_type)
 	if status:
 		messages = messages.filter(status=status)
 	
-	return render(request, 'dashboard/dashboard.html', {'messages': messages})
+	# Приблизительный итог списка из счетчиков (без архива); поиск по тексту и названию школы ими не покрывается
+	total = None
+	if not school_filter and not search_query:
+		if request.user.role == 'teacher':
+			# Учитель без школы не видит сообщений, как и в scoped_messages
+			total = count_messages(request.user.school_id, status, problem_type) if request.user.school_id else 0
+		else:
+			total = count_messages(None, status, problem_type)
+	
+	return render(request, 'dashboard/dashboard.html', {
+		'messages': paginate_keyset(request, messages),
+		# Итоги массовых действий (форма отправляется в core.admin_views.admin_messages_bulk)
+		'notices': get_messages(request),
+		'total': total,
+		'problem_type_choices': Message.PROBLEM_TYPE_CHOICES,
+		'status_choices': Message.STATUS_CHOICES,
+	})
 
 @login_required
 @user_passes_test(is_admin)
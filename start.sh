@@ -48,6 +48,7 @@ VENV_DIR="venv"
 ENV_FILE=".env.dev"
 DJANGO_PORT=8000
 TELEGRAM_PID=""
+NOTIFIER_PID=""
 DJANGO_PID=""
 
 # Функция для очистки при завершении
@@ -59,6 +60,11 @@ cleanup() {
         kill $TELEGRAM_PID 2>/dev/null || true
     fi
     
+    if [ ! -z "$NOTIFIER_PID" ]; then
+        print_telegram "Остановка рассылки уведомлений (PID: $NOTIFIER_PID)..."
+        kill $NOTIFIER_PID 2>/dev/null || true
+    fi
+    
     if [ ! -z "$DJANGO_PID" ]; then
         print_django "Остановка Django сервера (PID: $DJANGO_PID)..."
         kill $DJANGO_PID 2>/dev/null || true
@@ -231,6 +237,11 @@ start_telegram_bot() {
     python manage.py telegram_polling &
     TELEGRAM_PID=$!
     print_success "Telegram бот запущен (PID: $TELEGRAM_PID)"
+    
+    print_telegram "Запуск рассылки уведомлений..."
+    python manage.py run_notifier &
+    NOTIFIER_PID=$!
+    print_success "Рассылка уведомлений запущена (PID: $NOTIFIER_PID)"
 }
 
 # Функция мониторинга логов